@@ -2,6 +2,16 @@ from flask import Flask
 from flask_login import LoginManager
 from .config import Config
 from .db import DB
+from .instrumentation import QueryInstrumentation
+from .metrics import Metrics
+from .http_cache import HttpCache
+from .models.cache import ReferenceCache, card_cache
+from .fragments import inventory_card
+from .images import image_url, immutable_static_files, images_cli
+from .image_worker import ImageWorker
+from .cart_state import CartState
+from .recommendations import recommendations_cli
+from .recommendation_panel import RecommendationPanel
 
 
 login = LoginManager()
@@ -13,8 +23,28 @@ def create_app():
     app.config.from_object(Config)
 
     app.db = DB(app)
+    if app.config['SQL_INSTRUMENTATION']:
+        QueryInstrumentation(app)
+    if app.config['METRICS_ENABLED']:
+        Metrics(app)
+    if app.config['HTTP_CACHE_ENABLED']:
+        HttpCache(app)
+    ImageWorker(app)
+    if app.config['CART_STATE_ENABLED']:
+        CartState(app)
+    RecommendationPanel(app)
+    ReferenceCache.configure_all(app.config['REFERENCE_CACHE_TTL'], app.config['REFERENCE_CACHE_SIZE'])
+    card_cache.configure(app.config['FRAGMENT_CACHE_TTL'], app.config['FRAGMENT_CACHE_SIZE'])
+    app.jinja_env.globals['inventory_card'] = inventory_card
+    app.jinja_env.filters['image_url'] = image_url
+    app.after_request(immutable_static_files)
     login.init_app(app)
 
+    from .migrations import migrate_cli
+    app.cli.add_command(migrate_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(recommendations_cli)
+
     from .index import bp as index_bp
     app.register_blueprint(index_bp)
 
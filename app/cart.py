@@ -1,17 +1,15 @@
 import base64
-from flask import render_template, redirect, url_for, flash, request, abort, jsonify
+from flask import render_template, redirect, url_for, flash, request, abort, jsonify, make_response, current_app
 from flask_login import current_user, login_required
 from .models.inventory import Inventory
 from .models.user import User
 from .models.order import Order
 from .models.cart import Cart
-from .models.recommendation import Recommendation
+from .models.copurchase import Copurchase
+from .models.checkout import Checkout, CheckoutError
+from .metrics import record_checkout, record_recommendation_panel
 import logging
 from decimal import Decimal
-from .inventory import get_inventories_details
-from .inventory import get_inventories_details
-from .index import get_all_products_details, get_all_inventories_details
-from .models.category import Category
 
 from flask import Blueprint
 bp = Blueprint('cart', __name__)
@@ -28,33 +26,29 @@ def authenticated_user_cart():
     return cart
 
 
-def check_authentication(recommend=False):
+def check_authentication():
     """
     Check whether the user is authenticated or not. Display cart information
     """
-    recommendation = None
     if current_user.is_authenticated:
         cart = authenticated_user_cart()
-        if recommend:
-            recommendation = Recommendation.recommend_products_based_on_history_and_reviews(current_user.id)
     else:
         cart = Cart.register()
-    return cart, recommendation
+    return cart
 
 
-def cart_summary(cart_details):
+def cart_summary(cid):
     """
     Get Cart summary information including quantity and price
     """
-    total_price = 0
-    total_items = 0
+    return Cart.summary(cid)
 
-    # Calculate total price using a for loop
-    for item in cart_details:
-        total_price += Decimal(item['price']) * item['quantity']
-        total_items += item['quantity']
-        
-    return total_price, total_items
+
+def bought_together(cart_details):
+    """
+    Get the inventories frequently bought together with the cart items
+    """
+    return Copurchase.for_cart([item['invid'] for item in cart_details or []])
 
 
 @bp.route('/cart')
@@ -63,13 +57,34 @@ def cart():
     Main cart view that displays cart product
     """
     total_price, total_items = None, None
-    cart, recommendation = check_authentication(True)
+    cart = check_authentication()
     cid = cart.id
-    cart_details = Inventory.get_cart_products(cid)
+    cart_details = Cart.get_products(cid)
     if cart_details:
-        total_price, total_items = cart_summary(cart_details)
+        total_price, total_items = cart_summary(cid)
 
-    return render_template('cart.html', cart_details=cart_details, recommendation=recommendation, total_price=total_price, total_items=total_items)
+    return render_template('cart.html', cart_details=cart_details, bought_together=bought_together(cart_details), total_price=total_price, total_items=total_items)
+
+
+@bp.route('/cart/recommendations')
+@login_required
+def recommendations_panel():
+    """
+    Recommendation panel of the cart page, fetched by the page once the cart is shown.
+    Answered within RECOMMENDATION_PANEL_TIMEOUT_MS: a slow recommender yields a stale
+    or empty panel (see RecommendationPanel)
+    """
+    panel = current_app.extensions['recommendation_panel']
+    recommendation, outcome = panel.get(current_user.id)
+    record_recommendation_panel(outcome)
+    if recommendation:
+        # The cached recommendations may predate the latest cart changes
+        in_cart = {item['invid'] for item in Cart.get_products(get_cart_id()) or []}
+        recommendation = [item for item in recommendation if item['inventory_id'] not in in_cart]
+    response = make_response(render_template('_recommendations.html', recommendation=recommendation))
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
 
 
 """
@@ -84,19 +99,16 @@ def add_product_to_cart():
     try:
         cid = get_cart_id()
         item = Inventory.getById(invid)
-        all_products = get_inventories_details('product', filter_value=invid)
 
+        # Redirect back instead of rendering the page again (pages with JavaScript use the JSON API below)
         if item and originalId and Cart.add_to_cart(cid, item.id, item.price):
-            details = get_inventories_details('inventory_id', filter_value=originalId)
             flash('Item added to cart!')
-            return render_template("seller_product_detail.html", details=details[0], all_products=all_products)
+            return redirect(url_for('inventory.seller_product_detail', invid=originalId))
         elif item and recommend_add and Cart.add_to_cart(cid, item.id, item.price):
             return redirect(url_for('cart.cart'))
         elif item and Cart.add_to_cart(cid, item.id, item.price):
-            products_details = get_all_products_details()
-            inventory_details = get_all_inventories_details()
             flash('Item added to cart!')
-            return render_template('index.html', products_details=products_details, inventory_details=inventory_details, top_products=None, categories = Category.getExistCategories())
+            return redirect(url_for('index.index'))
         else:
             return jsonify({'error': 'Not Enough Inventories'}), 400
     except Exception as e:
@@ -106,7 +118,7 @@ def add_product_to_cart():
 
 @bp.route('/delete_item', methods=['POST'])
 def delete_item_from_cart():
-    cart, recommendation = check_authentication(True)
+    cart = check_authentication()
     cid = cart.id
     invid = request.form.get('invid')
     save_page = request.form.get('save_for_later', False)
@@ -116,10 +128,10 @@ def delete_item_from_cart():
         return redirect(url_for('cart.save_for_later'))
     elif Cart.remove_product_by_invid(cid, invid):
         # Item successfully removed from save_for_later page
-        cart_details = Inventory.get_cart_products(cid)
+        cart_details = Cart.get_products(cid)
         if cart_details:
-            total_price, total_items = cart_summary(cart_details)
-        return render_template('cart.html', cart_details=cart_details, recommendation=recommendation, total_price=total_price, total_items=total_items)
+            total_price, total_items = cart_summary(cid)
+        return render_template('cart.html', cart_details=cart_details, bought_together=bought_together(cart_details), total_price=total_price, total_items=total_items)
     
 
 """
@@ -128,9 +140,9 @@ Change products' status within the cart
 """
 @bp.route('/save_for_later')
 def save_for_later():
-    cart, recommendation = check_authentication(False)
+    cart = check_authentication()
     cid = cart.id
-    cart_details = Inventory.get_cart_products(cid, in_cart=False)
+    cart_details = Cart.get_products(cid, in_cart=False)
 
     return render_template('save_for_later.html', cart_details=cart_details)
 
@@ -138,24 +150,23 @@ def save_for_later():
 @bp.route('/save_product_for_later', methods=['POST'])
 def save_product_for_later():
     total_price, total_items = None, None
-    cart, recommendation = check_authentication(False)
+    cart = check_authentication()
     cid = cart.id
     invid = request.form.get('invid')
     if Cart.save_product_for_later(cid, invid):
-        cart_details = Inventory.get_cart_products(cid)
-        recommendation = Recommendation.recommend_products_based_on_history_and_reviews(current_user.id)
+        cart_details = Cart.get_products(cid)
         if cart_details:
-            total_price, total_items = cart_summary(cart_details)
-        return render_template('cart.html', cart_details=cart_details, recommendation=recommendation, total_price=total_price, total_items=total_items)
+            total_price, total_items = cart_summary(cid)
+        return render_template('cart.html', cart_details=cart_details, bought_together=bought_together(cart_details), total_price=total_price, total_items=total_items)
  
     
 @bp.route('/move_product_to_cart', methods=['POST'])
 def move_product_to_cart():
-    cart, recommendation = check_authentication(False)
+    cart = check_authentication()
     cid = cart.id
     invid = request.form.get('invid')
     if Cart.move_product_to_cart(cid, invid):
-        cart_details = Inventory.get_cart_products(cid, in_cart=False)
+        cart_details = Cart.get_products(cid, in_cart=False)
         return render_template('save_for_later.html', cart_details=cart_details)
 
 
@@ -165,22 +176,22 @@ def update_quantity():
     Update cart product quantity
     """
     total_price, total_items = None, None
-    cart, recommendation = check_authentication(True)
+    cart = check_authentication()
     cid = cart.id
     invid = request.form.get('invid')
     quantity = request.form.get('quantity')
 
     if int(quantity) > 0:
         if Cart.edit_quantity_by_invid(cid, invid, int(quantity)):
-            cart_details = Inventory.get_cart_products(cid)
+            cart_details = Cart.get_products(cid)
             if cart_details:
-                total_price, total_items = cart_summary(cart_details)
-            return render_template('cart.html', cart_details=cart_details, error=False, recommendation=recommendation, total_price=total_price, total_items=total_items)
+                total_price, total_items = cart_summary(cid)
+            return render_template('cart.html', cart_details=cart_details, bought_together=bought_together(cart_details), error=False, total_price=total_price, total_items=total_items)
         else:
-            cart_details = Inventory.get_cart_products(cid)
+            cart_details = Cart.get_products(cid)
             if cart_details:
-                total_price, total_items = cart_summary(cart_details)
-            return render_template('cart.html', cart_details=cart_details, error=True, recommendation=recommendation, total_price=total_price, total_items=total_items)
+                total_price, total_items = cart_summary(cid)
+            return render_template('cart.html', cart_details=cart_details, bought_together=bought_together(cart_details), error=True, total_price=total_price, total_items=total_items)
 
 
 @login_required
@@ -204,10 +215,10 @@ def checkout_summary():
     """
     total_price, total_items = None, None
     cart = authenticated_user_cart()
-    cart_details = Inventory.get_cart_products(cart.id, in_cart=True)
+    cart_details = Cart.get_products(cart.id, in_cart=True)
 
     if cart_details:
-        total_price, total_items = cart_summary(cart_details)
+        total_price, total_items = cart_summary(cart.id)
 
     return render_template('checkout.html', cart_details=cart_details, total_price=total_price, total_items=total_items)
 
@@ -216,63 +227,121 @@ def checkout_summary():
 @login_required
 def process_checkout():
     """
-    Process checkout: Update buyer/seller balance and inventory
+    Process checkout: Update buyer/seller balance and inventory.
+    The order, stock decrements and balance transfers are applied atomically in one transaction.
     """
-    # buyer's balance
-    user = User.get(current_user.id)
-    user_balance = user.balance
-    
-    # cart_products
     cart = authenticated_user_cart()
-    cart_items = Inventory.get_cart_products(cart.id)
-    if not cart_items:
-        error_msg = "Your cart is empty."
-        return render_template('error_msg.html', msg=error_msg)
-    total_price = sum(item['quantity'] * item['price'] for item in cart_items)
-    
-    # Create new order, Decrease buyer balance & Increase seller balance
-    if user_balance >= total_price:
-        try:
-            # Create a new order
-            oid = Order.add_new_order(user.id)
-            if oid is None: 
-                raise Exception("Failed to create order")
-            
-            # Add cart_products to order_products
-            for item in cart_items:
-                # Add to order_products
-                Order.add_to_order(oid, item['invid'], item['price'], item['quantity'])
-                
-                # Decrease seller's inventory quantity
-                quantity = Inventory.getById(item['invid']).current_quantity
-                if quantity < item['quantity']:
-                    raise Exception("Failed to create order")
-                new_quantity = quantity - item['quantity']
-                Inventory.updateQuantity(item['invid'], new_quantity)
-                
-                # Increase seller balance
-                seller_account = User.get_seller_account(item['sid'])
-                new_seller_balance = item['quantity'] * item['price'] + seller_account.balance
-                User.update_balance(seller_account.id, new_seller_balance)
-                
-            # Decrease buyer balance
-            new_buyer_balance = user_balance - total_price
-            User.update_balance(user.id, new_buyer_balance)
-
-            return redirect(url_for('cart.thank_you'))
-        except Exception as e:
-            return render_template('error_msg.html', msg=e) 
-            
-    else:
-        error_msg = "Not enough balance."
-        return render_template('error_msg.html', msg=error_msg)
+    try:
+        Checkout.process(current_user.id, cart.id)
+    except CheckoutError as e:
+        record_checkout(e.reason)
+        return render_template('error_msg.html', msg=str(e))
+    except Exception as e:
+        logging.error(f"Failed to process checkout: {str(e)}")
+        record_checkout('error')
+        return render_template('error_msg.html', msg="Failed to create order")
+
+    record_checkout('success')
+    return redirect(url_for('cart.thank_you'))
 
 
 @bp.route('/thank_you')
 @login_required
 def thank_you():
     """
-    Display thank you note
+    Display thank you note (the purchased items were already removed from the cart at checkout)
+    """
+    return render_template('thank_you.html')
+
+
+"""
+JSON cart API, used by static/js/cart.js to update cart forms in place.
+Requests carry a JSON body (which cross-site forms cannot send); responses
+hold only the changed line and the new totals.
+"""
+def api_request_invid():
+    """
+    Get (invid, body) of a cart API request; invid is None if the body is not a JSON object with one
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None, {}
+    try:
+        return int(data.get('invid')), data
+    except (TypeError, ValueError):
+        return None, data
+
+
+def cart_delta(cid, invid, message=None):
+    """
+    Build the API response: the line of invid (None once removed) and the cart totals
     """
-    Cart.delete_cart_items(current_user.id)
-    return render_template('thank_you.html')
\ No newline at end of file
+    total_price, total_items = cart_summary(cid)
+    return jsonify({'line': Cart.get_line(cid, invid),
+                    'totals': {'total_price': total_price or Decimal(0), 'total_items': total_items or 0},
+                    'message': message})
+
+
+@bp.route('/api/cart/add', methods=['POST'])
+@login_required
+def api_add_to_cart():
+    invid, _ = api_request_invid()
+    item = Inventory.getById(invid) if invid is not None else None
+    if item is None:
+        return jsonify({'error': 'No such inventory'}), 400
+    cid = authenticated_user_cart().id
+    if not Cart.add_to_cart(cid, item.id, item.price):
+        return jsonify({'error': 'Not Enough Inventories'}), 409
+    return cart_delta(cid, item.id, 'Item added to cart!')
+
+
+@bp.route('/api/cart/update', methods=['POST'])
+@login_required
+def api_update_quantity():
+    invid, data = api_request_invid()
+    try:
+        quantity = int(data.get('quantity'))
+    except (TypeError, ValueError):
+        quantity = 0
+    if invid is None or quantity < 1:
+        return jsonify({'error': 'Invalid quantity'}), 400
+    cid = authenticated_user_cart().id
+    if not Cart.edit_quantity_by_invid(cid, invid, quantity):
+        return jsonify({'error': 'Not enough inventory or invalid quantity.'}), 409
+    return cart_delta(cid, invid)
+
+
+@bp.route('/api/cart/remove', methods=['POST'])
+@login_required
+def api_remove_item():
+    invid, _ = api_request_invid()
+    if invid is None:
+        return jsonify({'error': 'No such inventory'}), 400
+    cid = authenticated_user_cart().id
+    if not Cart.remove_product_by_invid(cid, invid):
+        return jsonify({'error': 'Internal Server Error'}), 500
+    return cart_delta(cid, invid)
+
+
+@bp.route('/api/cart/save_for_later', methods=['POST'])
+@login_required
+def api_save_for_later():
+    invid, _ = api_request_invid()
+    if invid is None:
+        return jsonify({'error': 'No such inventory'}), 400
+    cid = authenticated_user_cart().id
+    if not Cart.save_product_for_later(cid, invid):
+        return jsonify({'error': 'Internal Server Error'}), 500
+    return cart_delta(cid, invid)
+
+
+@bp.route('/api/cart/move_to_cart', methods=['POST'])
+@login_required
+def api_move_to_cart():
+    invid, _ = api_request_invid()
+    if invid is None:
+        return jsonify({'error': 'No such inventory'}), 400
+    cid = authenticated_user_cart().id
+    if not Cart.move_product_to_cart(cid, invid):
+        return jsonify({'error': 'Internal Server Error'}), 500
+    return cart_delta(cid, invid)
@@ -0,0 +1,306 @@
+import abc
+import atexit
+import importlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+
+logger = logging.getLogger('app.cart')
+
+
+class CartStore(abc.ABC):
+    """Keyed store of cart states: {cid: state dict}, with a dirty flag per cart.
+
+    A state is a JSON-serializable dict (see CartState). Subclass this to
+    plug in an external store shared by several hosts (e.g. Redis) and set
+    CART_STATE_BACKEND to 'package.module:ClassName'; the class is built with
+    the app config when the app starts, so a backend that is not a CartStore
+    or lacks one of the methods below fails right away.
+    """
+    @abc.abstractmethod
+    def get(self, cid):
+        """Return the state of cart cid, or None if it is not in the store."""
+
+    @abc.abstractmethod
+    def update(self, cid, change, load, dirty=True):
+        """Atomically apply change(state) to the state of cart cid (loaded with load() when
+        the cart is not in the store), mark it dirty unless dirty is False, and return a
+        copy of the new state. load() queries the database: call it outside any lock of the
+        store, and drop its result if the cart was stored in the meantime."""
+
+    @abc.abstractmethod
+    def mark_clean(self, cid, version):
+        """Clear the dirty flag of cart cid if its state is still at version (it was written back)."""
+
+    @abc.abstractmethod
+    def is_dirty(self, cid):
+        """Return True if cart cid has changes not written back yet (a single-key lookup)."""
+
+    @abc.abstractmethod
+    def dirty(self):
+        """Return the IDs of the carts with changes not written back yet."""
+
+    @abc.abstractmethod
+    def discard(self, cid):
+        """Drop cart cid from the store (the next access reloads it from the database)."""
+
+    @abc.abstractmethod
+    def prune(self, idle_seconds):
+        """Drop the clean carts not accessed for idle_seconds."""
+
+
+class MemoryCartStore(CartStore):
+    """Process-local store. Only correct when a single process serves the app
+    (e.g. `flask run`): other processes would not see its carts."""
+    def __init__(self, config):
+        self._states = {}
+        self._dirty = set()
+        self._touched = {}
+        self._lock = threading.Lock()
+
+    def get(self, cid):
+        with self._lock:
+            state = self._states.get(cid)
+            self._touched[cid] = time.monotonic()
+            return json.loads(json.dumps(state)) if state is not None else None
+
+    def update(self, cid, change, load, dirty=True):
+        loaded = None
+        while True:
+            with self._lock:
+                state = self._states.get(cid)
+                if state is not None or loaded is not None:
+                    # Change a copy, so that a change raising halfway leaves the stored state intact
+                    state = json.loads(json.dumps(state)) if state is not None else loaded
+                    change(state)
+                    self._states[cid] = state
+                    if dirty:
+                        self._dirty.add(cid)
+                    self._touched[cid] = time.monotonic()
+                    return json.loads(json.dumps(state))
+            # load() queries the database: never hold the lock of every cart during it
+            loaded = load()
+
+    def mark_clean(self, cid, version):
+        with self._lock:
+            state = self._states.get(cid)
+            if state is not None and state['version'] == version:
+                self._dirty.discard(cid)
+
+    def is_dirty(self, cid):
+        with self._lock:
+            return cid in self._dirty
+
+    def dirty(self):
+        with self._lock:
+            return list(self._dirty)
+
+    def discard(self, cid):
+        with self._lock:
+            self._states.pop(cid, None)
+            self._dirty.discard(cid)
+            self._touched.pop(cid, None)
+
+    def prune(self, idle_seconds):
+        cutoff = time.monotonic() - idle_seconds
+        with self._lock:
+            for cid in [cid for cid, touched in self._touched.items() if touched < cutoff and cid not in self._dirty]:
+                self._states.pop(cid, None)
+                del self._touched[cid]
+
+
+class SqliteCartStore(CartStore):
+    """Store in a local SQLite file (CART_STATE_PATH) shared by every process of the host.
+    Updates run in BEGIN IMMEDIATE transactions, so concurrent requests on the same
+    cart are serialized; WAL mode keeps reads and writes well under a millisecond."""
+    def __init__(self, config):
+        self.path = config['CART_STATE_PATH']
+        self._local = threading.local()
+        self._connection().execute('''
+            CREATE TABLE IF NOT EXISTS cart_state (
+                cid INTEGER PRIMARY KEY,
+                state TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                dirty INTEGER NOT NULL,
+                touched REAL NOT NULL
+            )''')
+        # Keeps the write-behind pass from scanning every clean cart of the host
+        self._connection().execute('CREATE INDEX IF NOT EXISTS cart_state_dirty ON cart_state (cid) WHERE dirty = 1')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def get(self, cid):
+        row = self._connection().execute('SELECT state FROM cart_state WHERE cid = ?', (cid,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, cid, change, load, dirty=True):
+        conn = self._connection()
+        loaded = None
+        while True:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT state FROM cart_state WHERE cid = ?', (cid,)).fetchone()
+                if row is not None or loaded is not None:
+                    state = json.loads(row[0]) if row is not None else loaded
+                    change(state)
+                    conn.execute('''
+                        INSERT INTO cart_state (cid, state, version, dirty, touched) VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (cid) DO UPDATE SET state = excluded.state, version = excluded.version,
+                            dirty = max(dirty, excluded.dirty), touched = excluded.touched
+                        ''', (cid, json.dumps(state), state['version'], int(dirty), time.time()))
+                    conn.execute('COMMIT')
+                    return state
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('ROLLBACK')
+            # load() queries the database: never hold the write lock of every cart on the host during it
+            loaded = load()
+
+    def mark_clean(self, cid, version):
+        self._connection().execute('UPDATE cart_state SET dirty = 0 WHERE cid = ? AND version = ?', (cid, version))
+
+    def is_dirty(self, cid):
+        return self._connection().execute('SELECT 1 FROM cart_state WHERE cid = ? AND dirty = 1',
+                                          (cid,)).fetchone() is not None
+
+    def dirty(self):
+        return [row[0] for row in self._connection().execute('SELECT cid FROM cart_state WHERE dirty = 1')]
+
+    def discard(self, cid):
+        self._connection().execute('DELETE FROM cart_state WHERE cid = ?', (cid,))
+
+    def prune(self, idle_seconds):
+        self._connection().execute('DELETE FROM cart_state WHERE dirty = 0 AND touched < ?',
+                                   (time.time() - idle_seconds,))
+
+
+class CartState:
+    """Cart contents kept in a fast keyed store, written back to Cart_Products behind the requests.
+
+    Each cart is one state: its lines (with the display columns of the cart
+    page, captured when the item is added), the in-cart totals, which every
+    change adjusts instead of recomputing, and a version. Cart changes only
+    touch the store (plus a primary key read of the stock when quantities
+    grow), and pages read the state instead of joining five tables.
+
+    A background thread writes dirty carts back to Cart_Products every
+    CART_WRITE_BEHIND_SECONDS (see Cart.flush()); checkout writes its cart
+    back and takes the purchased lines out of the state in its own
+    transaction, under the same cart row lock. Other readers of Cart_Products (the
+    recommendations) may lag by that delay.
+
+    CART_STATE_BACKEND selects the store: 'sqlite' (default, shared by the
+    processes of one host), 'memory' (a single process) or a CartStore
+    subclass as 'package.module:ClassName'. Enabled with CART_STATE_ENABLED
+    (off by default, since the built-in stores are local to one host).
+    """
+    BACKENDS = {'memory': MemoryCartStore, 'sqlite': SqliteCartStore}
+
+    def __init__(self, app):
+        self.app = app
+        backend = app.config['CART_STATE_BACKEND']
+        if backend in CartState.BACKENDS:
+            store_class = CartState.BACKENDS[backend]
+        else:
+            module, _, name = backend.partition(':')
+            store_class = getattr(importlib.import_module(module), name)
+            if not (isinstance(store_class, type) and issubclass(store_class, CartStore)):
+                raise TypeError(f'CART_STATE_BACKEND {backend!r} is not a CartStore subclass')
+        if not app.config['CART_STATE_PATH']:
+            app.config['CART_STATE_PATH'] = os.path.join(app.instance_path, 'cart_state.sqlite3')
+        self.store = store_class(app.config)
+        self.interval = app.config['CART_WRITE_BEHIND_SECONDS']
+        self.idle_seconds = app.config['CART_STATE_IDLE_SECONDS']
+        self._flusher = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush_all)
+        app.extensions['cart_state'] = self
+
+    def get(self, cid, load):
+        """Return the state of cart cid, loading it with load() (see new_state()) on a miss."""
+        state = self.store.get(cid)
+        if state is None:
+            state = self.store.update(cid, lambda state: None, load, dirty=False)
+        return state
+
+    def update(self, cid, change, load):
+        """Apply change(state) to cart cid and schedule the write-back; returns the new state.
+        change() may raise to leave the cart untouched."""
+        self._start()
+
+        def versioned(state):
+            change(state)
+            state['version'] += 1
+        return self.store.update(cid, versioned, load)
+
+    def _start(self):
+        """Start the write-behind thread in this process on the first change (not at import: after a fork)."""
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._run, name='cart-write-behind', daemon=True)
+                self._flusher.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush_all()
+            try:
+                self.store.prune(self.idle_seconds)
+            except Exception as e:
+                logger.warning('pruning cart states failed: %s', e)
+
+    def flush_all(self):
+        """Write back every dirty cart (write-behind thread and process exit)."""
+        from .models.cart import Cart
+        with self.app.app_context():
+            for cid in self.store.dirty():
+                try:
+                    Cart.flush(cid)
+                except Exception as e:
+                    logger.warning('writing back cart %s failed: %s', cid, e)
+
+
+def new_state(lines):
+    """Build a cart state from its lines.
+    Args:
+        lines (list[dict]): {'invid', 'sid', 'name', 'description', 'quantity', 'price', 'in_cart'}.
+    """
+    state = {'version': 0, 'lines': {}, 'total_items': 0, 'total_price': '0'}
+    for line in lines:
+        put_line(state, dict(line, price=str(line['price'])))
+    return state
+
+
+def put_line(state, line):
+    """Add or replace the line of line['invid'], adjusting the totals."""
+    drop_line(state, line['invid'])
+    state['lines'][str(line['invid'])] = line
+    _count(state, line, 1)
+
+
+def drop_line(state, invid):
+    """Remove the line of invid if any, adjusting the totals; returns the removed line."""
+    line = state['lines'].pop(str(invid), None)
+    if line is not None:
+        _count(state, line, -1)
+    return line
+
+
+def _count(state, line, sign):
+    if line['in_cart']:
+        state['total_items'] += sign * line['quantity']
+        state['total_price'] = str(Decimal(state['total_price']) + sign * line['quantity'] * Decimal(line['price']))
@@ -11,3 +11,78 @@ class Config(object):
                 os.environ.get('DB_PORT'),
                 os.environ.get('DB_NAME'))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool and transaction settings for the engine in db.py
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))  # 0 = no timeout
+    DB_ISOLATION_LEVEL = os.environ.get('DB_ISOLATION_LEVEL', 'SERIALIZABLE')
+    DB_READ_ISOLATION_LEVEL = os.environ.get('DB_READ_ISOLATION_LEVEL', 'READ COMMITTED')
+    # Stock reservations (and checkout, which is built on them) only use conditional
+    # writes, so they can run at READ COMMITTED instead of aborting on hot inventories
+    DB_RESERVATION_ISOLATION_LEVEL = os.environ.get('DB_RESERVATION_ISOLATION_LEVEL', 'READ COMMITTED')
+    # Attempts for transactions that are retried on serialization failures (e.g. checkout)
+    DB_MAX_TRANSACTION_ATTEMPTS = int(os.environ.get('DB_MAX_TRANSACTION_ATTEMPTS', 3))
+    # Versioned schema migrations applied by `flask migrate apply`
+    MIGRATIONS_DIR = os.environ.get('MIGRATIONS_DIR',
+                                    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db', 'migrations'))
+    # Number of inventory cards per page on the catalog and search result pages
+    CATALOG_PAGE_SIZE = int(os.environ.get('CATALOG_PAGE_SIZE', 24))
+    # Process-local cache for categories, sellers and images (seconds / entries per table; 0 disables)
+    REFERENCE_CACHE_TTL = int(os.environ.get('REFERENCE_CACHE_TTL', 300))
+    REFERENCE_CACHE_SIZE = int(os.environ.get('REFERENCE_CACHE_SIZE', 1024))
+    # Per-request SQL statistics (response headers and the 'app.sql' log, see instrumentation.py);
+    # off by default: a development aid, and the headers show backend query counts and timings to any client
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', 'false').lower() == 'true'
+    SQL_INSTRUMENTATION_HEADERS = os.environ.get('SQL_INSTRUMENTATION_HEADERS', 'false').lower() == 'true'
+    SQL_SLOWEST_COUNT = int(os.environ.get('SQL_SLOWEST_COUNT', 3))
+    # A statement executed more often than this within one request is reported as a likely N+1 loop
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 10))
+    # Prometheus metrics (see metrics.py); set METRICS_MULTIPROC_DIR when running several worker processes.
+    # METRICS_PATH only answers the comma-separated addresses / networks of METRICS_ALLOWED_IPS
+    # (as seen by the app: behind a proxy, the proxy's) and requests with 'Authorization: Bearer <METRICS_TOKEN>'
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'false').lower() == 'true'
+    METRICS_PATH = os.environ.get('METRICS_PATH', '/metrics')
+    METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1.0))
+    # Rendered catalog cards (see fragments.py), keyed by inventory and card version (seconds / entries; 0 disables)
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 3600))
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 10000))
+    # ETag / Last-Modified / 304 support for the catalog pages (see http_cache.py);
+    # HTTP_CACHE_RELEASE is mixed into every ETag, e.g. to invalidate them on a deployment
+    HTTP_CACHE_ENABLED = os.environ.get('HTTP_CACHE_ENABLED', 'true').lower() == 'true'
+    HTTP_CACHE_RELEASE = os.environ.get('HTTP_CACHE_RELEASE', '')
+    # Background processing of uploaded images (see image_worker.py): 'process', 'thread' or 'inline';
+    # uploads wait in IMAGE_SPOOL_DIR (default: <instance folder>/image_spool) until processed
+    IMAGE_WORKER_MODE = os.environ.get('IMAGE_WORKER_MODE', 'process')
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    IMAGE_SPOOL_DIR = os.environ.get('IMAGE_SPOOL_DIR')
+    # Cart page recommendations, precomputed by `flask recommendations refresh`:
+    # candidates stored per user, and recommendations shown
+    RECOMMENDATION_CANDIDATES = int(os.environ.get('RECOMMENDATION_CANDIDATES', 30))
+    RECOMMENDATION_LIMIT = int(os.environ.get('RECOMMENDATION_LIMIT', 10))
+    # Cart page recommendation panel, loaded after the page (see recommendation_panel.py): seconds a
+    # user's recommendations are reused, seconds longer an expired one may stand in for a slow or
+    # failing recommender, time budget (ms) of a request, recommender threads, and users cached
+    RECOMMENDATION_PANEL_TTL = int(os.environ.get('RECOMMENDATION_PANEL_TTL', 60))
+    RECOMMENDATION_PANEL_STALE_SECONDS = int(os.environ.get('RECOMMENDATION_PANEL_STALE_SECONDS', 3600))
+    RECOMMENDATION_PANEL_TIMEOUT_MS = int(os.environ.get('RECOMMENDATION_PANEL_TIMEOUT_MS', 300))
+    RECOMMENDATION_PANEL_WORKERS = int(os.environ.get('RECOMMENDATION_PANEL_WORKERS', 4))
+    RECOMMENDATION_PANEL_SIZE = int(os.environ.get('RECOMMENDATION_PANEL_SIZE', 10000))
+    # "Frequently bought together" index, updated by `flask recommendations copurchases`:
+    # neighbors kept per inventory, and age (seconds) an order must reach before it is counted
+    COPURCHASE_NEIGHBORS = int(os.environ.get('COPURCHASE_NEIGHBORS', 10))
+    COPURCHASE_SETTLE_SECONDS = int(os.environ.get('COPURCHASE_SETTLE_SECONDS', 60))
+    # Cart state store with write-behind to Cart_Products (see cart_state.py): 'sqlite', 'memory'
+    # or 'package.module:ClassName'; CART_STATE_PATH defaults to <instance folder>/cart_state.sqlite3.
+    # Off by default: the 'sqlite' and 'memory' stores are local to one host, so an app served by
+    # several hosts needs a shared store before turning it on
+    CART_STATE_ENABLED = os.environ.get('CART_STATE_ENABLED', 'false').lower() == 'true'
+    CART_STATE_BACKEND = os.environ.get('CART_STATE_BACKEND', 'sqlite')
+    CART_STATE_PATH = os.environ.get('CART_STATE_PATH')
+    CART_WRITE_BEHIND_SECONDS = float(os.environ.get('CART_WRITE_BEHIND_SECONDS', 1.0))
+    CART_STATE_IDLE_SECONDS = int(os.environ.get('CART_STATE_IDLE_SECONDS', 3600))
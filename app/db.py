@@ -1,4 +1,12 @@
+import random
+import time
+from contextlib import contextmanager
+from flask import g, has_app_context
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+
+# SQLSTATEs meaning "the transaction lost a race, run it again": serialization_failure, deadlock_detected
+RETRYABLE_SQLSTATES = ('40001', '40P01')
 
 
 class DB:
@@ -7,20 +15,55 @@ class DB:
     Use the execute() method if you want to execute a single SQL
     statement (which will be in a transaction by itself.
 
+    Use the read() method for plain SELECT statements that render a
+    page; it runs in a read-only transaction at the (cheaper) read
+    isolation level instead of the default SERIALIZABLE one.
+
+    Within a request (more precisely, an app context) all statements
+    share one pooled connection, checked out on first use and returned
+    when the context is torn down, so a page costs a single checkout.
+
     If you want to execute multiple SQL statements in the same
-    transaction, use the following pattern:
+    transaction, use the following pattern; model methods called inside
+    the block transparently join the transaction:
 
-    >>> with app.db.engine.begin() as conn:
+    >>> with app.db.transaction() as conn:
     >>>     # everything in this block executes as one transaction
-    >>>     value = conn.execute(text('SELECT...'), bar='foo').first()[0]
-    >>>     conn.execute(text('INSERT...'), par=value)
+    >>>     value = app.db.execute('SELECT...', bar='foo')[0][0]
+    >>>     Inventory.updateQuantity(invid, value)
     >>>     conn.execute(text('UPDATE...'), par=value)
     >>>
 
+    If any statement in the block fails, the whole transaction is
+    rolled back and the error is raised when the block exits, even if a
+    model method caught it. Work that must only start once the data is
+    visible to other connections (e.g. handing a row to a background
+    worker) is registered with after_commit().
+
+    Pool size, overflow, pre-ping, recycle, statement timeout and the
+    isolation levels (default, read and reservation) are configured
+    through the DB_* settings in Config.
     """
     def __init__(self, app):
+        connect_args = {}
+        if app.config['DB_STATEMENT_TIMEOUT_MS']:
+            connect_args['options'] = '-c statement_timeout={}'.format(app.config['DB_STATEMENT_TIMEOUT_MS'])
         self.engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'],
-                                    execution_options={"isolation_level": "SERIALIZABLE"})
+                                    pool_size=app.config['DB_POOL_SIZE'],
+                                    max_overflow=app.config['DB_MAX_OVERFLOW'],
+                                    pool_timeout=app.config['DB_POOL_TIMEOUT'],
+                                    pool_recycle=app.config['DB_POOL_RECYCLE'],
+                                    pool_pre_ping=app.config['DB_POOL_PRE_PING'],
+                                    connect_args=connect_args,
+                                    execution_options={"isolation_level": app.config['DB_ISOLATION_LEVEL']})
+        self.isolation_level = app.config['DB_ISOLATION_LEVEL']
+        self.read_isolation_level = app.config['DB_READ_ISOLATION_LEVEL']
+        self.reservation_isolation_level = app.config['DB_RESERVATION_ISOLATION_LEVEL']
+        # Callables receiving the seconds each pool checkout took (e.g. for metrics)
+        self.checkout_observers = []
+        # Callables receiving the connection right after each successful commit (e.g. data versions)
+        self.commit_observers = []
+        app.teardown_appcontext(self.close_connection)
 
     def execute(self, sqlstr, **kwargs):
         """Execute a single SQL statement sqlstr.
@@ -38,9 +81,144 @@ class DB:
         for additional details.  See models/*.py for examples of
         calling this function.
         """
-        with self.engine.begin() as conn:
-            result = conn.execute(text(sqlstr), kwargs)
-            if result.returns_rows:
-                return result.fetchall()
-            else:
-                return result.rowcount
+        return self._execute(sqlstr, kwargs, self.isolation_level, readonly=False)
+
+    def read(self, sqlstr, **kwargs):
+        """Execute a single read-only query sqlstr and return the list of result tuples.
+        The statement runs in a READ ONLY transaction at DB_READ_ISOLATION_LEVEL
+        (READ COMMITTED by default), so it never takes a serializable snapshot
+        and cannot fail with a serialization error.  Do not use it for reads
+        whose result is used to compute a subsequent write; use execute() or
+        an explicit transaction for those.
+        Parameters are passed exactly as for execute().
+        """
+        return self._execute(sqlstr, kwargs, self.read_isolation_level, readonly=True)
+
+    @contextmanager
+    def transaction(self, isolation_level=None):
+        """Run every execute()/read() issued inside the block as one transaction
+        on the request connection, committing when the block exits normally.
+        Nested blocks join the outermost transaction.
+        Yields the underlying sqlalchemy Connection.
+        """
+        unit = g.get('_db_unit') if has_app_context() else None
+        if unit is not None:
+            yield unit.conn
+            return
+        conn, owned = self._checkout()
+        conn.execution_options(isolation_level=isolation_level or self.isolation_level,
+                               postgresql_readonly=False)
+        unit = _UnitOfWork(conn)
+        if has_app_context():
+            g._db_unit = unit
+        try:
+            with conn.begin():
+                yield conn
+                if unit.error is not None:
+                    # A statement failed (and was possibly swallowed by a model method):
+                    # never commit a partial unit of work
+                    raise unit.error
+            if has_app_context():
+                g._db_unit = None
+            self._committed(conn)
+            for callback in unit.after_commit:
+                callback()
+        finally:
+            if has_app_context():
+                g._db_unit = None
+            if owned:
+                conn.close()
+
+    def run_in_transaction(self, work, max_attempts=3, isolation_level=None):
+        """Call work() inside transaction() and return its result, retrying the whole
+        transaction (up to max_attempts times, with a short jittered backoff) when it
+        fails with a serialization failure or deadlock.
+        Inside an enclosing transaction, work() simply joins it and is not retried.
+        """
+        if has_app_context() and g.get('_db_unit') is not None:
+            return work()
+        for attempt in range(1, max_attempts + 1):
+            try:
+                with self.transaction(isolation_level):
+                    return work()
+            except DBAPIError as e:
+                sqlstate = getattr(e.orig, 'pgcode', None)
+                if sqlstate not in RETRYABLE_SQLSTATES or attempt == max_attempts:
+                    raise
+                time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+
+    def after_commit(self, callback):
+        """Call callback() once the enclosing transaction() commits (it is dropped if the
+        transaction rolls back), or right away when no transaction is open, since every
+        execute() outside a transaction commits by itself.
+        """
+        unit = g.get('_db_unit') if has_app_context() else None
+        if unit is None:
+            callback()
+        else:
+            unit.after_commit.append(callback)
+
+    def close_connection(self, exception=None):
+        """Return the request connection to the pool (registered as an app context teardown)."""
+        conn = g.pop('_db_conn', None)
+        if conn is not None:
+            conn.close()
+
+    def _checkout(self):
+        """Return (connection, owned): the app-context connection, or a fresh one the caller must close."""
+        if not has_app_context():
+            return self._connect(), True
+        conn = g.get('_db_conn')
+        if conn is None or conn.closed or conn.invalidated:
+            conn = g._db_conn = self._connect()
+        return conn, False
+
+    def _committed(self, conn):
+        for observer in self.commit_observers:
+            observer(conn)
+
+    def _connect(self):
+        started = time.perf_counter()
+        conn = self.engine.connect()
+        for observer in self.checkout_observers:
+            observer(time.perf_counter() - started)
+        return conn
+
+    def _execute(self, sqlstr, params, isolation_level, readonly):
+        unit = g.get('_db_unit') if has_app_context() else None
+        if unit is not None:
+            return unit.run(sqlstr, params)
+        conn, owned = self._checkout()
+        try:
+            conn.execution_options(isolation_level=isolation_level, postgresql_readonly=readonly)
+            with conn.begin():
+                result = self._run(conn, sqlstr, params)
+            self._committed(conn)
+            return result
+        finally:
+            if owned:
+                conn.close()
+
+    @staticmethod
+    def _run(conn, sqlstr, params):
+        result = conn.execute(text(sqlstr), params)
+        if result.returns_rows:
+            return result.fetchall()
+        else:
+            return result.rowcount
+
+
+class _UnitOfWork:
+    """Transaction opened by DB.transaction(); remembers the first failed statement."""
+    def __init__(self, conn):
+        self.conn = conn
+        self.error = None
+        self.after_commit = []
+
+    def run(self, sqlstr, params):
+        try:
+            return DB._run(self.conn, sqlstr, params)
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+            raise
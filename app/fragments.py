@@ -0,0 +1,28 @@
+from flask import render_template
+from flask_login import current_user
+from markupsafe import Markup
+from .models.cache import card_cache
+
+
+def inventory_card(item, variant):
+    """Return the HTML of one inventory card of the catalog grid, rendering _inventory_card.html
+    only if this version of the card is not cached yet.
+
+    Cards are keyed by inventory ID and the version stamp loaded with the card
+    details (bumped by InventoryCard.bump() whenever what the card shows changes),
+    plus the few inputs that vary per request: the 'catalog' variant shows an
+    add-to-cart form to signed-in users, the 'search' variant shows the stock,
+    which checkouts change without bumping the version.
+    Args:
+        item (dict): Card details from Catalog ({'inventory', 'products', 'images', 'designs', 'version'}).
+        variant (str): 'catalog' (index page) or 'search' (search and browse results).
+    Returns:
+        Markup: The rendered card.
+    """
+    inventory = item['inventory']
+    if variant == 'catalog':
+        key = (variant, inventory.id, item['version'], current_user.is_authenticated)
+    else:
+        key = (variant, inventory.id, item['version'], inventory.current_quantity)
+    html = card_cache.get_or_load(key, lambda: render_template('_inventory_card.html', item=item, variant=variant))
+    return Markup(html)
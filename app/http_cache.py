@@ -0,0 +1,92 @@
+import functools
+import hashlib
+import json
+import os
+from datetime import timezone
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from .models.version import DataVersion
+
+
+class HttpCache:
+    """Conditional GET support for pages rendered from slowly changing tables.
+
+    Views decorated with conditional_get() get an ETag and Last-Modified
+    derived from the Data_Versions stamps of the tables they read (one small
+    query), and answer 304 Not Modified without running the view when the
+    client's validators still match. Pages show the signed-in user, so the
+    ETag includes who is asking and responses carry Vary: Cookie; anonymous
+    responses may be cached publicly for the route's max-age, signed-in ones
+    only privately and always revalidated.
+
+    Enabled with HTTP_CACHE_ENABLED in Config.
+    """
+    def __init__(self, app):
+        DataVersion.track(app.db)
+        self.release = HttpCache._release(app)
+        app.extensions['http_cache'] = self
+
+    @staticmethod
+    def _release(app):
+        """Fingerprint of the templates, so that a deployment changing the markup changes every ETag."""
+        digest = hashlib.sha1(app.config['HTTP_CACHE_RELEASE'].encode())
+        for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+            for name in sorted(files):
+                stat = os.stat(os.path.join(root, name))
+                digest.update(f'{name}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+        return digest.hexdigest()[:12]
+
+
+def conditional_get(tables, max_age=0):
+    """Make GET/HEAD requests of a view conditional on the stamps of the tables it reads.
+    Args:
+        tables (list[str]): Tables whose writes change the page.
+        max_age (int): Seconds anonymous responses may be reused without revalidation.
+    """
+    DataVersion.TRACKED.update(table.lower() for table in tables)
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions.get('http_cache')
+            # Pending flash messages are shown (and consumed) by the page itself
+            if cache is None or request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            stamps = DataVersion.current(tables)
+            viewer = [current_user.id, current_user.firstname] if current_user.is_authenticated else None
+            etag = hashlib.sha1(json.dumps(
+                [cache.release, request.endpoint, request.full_path, viewer, sorted(stamps.items())],
+                default=str).encode()).hexdigest()[:20]
+            last_modified = max(updated_at for _, updated_at in stamps.values()).replace(tzinfo=timezone.utc)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = (request.if_modified_since is not None
+                                and last_modified.replace(microsecond=0) <= request.if_modified_since)
+            response = make_response('', 304) if not_modified else make_response(view(*args, **kwargs))
+            if response.status_code not in (200, 304):
+                return response
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            if viewer is None:
+                response.cache_control.public = True
+                response.cache_control.max_age = max_age
+            else:
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+
+# Tables read by the catalog pages (inventory cards, product and category lists, seller checks)
+CATALOG_TABLES = ['Inventories', 'Products', 'Inventory_Designs', 'Inventory_Images', 'Images',
+                  'Tags', 'Categories', 'Sellers']
+
+# Tables read by the index page. Its cards show no stock, so instead of Inventories, which every
+# checkout writes, it depends on the card versions, bumped by every change of what a card shows
+# and by every inventory added or deleted (see InventoryCard)
+INDEX_TABLES = [table for table in CATALOG_TABLES if table != 'Inventories'] + ['Inventory_Card_Versions']
@@ -0,0 +1,109 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from .models.image import Image
+
+logger = logging.getLogger('app.images')
+
+
+def process_upload(spool, folder):
+    """Decode, re-encode, resize and publish one spooled upload (runs in the worker pool).
+    Returns:
+        str: The content-hash file name of the published image.
+    """
+    with open(spool, 'rb') as f:
+        return Image.store(f.read(), folder)
+
+
+class ImageWorker:
+    """Processes uploaded images off the request path.
+
+    The request only checks the file header, inserts a 'pending' Images row
+    and spools the upload to IMAGE_SPOOL_DIR; once that row is committed,
+    the upload is submitted to a pool that decodes it, strips its metadata,
+    writes the resized variants and publishes the files atomically (see
+    Image.store()). When a job ends, the request process marks the row
+    'ready' with the new file name, or 'failed'.
+
+    IMAGE_WORKER_MODE selects the pool: 'process' (default; CPU-bound
+    decoding does not hold the GIL of the web process), 'thread', or
+    'inline' to process uploads synchronously (tests, one-off scripts).
+    Spooled files survive a restart, and `flask images process-pending`
+    finishes the uploads that were still queued.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.mode = app.config['IMAGE_WORKER_MODE']
+        self.workers = app.config['IMAGE_WORKERS']
+        self.spool_dir = app.config['IMAGE_SPOOL_DIR'] or os.path.join(app.instance_path, 'image_spool')
+        self.folder = os.path.join(app.root_path, 'static', 'images')
+        self._executor = None
+        self._lock = threading.Lock()
+        app.extensions['image_worker'] = self
+
+    def submit(self, imgid, data):
+        """Spool an upload of image imgid and queue it for processing."""
+        self.resume(imgid, self._spool(imgid, data))
+
+    def resume(self, imgid, spool):
+        """Queue an already spooled upload of image imgid for processing."""
+        if self.mode == 'inline':
+            self._finish(imgid, spool, lambda: process_upload(spool, self.folder))
+            return
+        try:
+            future = self._pool().submit(process_upload, spool, self.folder)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed by the OOM killer); start a new pool
+            self._executor = None
+            future = self._pool().submit(process_upload, spool, self.folder)
+        future.add_done_callback(lambda future: self._finish(imgid, spool, future.result))
+
+    def spooled(self, imgid):
+        """Return the newest spooled upload of image imgid, or None."""
+        prefix = f'{imgid}-'
+        paths = [os.path.join(self.spool_dir, name) for name in os.listdir(self.spool_dir)
+                 if name.startswith(prefix) and name.endswith('.upload')] if os.path.isdir(self.spool_dir) else []
+        return max(paths, key=os.path.getmtime) if paths else None
+
+    def _spool(self, imgid, data):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f'{imgid}-{uuid.uuid4().hex}.upload')
+        fd, tmp = tempfile.mkstemp(dir=self.spool_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return path
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                if self.mode == 'process':
+                    # spawn, not fork: a forked child would inherit the pooled DB connections
+                    self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                else:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='image-worker')
+            return self._executor
+
+    def _finish(self, imgid, spool, result):
+        """Record the outcome of a job (result() returns the file name or raises) and drop its spool file."""
+        # A later replacement of the same image is still queued: its outcome wins
+        superseded = self.spooled(imgid) not in (spool, None)
+        with self.app.app_context():
+            try:
+                filename = result()
+            except Exception as e:
+                logger.warning('image %s: processing failed: %s', imgid, e)
+                if not superseded:
+                    Image.mark_failed(imgid)
+            else:
+                if not superseded:
+                    Image.publish(imgid, filename)
+        try:
+            os.remove(spool)
+        except OSError:
+            pass
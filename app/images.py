@@ -0,0 +1,74 @@
+import os
+import re
+import click
+from flask import current_app, request, url_for
+from flask.cli import AppGroup
+from .models.image import Image
+
+# Content-hashed files and their variants: <hash>.jpeg, <hash>_<variant>.jpeg
+IMMUTABLE_FILE = re.compile(r'^images/[0-9a-f]{16}(?:_\w+)?\.jpeg$')
+ONE_YEAR = 365 * 24 * 3600
+
+
+def image_url(content, variant='detail'):
+    """Template filter: URL of a variant of an image file, e.g. {{ item.images.content | image_url('card') }}."""
+    return url_for('static', filename=Image.variant(content, variant))
+
+
+def immutable_static_files(response):
+    """Let browsers and proxies keep content-hashed images forever: their names change with their content."""
+    if (request.endpoint == 'static' and response.status_code in (200, 304)
+            and IMMUTABLE_FILE.match(request.view_args.get('filename', ''))):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = ONE_YEAR
+        response.cache_control.immutable = True
+    return response
+
+
+images_cli = AppGroup('images', help='Maintain the uploaded image files in app/static/images.')
+
+
+@images_cli.command('rehash')
+def rehash():
+    """Store images saved before content hashing under hashed names, with their variants."""
+    rows = current_app.db.read('''
+        SELECT id, content
+        FROM Images
+        WHERE status = 'ready'
+        ORDER BY id
+        ''')
+    converted = {}
+    for imgid, content in rows:
+        if Image.HASHED_NAME.match(content or ''):
+            continue
+        if content not in converted:
+            path = os.path.join(Image.folder(), content or '')
+            if not content or not os.path.isfile(path):
+                click.echo(f'image {imgid}: {content} not found, skipped')
+                continue
+            with open(path, 'rb') as f:
+                converted[content] = Image.store(f.read())
+        current_app.db.execute('''
+            UPDATE Images
+            SET content = :content
+            WHERE id = :id
+            ''', content=converted[content], id=imgid)
+    click.echo(f'rehashed {len(converted)} files')
+
+
+@images_cli.command('process-pending')
+def process_pending():
+    """Finish the uploads left pending by a restart (processed inline), and fail those whose file is gone."""
+    worker = current_app.extensions['image_worker']
+    worker.mode = 'inline'
+    for image in Image.get_unfinished():
+        if image.status != 'pending':
+            continue
+        spool = worker.spooled(image.id)
+        if spool is None:
+            click.echo(f'image {image.id}: upload not found, marked failed')
+            Image.mark_failed(image.id)
+            continue
+        worker.resume(image.id, spool)
+        click.echo(f'image {image.id}: {Image.get(image.id).status}')
@@ -1,10 +1,12 @@
-from flask import Blueprint, render_template, request, jsonify, url_for, redirect, flash
+from flask import Blueprint, render_template, request, jsonify, url_for, redirect, flash, current_app
 from flask_login import current_user
 from .models.product import Product
 from .models.image import Image
 from .models.inventory import Inventory
 from .models.category import Category
 from .models.seller import Seller
+from .models.catalog import Catalog
+from .http_cache import conditional_get, INDEX_TABLES
 
 bp = Blueprint('index', __name__)
 
@@ -12,47 +14,25 @@ def get_all_products_details():
     """
     Retrieves details for all products including related images.
     """
-    products_details = []
-    products = Product.get_all()
-    if products:
-        for product in products:
-            # Retrieve the associated image for each product
-            images = Image.get_product_image(product.id)
-            products_details.append({
-                'products': product,
-                'images': images
-            })
-    return products_details
+    return Catalog.get_all_products_details()
 
 
-def get_all_inventories_details():
+def get_all_inventories_details(cursor=None):
     """
-    Retrieves details for all inventories including related products, images, and designs.
+    Retrieves details for one page of inventories including related products, images, and designs.
+    All rows are loaded with one joined query instead of several queries per inventory.
     """
-    inventories_details = []
-    inventories = Inventory.get_all()
-    if inventories:
-        for inventory in inventories:
-            # For each inventory, get related products and designs
-            related_products = Product.get_inventory_products(inventory.id)
-            images = Image.get_inventory_image(inventory.id) if Image.has_inventory_images(inventory.id) else Image.get_product_image(related_products.id)
-            designs = Inventory.get_inventory_designs(inventory.id)
-            inventories_details.append({
-                'inventory': inventory,
-                'products': related_products,
-                'images': images,
-                'designs': designs[0] if designs else None
-            })
-    return inventories_details
+    return Catalog.get_all_inventories_details(limit=current_app.config['CATALOG_PAGE_SIZE'], cursor=cursor)
 
 
 @bp.route('/', methods=['GET', 'POST'])
+@conditional_get(INDEX_TABLES, max_age=30)
 def index():
     """
     Main index route which displays products and inventories along with an option to view top priced products if requested via POST.
     """
     products_details = get_all_products_details()
-    inventory_details = get_all_inventories_details()
+    inventory_details = get_all_inventories_details(request.args.get('cursor'))
     check = False  # Flag to check if the current user is a seller
     
     top_products = None
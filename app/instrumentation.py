@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import sys
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger('app.sql')
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_MODULE = os.path.join(APP_DIR, 'db.py')
+
+
+class RequestQueries:
+    """SQL statements issued while handling one request."""
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = {}  # normalized SQL -> [executions, total seconds, slowest seconds]
+        self.callers = {}     # normalized SQL -> application frames that issue it repeatedly
+
+    def record(self, sql, seconds):
+        self.count += 1
+        self.seconds += seconds
+        entry = self.statements.get(sql)
+        if entry is None:
+            entry = self.statements[sql] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+        return entry[0]
+
+    def slowest(self, limit):
+        """Return the limit statements with the largest total time, as dicts."""
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [{'sql': sql, 'calls': calls, 'ms': round(total * 1000, 2), 'max_ms': round(slowest * 1000, 2)}
+                for sql, (calls, total, slowest) in ranked]
+
+    def repeated(self, threshold):
+        """Return the statements executed more than threshold times (likely N+1 loops)."""
+        return [{'sql': sql, 'calls': calls, 'caller': self.callers.get(sql)}
+                for sql, (calls, _, _) in self.statements.items() if calls > threshold]
+
+
+class QueryInstrumentation:
+    """Counts and times every SQL statement of a Flask request.
+
+    Engine events time each cursor execution, so statements issued through
+    DB.execute(), DB.read() and raw transaction() connections are all seen.
+    After the request the totals are added to the response as
+    X-DB-Query-Count / X-DB-Time-Ms / Server-Timing headers and written as one
+    JSON line to the 'app.sql' logger, with the slowest statements and any SQL
+    text repeated more than SQL_N_PLUS_ONE_THRESHOLD times (logged as a
+    warning, together with the code that issued it).
+
+    Enabled with SQL_INSTRUMENTATION in Config (off by default); the headers
+    additionally need SQL_INSTRUMENTATION_HEADERS.
+    """
+    def __init__(self, app):
+        self.slowest_count = app.config['SQL_SLOWEST_COUNT']
+        self.n_plus_one_threshold = app.config['SQL_N_PLUS_ONE_THRESHOLD']
+        self.headers = app.config['SQL_INSTRUMENTATION_HEADERS']
+        event.listen(app.db.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(app.db.engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(app.db.engine, 'handle_error', self._handle_error)
+        app.after_request(self.after_request)
+
+    @staticmethod
+    def current():
+        """Return the RequestQueries of the current request, or None outside of one."""
+        if not has_request_context():
+            return None
+        queries = g.get('_request_queries')
+        if queries is None:
+            queries = g._request_queries = RequestQueries()
+        return queries
+
+    def after_request(self, response):
+        queries = g.pop('_request_queries', None)
+        if queries is None:
+            return response
+        db_ms = round(queries.seconds * 1000, 2)
+        if self.headers:
+            response.headers['X-DB-Query-Count'] = str(queries.count)
+            response.headers['X-DB-Time-Ms'] = str(db_ms)
+            response.headers.add('Server-Timing', f'db;dur={db_ms};desc="{queries.count} queries"')
+        repeated = queries.repeated(self.n_plus_one_threshold)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'query_count': queries.count,
+            'db_ms': db_ms,
+            'slowest': queries.slowest(self.slowest_count),
+            'n_plus_one': repeated,
+        }
+        logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(record, default=str))
+        return response
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['_query_started'].pop()
+        queries = QueryInstrumentation.current()
+        if queries is None:
+            return
+        sql = ' '.join(statement.split())
+        if queries.record(sql, time.perf_counter() - started) == self.n_plus_one_threshold + 1:
+            # Only look up who issues the statement once it is known to repeat
+            queries.callers[sql] = QueryInstrumentation._caller()
+
+    @staticmethod
+    def _handle_error(context):
+        started = context.connection.info.get('_query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+    @staticmethod
+    def _caller(depth=2):
+        """Return the innermost depth application frames outside of db.py, as 'file:line in function <- ...'."""
+        frames = []
+        frame = sys._getframe(1)
+        while frame is not None and len(frames) < depth:
+            filename = os.path.abspath(frame.f_code.co_filename)
+            if filename.startswith(APP_DIR) and filename not in (DB_MODULE, os.path.abspath(__file__)):
+                frames.append(f'{os.path.relpath(filename, os.path.dirname(APP_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}')
+            frame = frame.f_back
+        return ' <- '.join(frames) or None
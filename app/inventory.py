@@ -1,5 +1,5 @@
 import base64
-from flask import render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, current_app
 from flask_login import current_user, login_required
 from .models.seller import Seller 
 from .models.inventory import Inventory
@@ -9,6 +9,10 @@ from .models.image import Image
 from .models.order import Order
 from .models.tag import Tag
 from .models.category import Category
+from .models.catalog import Catalog
+from .models.copurchase import Copurchase
+from .models.pagination import Page
+from .http_cache import conditional_get, CATALOG_TABLES
 from flask_wtf import FlaskForm
 from wtforms import StringField, IntegerField, SelectField, SubmitField, FloatField, FileField
 from flask_wtf.file import FileField, FileAllowed
@@ -29,35 +33,36 @@ class InventoryForm(FlaskForm):
         super(InventoryForm, self).__init__(*args, **kwargs)
 
 
-def get_inventories_details(filter_type, filter_value=None, order=None, sid=None, keyword=None, category=None, sort=None, rating_filter=None, price_min=None, price_max=None):
+def get_inventories_details(filter_type, filter_value=None, order=None, sid=None, keyword=None, category=None, sort=None, rating_filter=None, price_min=None, price_max=None, limit=None, cursor=None):
     """
     Retrieves detailed information about inventories based on different filtering criteria such as seller, category, and sorting preferences.
+    When a limit is given, only one page is loaded and the returned Page carries the cursor of the next one.
     """
     inventories_details = []
     check = True
     
     # Determine the source of inventories based on the filter_type
     if filter_type == "seller":
-        inventories = Inventory.getBySeller(filter_value)
+        inventories = Inventory.getBySeller(filter_value, limit=limit, cursor=cursor)
     elif filter_type == "keyword":
-        inventories = Inventory.getByKeyword(filter_value)
+        inventories = Inventory.getByKeyword(filter_value, limit=limit, cursor=cursor)
     elif filter_type == "category":
-        inventories = Inventory.getByCategory(filter_value)
+        inventories = Inventory.getByCategory(filter_value, limit=limit, cursor=cursor)
     elif filter_type == "sorted":
         if order == "price_asc":
-            inventories = Inventory.getByPrice()
+            inventories = Inventory.getByPrice(limit=limit, cursor=cursor)
         else:
-            inventories = Inventory.getByPrice('desc')
+            inventories = Inventory.getByPrice('desc', limit=limit, cursor=cursor)
     elif filter_type == "sorted_by_rating":
         if order == "rating_desc":
-            inventories = Inventory.getByRating()
+            inventories = Inventory.getByRating(limit=limit, cursor=cursor)
         else:
-            inventories = Inventory.getByRating('asc')
+            inventories = Inventory.getByRating('asc', limit=limit, cursor=cursor)
     elif filter_type == "sorted_by_sales":
         if order == "sales_desc":
-            inventories = Inventory.getBySales()
+            inventories = Inventory.getBySales(limit=limit, cursor=cursor)
         else:
-            inventories = Inventory.getBySales('asc')
+            inventories = Inventory.getBySales('asc', limit=limit, cursor=cursor)
     elif filter_type == "inventory_id":
         inventories = [Inventory.getById(filter_value)] if Inventory.getById(filter_value) else []
         check = False
@@ -72,25 +77,17 @@ def get_inventories_details(filter_type, filter_value=None, order=None, sid=None
             sort=sort,
             rating_filter=rating_filter,
             price_min=price_min,
-            price_max=price_max
+            price_max=price_max,
+            limit=limit,
+            cursor=cursor
         )
         print(f'reach here - inventories: {inventories} {sid} sid, {keyword} keyword, {category} category, {sort} sort, {rating_filter} rating, {price_min} - {price_max}')
     else:
         return []
 
-    for inventory in inventories:
-        if not inventory:
-            continue
-        related_products = Product.get_inventory_products(inventory.id)
-        images = Image.get_inventory_image(inventory.id, check) if Image.has_inventory_images(inventory.id) else Image.get_product_image(related_products.id)
-        designs = Inventory.get_inventory_designs(inventory.id)
-        
-        inventories_details.append({
-            'inventory': inventory,
-            'products': related_products,
-            'images': images,
-            'designs': designs[0] if designs else None  
-        })
+    # Load products, images and designs for all inventories in a fixed number of queries
+    inventories_details = Catalog.get_inventories_details(inventories, display=check)
+    inventories_details = Page(inventories_details, getattr(inventories, 'next_cursor', None))
 
     return inventories_details
 
@@ -124,17 +121,19 @@ def search_inventory():
     sid = request.form.get('seller_identifier')
     
     if Seller.is_seller(sid):
-        inventories_details = get_inventories_details('seller', filter_value=sid)
+        inventories_details = get_inventories_details('seller', filter_value=sid, limit=current_app.config['CATALOG_PAGE_SIZE'], cursor=request.form.get('cursor'))
         seller = User.get_seller_account(sid)
         
         # Render a template to display the search results
-        return render_template('search_results.html', inventories_details=inventories_details, seller=seller)
+        return render_template('search_results.html', inventories_details=inventories_details, seller=seller,
+                               page_endpoint='inventory.search_inventory', page_method='POST', page_params={'seller_identifier': sid})
     else:
         error_msg = "No such seller!"
         return render_template('error_msg.html', msg=error_msg)
 
 
 @bp.route('/inventory/<int:invid>')
+@conditional_get(CATALOG_TABLES + ['Inventory_Neighbors'], max_age=60)
 def seller_product_detail(invid, check=False):
     """
     Displays detailed view of a single inventory item, accessible only to the inventory's seller.
@@ -148,7 +147,8 @@ def seller_product_detail(invid, check=False):
         check = inventory.sid == current_seller.id
         editable = Product.get(inventory.pid).uid == current_user.id
     if len(details) > 0:
-        return render_template('seller_product_detail.html', details=details[0], check=check, editable=editable, all_products=all_products)
+        return render_template('seller_product_detail.html', details=details[0], check=check, editable=editable, all_products=all_products,
+                               bought_together=Copurchase.neighbors(invid))
     else:
         error_msg = "No such inventory!"
         return render_template('error_msg.html', msg=error_msg)
@@ -180,12 +180,17 @@ def search_inventory_form():
         sort=sort,
         rating_filter=rating_filter,
         price_min=price_min,
-        price_max=price_max
+        price_max=price_max,
+        limit=current_app.config['CATALOG_PAGE_SIZE'],
+        cursor=request.form.get('cursor')
     )
     seller = Seller.getById(sid)
+    page_params = {'sid': sid, 'keyword': keyword, 'category': category, 'sort[]': sort,
+                   'rating_filter': rating_filter, 'price_min': price_min, 'price_max': price_max}
     
     # Render the page with the search results
-    return render_template('search_results.html', inventories_details=inventories_details, seller=seller, mixed=True, keyword=keyword, category=category, price_min=price_min, price_max=price_max, rating_filter=rating_filter, sort=sort)
+    return render_template('search_results.html', inventories_details=inventories_details, seller=seller, mixed=True, keyword=keyword, category=category, price_min=price_min, price_max=price_max, rating_filter=rating_filter, sort=sort,
+                           page_endpoint='inventory.search_inventory_form', page_method='POST', page_params=page_params)
 
 
 """
@@ -196,16 +201,19 @@ def search_inventory_by_keyword():
     inventories_details = []
     keyword = request.form.get('keyword_identifier')
     
-    inventories_details = get_inventories_details('keyword', filter_value=keyword)
+    inventories_details = get_inventories_details('keyword', filter_value=keyword, limit=current_app.config['CATALOG_PAGE_SIZE'], cursor=request.form.get('cursor'))
     
-    return render_template('search_results.html', inventories_details=inventories_details, keyword=keyword)
+    return render_template('search_results.html', inventories_details=inventories_details, keyword=keyword,
+                           page_endpoint='inventory.search_inventory_by_keyword', page_method='POST', page_params={'keyword_identifier': keyword})
 
 
 @bp.route('/browse_category/<int:categoryId>', methods=['GET', 'POST'])
+@conditional_get(CATALOG_TABLES, max_age=60)
 def browse_category(categoryId):
-    category_details = get_inventories_details('category', filter_value=categoryId)
+    category_details = get_inventories_details('category', filter_value=categoryId, limit=current_app.config['CATALOG_PAGE_SIZE'], cursor=request.values.get('cursor'))
 
-    return render_template('search_results.html', inventories_details=category_details, category=True)
+    return render_template('search_results.html', inventories_details=category_details, category=True,
+                           page_endpoint='inventory.browse_category', page_method='GET', page_params={'categoryId': categoryId})
 
 
 """
@@ -214,25 +222,28 @@ Sorts and displays inventories based on user-selected criteria like price or rat
 @bp.route('/sort_inventory', methods=['POST'])
 def sort_inventory():
     sort_order = request.form.get('sort_order')
-    inventories_details = get_inventories_details('sorted', order=sort_order)
+    inventories_details = get_inventories_details('sorted', order=sort_order, limit=current_app.config['CATALOG_PAGE_SIZE'], cursor=request.form.get('cursor'))
 
-    return render_template('search_results.html', inventories_details=inventories_details, sort=True)
+    return render_template('search_results.html', inventories_details=inventories_details, sort=True,
+                           page_endpoint='inventory.sort_inventory', page_method='POST', page_params={'sort_order': sort_order})
 
 
 @bp.route('/sort_inventory_by_rating', methods=['POST'])
 def sort_inventory_by_rating():
     sort_order = request.form.get('sort_order')
-    inventories_details = get_inventories_details('sorted_by_rating', order=sort_order)
+    inventories_details = get_inventories_details('sorted_by_rating', order=sort_order, limit=current_app.config['CATALOG_PAGE_SIZE'], cursor=request.form.get('cursor'))
 
-    return render_template('search_results.html', inventories_details=inventories_details, sort=True)
+    return render_template('search_results.html', inventories_details=inventories_details, sort=True,
+                           page_endpoint='inventory.sort_inventory_by_rating', page_method='POST', page_params={'sort_order': sort_order})
 
 
 @bp.route('/sort_inventory_by_sales', methods=['POST'])
 def sort_inventory_by_sales():
     sort_order = request.form.get('sort_order')
-    inventories_details = get_inventories_details('sorted_by_sales', order=sort_order)
+    inventories_details = get_inventories_details('sorted_by_sales', order=sort_order, limit=current_app.config['CATALOG_PAGE_SIZE'], cursor=request.form.get('cursor'))
 
-    return render_template('search_results.html', inventories_details=inventories_details, sort=True)
+    return render_template('search_results.html', inventories_details=inventories_details, sort=True,
+                           page_endpoint='inventory.sort_inventory_by_sales', page_method='POST', page_params={'sort_order': sort_order})
 
 
 class NewInventoryForm(FlaskForm):
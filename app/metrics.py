@@ -0,0 +1,314 @@
+import atexit
+import hmac
+import ipaddress
+import json
+import os
+import tempfile
+import threading
+import time
+from flask import Response, abort, current_app, g, request
+from sqlalchemy import event
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+class _Metric:
+    """Values of one metric family, keyed by the tuple of its label values."""
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value if not isinstance(value, list) else list(value)]
+                    for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Current value per process; in multiprocess mode the values of the live processes are summed."""
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # [count per bucket..., count above the last bucket, sum]
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            else:
+                entry[len(self.buckets)] += 1
+            entry[-1] += value
+
+
+class MetricsRegistry:
+    """Holds the metrics of one process and renders the Prometheus text format.
+
+    With a directory (multiprocess mode) every process periodically writes its
+    values to <directory>/metrics_<pid>.json, and a scrape served by any worker
+    merges all files: counters and histograms are summed over every process that
+    ever wrote one, gauges over the processes still alive. Empty the directory
+    when the server (re)starts.
+    """
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics = []
+        self.collectors = []
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """Run the collectors and return {metric name: [[label values, value], ...]} for this process."""
+        for collect in self.collectors:
+            collect()
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def flush(self, force=True):
+        """Write this process' values to its file (multiprocess mode only).
+        Unless force is set, at most once per flush_interval seconds."""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        if not self._flush_lock.acquire(blocking=force):
+            return
+        try:
+            self._last_flush = now
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'pid': os.getpid(), 'metrics': self.snapshot()}, f)
+            os.replace(tmp, os.path.join(self.directory, f'metrics_{os.getpid()}.json'))
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        """Return the merged values of every process: {metric name: {label values: value}}."""
+        snapshots = [(True, self.snapshot())]
+        if self.directory:
+            for filename in os.listdir(self.directory):
+                if not filename.startswith('metrics_') or filename == f'metrics_{os.getpid()}.json':
+                    continue
+                try:
+                    with open(os.path.join(self.directory, filename)) as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                snapshots.append((_alive(data['pid']), data['metrics']))
+
+        merged = {metric.name: {} for metric in self.metrics}
+        types = {metric.name: metric.type for metric in self.metrics}
+        for alive, snapshot in snapshots:
+            for name, samples in snapshot.items():
+                if name not in merged or (types[name] == 'gauge' and not alive):
+                    continue
+                for labels, value in samples:
+                    key = tuple(labels)
+                    current = merged[name].get(key)
+                    if current is None:
+                        merged[name][key] = value
+                    elif isinstance(value, list):
+                        merged[name][key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        merged[name][key] = current + value
+        return merged
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format (version 0.0.4)."""
+        merged = self.collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for key, value in sorted(merged[metric.name].items()):
+                labels = list(zip(metric.labelnames, key))
+                if metric.type != 'histogram':
+                    lines.append(f'{metric.name}{_labels(labels)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    lines.append(f"{metric.name}_bucket{_labels(labels + [('le', _number(bound))])} {cumulative}")
+                lines.append(f'{metric.name}_sum{_labels(labels)} {_number(value[-1])}')
+                lines.append(f'{metric.name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Application metrics, served in the Prometheus text format at METRICS_PATH.
+
+    - http_request_duration_seconds: latency per endpoint and method,
+      http_requests_total: requests per endpoint, method and status,
+    - db_query_duration_seconds: latency of every SQL statement by kind,
+    - db_pool_checkout_wait_seconds: time to get a connection from the pool,
+      db_pool_connections: pooled connections in use / idle / overflow,
+    - checkout_total: checkout outcomes (see record_checkout()).
+
+    Set METRICS_MULTIPROC_DIR when the app runs in several worker processes
+    (see MetricsRegistry). Enabled with METRICS_ENABLED in Config (off by
+    default). The endpoint exposes internals, so it only answers clients in
+    METRICS_ALLOWED_IPS (loopback by default) or sending METRICS_TOKEN as a
+    bearer token; anyone else gets a 404.
+    """
+    def __init__(self, app):
+        self.token = app.config['METRICS_TOKEN']
+        self.allowed_networks = [ipaddress.ip_network(network.strip(), strict=False)
+                                 for network in app.config['METRICS_ALLOWED_IPS'].split(',') if network.strip()]
+        self.registry = MetricsRegistry(app.config['METRICS_MULTIPROC_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+        register = self.registry.register
+        self.request_duration = register(Histogram(
+            'http_request_duration_seconds', 'Time to handle a request.', ('endpoint', 'method')))
+        self.requests = register(Counter(
+            'http_requests_total', 'Requests handled.', ('endpoint', 'method', 'status')))
+        self.query_duration = register(Histogram(
+            'db_query_duration_seconds', 'Time to execute a SQL statement.', ('statement',)))
+        self.checkout_wait = register(Histogram(
+            'db_pool_checkout_wait_seconds', 'Time to check a connection out of the pool.'))
+        self.pool_connections = register(Gauge(
+            'db_pool_connections', 'Pooled database connections by state.', ('state',)))
+        self.checkouts = register(Counter(
+            'checkout_total', 'Checkout attempts by outcome.', ('outcome',)))
+        self.recommendation_panels = register(Counter(
+            'recommendation_panel_total', 'Cart recommendation panels served by outcome.', ('outcome',)))
+        self.registry.collectors.append(lambda: self._collect_pool(app.db.engine.pool))
+
+        app.db.checkout_observers.append(lambda seconds: self.checkout_wait.observe(seconds))
+        event.listen(app.db.engine, 'before_cursor_execute', Metrics._before_cursor_execute)
+        event.listen(app.db.engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(app.db.engine, 'handle_error', Metrics._handle_error)
+        app.before_request(Metrics._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule(app.config['METRICS_PATH'], 'metrics', self.scrape)
+        app.extensions['metrics'] = self
+
+    def scrape(self):
+        if not self._authorized():
+            abort(404)
+        return Response(self.registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    def _authorized(self):
+        if self.token:
+            scheme, _, credentials = (request.headers.get('Authorization') or '').partition(' ')
+            if scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), self.token.encode()):
+                return True
+        try:
+            address = ipaddress.ip_address(request.remote_addr or '')
+        except ValueError:
+            return False
+        return any(address in network for network in self.allowed_networks)
+
+    def _collect_pool(self, pool):
+        if not hasattr(pool, 'checkedout'):
+            return
+        self.pool_connections.set(pool.checkedout(), state='in_use')
+        self.pool_connections.set(pool.checkedin(), state='idle')
+        self.pool_connections.set(max(pool.overflow(), 0), state='overflow')
+
+    @staticmethod
+    def _before_request():
+        g._metrics_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            endpoint = request.endpoint or 'unmatched'
+            self.request_duration.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+            self.requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        self.registry.flush(force=False)
+        return response
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['_metrics_started'].pop()
+        words = statement.split(None, 1)
+        kind = words[0].upper() if words else ''
+        if kind not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'):
+            kind = 'OTHER'
+        self.query_duration.observe(seconds, statement=kind)
+
+    @staticmethod
+    def _handle_error(context):
+        started = context.connection.info.get('_metrics_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def record_checkout(outcome):
+    """Count a checkout outcome ('success', 'error' or a CheckoutError reason) if metrics are enabled."""
+    metrics = current_app.extensions.get('metrics')
+    if metrics is not None:
+        metrics.checkouts.inc(outcome=outcome)
+
+
+def record_recommendation_panel(outcome):
+    """Count how a recommendation panel was served ('cached', 'fresh', 'stale', 'timeout' or 'error') if metrics are enabled."""
+    metrics = current_app.extensions.get('metrics')
+    if metrics is not None:
+        metrics.recommendation_panels.inc(outcome=outcome)
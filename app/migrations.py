@@ -0,0 +1,278 @@
+import json
+import os
+import re
+import click
+from flask import current_app as app
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+
+class Migration:
+    """One versioned schema change: a file named <version>_<name>.sql in MIGRATIONS_DIR.
+
+    A file with a `-- migrate: no-transaction` line runs outside a transaction,
+    one statement at a time, as CREATE INDEX CONCURRENTLY requires. Its
+    statements must be idempotent (IF NOT EXISTS), since a failure leaves the
+    earlier ones applied, and must not contain semicolons other than the one
+    ending each statement.
+    """
+    FILENAME = re.compile(r'^(\d+)_(\w+)\.sql$')
+    NO_TRANSACTION = re.compile(r'^--\s*migrate:\s*no-transaction\s*$', re.IGNORECASE | re.MULTILINE)
+    CREATE_INDEX = re.compile(r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s+ON\s+(\w+)',
+                              re.IGNORECASE)
+
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    @property
+    def sql(self):
+        with open(self.path) as f:
+            return f.read()
+
+    @property
+    def transactional(self):
+        return not Migration.NO_TRANSACTION.search(self.sql)
+
+    def statements(self):
+        """Return the statements of the file, without comments."""
+        lines = [line for line in self.sql.splitlines() if not line.lstrip().startswith('--')]
+        return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+    def indexes(self):
+        """Return the (index, table) pairs created by this migration, lower-cased as PostgreSQL stores them."""
+        return [(index.lower(), table.lower()) for index, table in Migration.CREATE_INDEX.findall(self.sql)]
+
+
+class Migrator:
+    """Applies the migrations in MIGRATIONS_DIR in version order and records them in Schema_Migrations.
+
+    Each migration runs in its own transaction together with its Schema_Migrations
+    row, under an advisory lock so that two processes never apply the same one.
+    Non-transactional migrations (see Migration) run statement by statement on
+    an autocommit connection holding the same lock, and are recorded once every
+    statement succeeded.
+    """
+    LOCK_ID = 516000
+
+    # Representative statements of the model queries that the secondary indexes are meant to serve:
+    # (description, table that must not be sequentially scanned, SQL)
+    INDEX_CHECKS = [
+        ('cart lines of a cart', 'Cart_Products',
+         'SELECT invid, quantity FROM Cart_Products WHERE cid = 1 AND in_cart = TRUE'),
+        ('order summary', 'Order_Products',
+         'SELECT oid, SUM(quantity * price) FROM Order_Products WHERE oid = ANY(ARRAY[1, 2, 3]) GROUP BY oid'),
+        ('order lines of an inventory', 'Order_Products',
+         'SELECT oid, quantity FROM Order_Products WHERE invid = 1'),
+        ('inventories of a product', 'Inventories',
+         'SELECT id, sid, pid, current_quantity, price FROM Inventories WHERE pid = 1'),
+        ('categories of a product', 'Tags',
+         'SELECT pid, cid FROM Tags WHERE pid = 1'),
+        ('products of a category', 'Tags',
+         'SELECT pid, cid FROM Tags WHERE cid = 1'),
+        ('reviews of an inventory', 'Reviews',
+         'SELECT id, rating FROM Reviews WHERE invid = 1'),
+        ('reviews of a user', 'Reviews',
+         'SELECT id, rating FROM Reviews WHERE uid = 1 ORDER BY time_created DESC'),
+        ('feedback of a seller', 'Feedbacks',
+         'SELECT id, rating FROM Feedbacks WHERE sid = 1'),
+        ('images of an inventory', 'Inventory_Images',
+         'SELECT imgid FROM Inventory_Images WHERE invid = 1 ORDER BY imgid'),
+        ('order history of a user', 'Orders',
+         'SELECT id FROM Orders WHERE uid = 1 ORDER BY time_created DESC'),
+        ('keyword search', 'Inventory_Search',
+         "SELECT invid FROM Inventory_Search WHERE document @@ to_tsquery('english', 'book:*')"),
+        ('inventories sorted by rating', 'Inventory_Stats',
+         'SELECT invid FROM Inventory_Stats ORDER BY average_rating DESC, invid DESC LIMIT 25'),
+        ('inventories sorted by sales', 'Inventory_Stats',
+         'SELECT invid FROM Inventory_Stats ORDER BY units_sold DESC, invid DESC LIMIT 25'),
+    ]
+
+    def __init__(self, directory=None):
+        self.directory = directory or app.config['MIGRATIONS_DIR']
+
+    def available(self):
+        """Return every migration file, in version order."""
+        migrations = []
+        for filename in os.listdir(self.directory):
+            match = Migration.FILENAME.match(filename)
+            if match:
+                migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(self.directory, filename)))
+        return sorted(migrations, key=lambda migration: migration.version)
+
+    def applied(self):
+        """Return {version: applied_at} for the migrations recorded in Schema_Migrations."""
+        self._ensure_table()
+        rows = app.db.read('''
+            SELECT version, applied_at
+            FROM Schema_Migrations
+            ''')
+        return {row[0]: row[1] for row in rows}
+
+    def pending(self):
+        applied = self.applied()
+        return [migration for migration in self.available() if migration.version not in applied]
+
+    def apply(self, target=None):
+        """Apply the pending migrations up to version target (all of them by default).
+        Returns:
+            list[Migration]: The migrations that were applied.
+        """
+        done = []
+        for migration in self.pending():
+            if target is not None and migration.version > target:
+                break
+            if not migration.transactional:
+                if self._apply_outside_transaction(migration):
+                    done.append(migration)
+                continue
+            with app.db.transaction() as conn:
+                conn.execute(text('SELECT pg_advisory_xact_lock(:lock_id)'), {'lock_id': Migrator.LOCK_ID})
+                # Another process may have applied it while we waited for the lock
+                if conn.execute(text('SELECT 1 FROM Schema_Migrations WHERE version = :version'),
+                                {'version': migration.version}).fetchall():
+                    continue
+                # exec_driver_sql: the file may hold several statements and must not be parsed for :params
+                conn.exec_driver_sql(migration.sql)
+                conn.execute(text('''
+                    INSERT INTO Schema_Migrations (version, name)
+                    VALUES (:version, :name)
+                    '''), {'version': migration.version, 'name': migration.name})
+            done.append(migration)
+        return done
+
+    def _apply_outside_transaction(self, migration):
+        """Apply a non-transactional migration; returns False if another process applied it first."""
+        conn = app.db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        try:
+            conn.execute(text('SELECT pg_advisory_lock(:lock_id)'), {'lock_id': Migrator.LOCK_ID})
+            try:
+                if conn.execute(text('SELECT 1 FROM Schema_Migrations WHERE version = :version'),
+                                {'version': migration.version}).fetchall():
+                    return False
+                # Concurrent builds on large tables outlast the statement timeout of the app
+                conn.exec_driver_sql('SET statement_timeout = 0')
+                # A failed concurrent build leaves an invalid index behind, which IF NOT EXISTS would keep
+                invalid = conn.execute(text('''
+                    SELECT c.relname
+                    FROM pg_index x
+                    JOIN pg_class c ON c.oid = x.indexrelid
+                    WHERE c.relname = ANY(:names) AND NOT x.indisvalid
+                    '''), {'names': [index for index, _ in migration.indexes()]}).fetchall()
+                for row in invalid:
+                    conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS "{row[0]}"')
+                for statement in migration.statements():
+                    conn.exec_driver_sql(statement)
+                conn.execute(text('''
+                    INSERT INTO Schema_Migrations (version, name)
+                    VALUES (:version, :name)
+                    '''), {'version': migration.version, 'name': migration.name})
+                return True
+            finally:
+                conn.exec_driver_sql('RESET statement_timeout')
+                conn.execute(text('SELECT pg_advisory_unlock(:lock_id)'), {'lock_id': Migrator.LOCK_ID})
+        finally:
+            conn.close()
+
+    def verify_indexes(self):
+        """Check that every index created by an applied migration exists and is valid.
+        Returns:
+            list[dict]: One entry per index with its table, status and size in bytes.
+        """
+        applied = self.applied()
+        expected = [(index, table) for migration in self.available() if migration.version in applied
+                    for index, table in migration.indexes()]
+        rows = app.db.read('''
+            SELECT c.relname, t.relname, x.indisvalid, pg_relation_size(c.oid)
+            FROM pg_index x
+            JOIN pg_class c ON c.oid = x.indexrelid
+            JOIN pg_class t ON t.oid = x.indrelid
+            WHERE c.relname = ANY(:names)
+            ''', names=[index for index, _ in expected])
+        found = {row[0]: row for row in rows}
+        report = []
+        for index, table in expected:
+            row = found.get(index)
+            if row is None:
+                status = 'missing'
+            elif row[1] != table:
+                status = f'on {row[1]}'
+            else:
+                status = 'ok' if row[2] else 'invalid'
+            report.append({'index': index, 'table': table, 'status': status, 'size': row[3] if row else None})
+        return report
+
+    def explain_queries(self):
+        """EXPLAIN each of INDEX_CHECKS with sequential scans disabled, as the planner would
+        choose at scale, and report whether its table is still read with a Seq Scan.
+        Returns:
+            list[dict]: One entry per check with 'ok' and the scan node types used on its table.
+        """
+        report = []
+        for description, table, sql in Migrator.INDEX_CHECKS:
+            with app.db.transaction() as conn:
+                conn.execute(text('SET LOCAL enable_seqscan = off'))
+                plan = conn.execute(text('EXPLAIN (FORMAT JSON) ' + sql)).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans = [node['Node Type'] for node in Migrator._plan_nodes(plan[0]['Plan'])
+                     if node.get('Relation Name', '').lower() == table.lower()]
+            report.append({'query': description, 'table': table, 'scans': scans,
+                           'ok': bool(scans) and 'Seq Scan' not in scans})
+        return report
+
+    @staticmethod
+    def _plan_nodes(node):
+        yield node
+        for child in node.get('Plans', []):
+            yield from Migrator._plan_nodes(child)
+
+    @staticmethod
+    def _ensure_table():
+        app.db.execute('''
+            CREATE TABLE IF NOT EXISTS Schema_Migrations (
+                version INT NOT NULL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at timestamp without time zone NOT NULL DEFAULT (current_timestamp AT TIME ZONE 'UTC')
+            )
+            ''')
+
+
+migrate_cli = AppGroup('migrate', help='Apply and check the versioned schema migrations in db/migrations.')
+
+
+@migrate_cli.command('status')
+def status():
+    """List applied and pending migrations."""
+    migrator = Migrator()
+    applied = migrator.applied()
+    for migration in migrator.available():
+        state = f'applied {applied[migration.version]}' if migration.version in applied else 'pending'
+        click.echo(f'{migration.version:04d} {migration.name}: {state}')
+
+
+@migrate_cli.command('apply')
+@click.option('--to', 'target', type=int, default=None, help='Stop after this version.')
+def apply(target):
+    """Apply pending migrations in version order."""
+    done = Migrator().apply(target)
+    for migration in done:
+        click.echo(f'applied {migration.version:04d} {migration.name}')
+    if not done:
+        click.echo('nothing to apply')
+
+
+@migrate_cli.command('verify')
+def verify():
+    """Check that the migrated indexes exist and that the model queries use them."""
+    migrator = Migrator()
+    failed = False
+    for entry in migrator.verify_indexes():
+        failed |= entry['status'] != 'ok'
+        click.echo(f"index {entry['index']} on {entry['table']}: {entry['status']} ({entry['size']} bytes)")
+    for entry in migrator.explain_queries():
+        failed |= not entry['ok']
+        click.echo(f"query {entry['query']}: {'ok' if entry['ok'] else 'NO INDEX'} ({', '.join(entry['scans']) or 'not scanned'})")
+    if failed:
+        raise SystemExit(1)
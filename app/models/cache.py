@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ReferenceCache:
+    """Process-local read-through cache for slowly changing reference tables
+    (categories, sellers, images).
+
+    Entries expire after `ttl` seconds and the least recently used entry is evicted
+    once `max_size` entries are stored. Model methods cache the raw result rows and
+    build fresh objects from them, so callers never share mutable instances.
+    Writers call invalidate() so the next read goes back to the database.
+    """
+    _registry = {}
+
+    def __init__(self, name, ttl=300, max_size=1024):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        ReferenceCache._registry[name] = self
+
+
+    @staticmethod
+    def _normalize(key):
+        """Compare key parts as strings so that IDs coming from forms ('5') and from the database (5) match."""
+        return tuple(str(part) for part in key)
+
+
+    def get_or_load(self, key, loader, cache_empty=True):
+        """Return the cached value for key, calling loader() and caching its result on a miss.
+        With cache_empty=False, empty results are not stored: use it for lookups whose
+        answer can appear through a write in another process, which cannot invalidate this cache."""
+        key = self._normalize(key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+
+        if self.ttl > 0 and self.max_size > 0 and (value or cache_empty):
+            with self._lock:
+                # Skip the store if an invalidation happened while we were loading
+                if generation == self._generation:
+                    self._entries[key] = (now + self.ttl, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+        return value
+
+
+    def invalidate(self, *keys):
+        """Drop the given keys, or every entry if no key is given."""
+        with self._lock:
+            self._generation += 1
+            if not keys:
+                self._entries.clear()
+            for key in keys:
+                self._entries.pop(self._normalize(key), None)
+
+
+    def configure(self, ttl, max_size):
+        """Set the TTL and size bound, dropping every entry."""
+        self.ttl = ttl
+        self.max_size = max_size
+        self.invalidate()
+
+
+    @staticmethod
+    def configure_all(ttl, max_size):
+        """Apply the TTL and size bound from the app config to every reference cache."""
+        for cache in ReferenceCache._registry.values():
+            cache.configure(ttl, max_size)
+
+
+category_cache = ReferenceCache('categories')
+seller_cache = ReferenceCache('sellers')
+image_cache = ReferenceCache('images')
+# Rendered catalog cards (app/fragments.py); sized by FRAGMENT_CACHE_* instead of REFERENCE_CACHE_*
+card_cache = ReferenceCache('inventory_cards')
@@ -0,0 +1,28 @@
+from flask import current_app as app
+
+
+class InventoryCard:
+    """Version stamps of the rendered catalog cards (see app/fragments.py).
+
+    The catalog loaders read the version of each inventory with its card
+    details; model methods that change what a card shows call bump(), so
+    cached renderings of the old version are never served again. Adding an
+    inventory bumps its card too, and deleting one deletes its row, so pages
+    listing cards can depend on Inventory_Card_Versions instead of Inventories.
+    """
+
+
+    @staticmethod
+    def bump(invids=None, pids=None):
+        """Increment the card version of the given inventories and of every inventory of the given products.
+        Args:
+            invids (list[int]): Inventory IDs.
+            pids (list[int]): Product IDs.
+        """
+        app.db.execute('''
+            INSERT INTO Inventory_Card_Versions (invid, version)
+            SELECT id, 1
+            FROM Inventories
+            WHERE id = ANY(:invids) OR pid = ANY(:pids)
+            ON CONFLICT (invid) DO UPDATE SET version = Inventory_Card_Versions.version + 1
+            ''', invids=[int(id) for id in invids or []], pids=[int(id) for id in pids or []])
@@ -1,8 +1,20 @@
+from decimal import Decimal
 from flask import current_app as app
+from ..cart_state import new_state, put_line, drop_line
+from .inventory import Inventory
+
+
+class OutOfStock(Exception):
+    """Raised inside a cart state change to leave the cart untouched."""
 
 
 class Cart:
-    """Class for cart management with methods for CRUD operations related to cart data."""
+    """Class for cart management with methods for CRUD operations related to cart data.
+
+    With CART_STATE_ENABLED, carts are read and changed in the cart state
+    store (see app/cart_state.py) and written back to Cart_Products by
+    flush(); otherwise every method works on Cart_Products directly.
+    """
     
     def __init__(self, id, uid):
         self.id = id
@@ -12,7 +24,7 @@ class Cart:
     @staticmethod
     def getById(id):
         """Retrieve a Cart by its ID."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, uid
             FROM Carts
             WHERE id = :id
@@ -23,7 +35,7 @@ class Cart:
     @staticmethod
     def getByUser(uid):
         """Retrieve a Cart by the associated user's ID."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, uid
             FROM Carts
             WHERE uid = :uid
@@ -52,7 +64,7 @@ class Cart:
     @staticmethod
     def has_cart(uid):
         """Check if a user has a cart."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, uid 
             FROM Carts 
             WHERE uid = :uid
@@ -62,46 +74,38 @@ class Cart:
     
     @staticmethod
     def add_to_cart(cid, invid, unit_price):
-        """Add an inventory item to a cart, adjusting quantity if the item already exists."""
+        """Add an inventory item to a cart, adjusting quantity if the item already exists.
+        The stock check is part of each write (no read-then-write), so concurrent requests
+        can never put more units in the cart than the inventory holds.
+        """
+        if Cart._state() is not None:
+            return Cart._add_to_state(cid, invid, unit_price)
         try:
-            # Check if the (cid, invid) pair exists in the table
-            existing_row = app.db.execute("""
-                SELECT quantity FROM Cart_Products
-                WHERE cid = :cid AND invid = :invid
-            """, cid=cid, invid=invid)
-            current_quantity = app.db.execute("""
-                SELECT current_quantity FROM Inventories
-                WHERE id = :invid
-            """, invid=invid)
-
-            if existing_row:
-                # If the pair exists, increment the quantity by 1
-                updated_quantity = existing_row[0][0] + 1
-                if updated_quantity <= current_quantity[0][0]:
-                    app.db.execute("""
-                        UPDATE Cart_Products
-                        SET quantity = :updated_quantity
-                        WHERE cid = :cid AND invid = :invid
-                    """, updated_quantity=updated_quantity, cid=cid, invid=invid)
-                else:
-                    return False
-            else:
-                if current_quantity[0][0] >= 1:
-                    # If the pair doesn't exist, insert a new record with quantity 1
-                    app.db.execute("""
-                        INSERT INTO Cart_Products (cid, invid, quantity, unit_price, in_cart)
-                        VALUES (
-                            :cid,
-                            :invid,
-                            1,
-                            :unit_price,
-                            True
-                        )
-                    """, cid=cid, invid=invid, unit_price=unit_price)
-                
-                else:
-                    return False
-            return True
+            with app.db.transaction():
+                # If the (cid, invid) pair exists, increment the quantity by 1 while stock allows
+                rows = app.db.execute("""
+                    UPDATE Cart_Products cp
+                    SET quantity = cp.quantity + 1
+                    FROM Inventories i
+                    WHERE cp.cid = :cid AND cp.invid = :invid
+                      AND i.id = cp.invid AND i.current_quantity >= cp.quantity + 1
+                    RETURNING cp.quantity
+                """, cid=cid, invid=invid)
+                if rows:
+                    return True
+                # Otherwise insert a new record with quantity 1 if the pair doesn't exist and it is in stock
+                rows = app.db.execute("""
+                    INSERT INTO Cart_Products (cid, invid, quantity, unit_price, in_cart)
+                    SELECT :cid, i.id, 1, :unit_price, True
+                    FROM Inventories i
+                    WHERE i.id = :invid AND i.current_quantity >= 1
+                      AND NOT EXISTS (
+                          SELECT 1 FROM Cart_Products
+                          WHERE cid = :cid AND invid = :invid
+                      )
+                    RETURNING invid
+                """, cid=cid, invid=invid, unit_price=unit_price)
+                return len(rows) > 0
         except Exception as e:
             print(str(e))
             return False
@@ -110,6 +114,11 @@ class Cart:
     @staticmethod
     def delete_cart_items(cid):
         """Delete all items from a cart that are marked as in cart."""
+        if Cart._state() is not None:
+            def change(cart):
+                for line in [line for line in cart['lines'].values() if line['in_cart']]:
+                    drop_line(cart, line['invid'])
+            return Cart._change(cid, change)
         try:
             app.db.execute("""
                 DELETE FROM Cart_Products
@@ -123,21 +132,27 @@ class Cart:
 
     @staticmethod
     def edit_quantity_by_invid(cid, invid, quantity):
-        """Edit the quantity of a specific item in the cart."""
+        """Edit the quantity of a specific item in the cart if the inventory has that many in stock."""
+        if Cart._state() is not None:
+            details = Cart._inventory_details(invid)
+
+            def change(cart):
+                line = cart['lines'].get(str(invid))
+                if line is None or details is None or details['current_quantity'] < quantity:
+                    raise OutOfStock()
+                put_line(cart, dict(line, quantity=quantity))
+            return Cart._change(cid, change)
         try:
-            current_quantity = app.db.execute("""
-                SELECT current_quantity FROM Inventories
-                WHERE id = :invid
-            """, invid=invid)
-            if quantity > current_quantity[0][0]:
-                return False
-            app.db.execute("""
-                UPDATE Cart_Products
+            rows = app.db.execute("""
+                UPDATE Cart_Products cp
                 SET quantity = :quantity
-                WHERE cid = :cid AND invid = :invid
+                FROM Inventories i
+                WHERE cp.cid = :cid AND cp.invid = :invid
+                  AND i.id = cp.invid AND i.current_quantity >= :quantity
+                RETURNING cp.invid
             """, cid=cid, invid=invid, quantity=quantity)
 
-            return True
+            return len(rows) > 0
         except Exception as e:
             print(str(e))
             return False
@@ -146,6 +161,8 @@ class Cart:
     @staticmethod
     def remove_product_by_invid(cid, invid):
         """Remove a specific product from the cart by inventory ID."""
+        if Cart._state() is not None:
+            return Cart._change(cid, lambda cart: drop_line(cart, invid))
         try:
             app.db.execute("""
                 DELETE FROM Cart_Products
@@ -161,6 +178,8 @@ class Cart:
     @staticmethod
     def save_product_for_later(cid, invid):
         """Mark a product in the cart to be saved for later (not for purchase now)."""
+        if Cart._state() is not None:
+            return Cart._change(cid, lambda cart: Cart._set_in_cart(cart, invid, False))
         try:
             app.db.execute("""
                 UPDATE Cart_Products
@@ -176,6 +195,8 @@ class Cart:
     @staticmethod
     def move_product_to_cart(cid, invid):
         """Move a product back to active cart status from saved for later."""
+        if Cart._state() is not None:
+            return Cart._change(cid, lambda cart: Cart._set_in_cart(cart, invid, True))
         try:
             app.db.execute("""
                 UPDATE Cart_Products
@@ -187,3 +208,205 @@ class Cart:
             print(str(e))
             return False
 
+
+    @staticmethod
+    def get_products(cid, in_cart=True):
+        """Retrieve the lines of a cart, most expensive first.
+        Args:
+            cid (int): Cart ID
+            in_cart (bool): True for the items to buy now, False for the saved-for-later ones.
+        Returns:
+            list: Dictionaries {'sid', 'name', 'description', 'quantity', 'price', 'invid'}, or None if there are none.
+        """
+        cart_state = Cart._state()
+        if cart_state is None:
+            return Inventory.get_cart_products(cid, in_cart=in_cart)
+        cart = cart_state.get(cid, lambda: Cart._load(cid))
+        lines = [{'sid': line['sid'], 'name': line['name'], 'description': line['description'],
+                  'quantity': line['quantity'], 'price': Decimal(line['price']), 'invid': line['invid']}
+                 for line in cart['lines'].values() if line['in_cart'] == in_cart]
+        lines.sort(key=lambda line: line['price'], reverse=True)
+        return lines or None
+
+
+    @staticmethod
+    def get_line(cid, invid):
+        """Retrieve one line of a cart (in the cart or saved for later).
+        Returns:
+            dict: The line as returned by get_products(), plus 'in_cart', or None if the cart has no such line.
+        """
+        for in_cart in (True, False):
+            for line in Cart.get_products(cid, in_cart=in_cart) or []:
+                if line['invid'] == int(invid):
+                    return dict(line, in_cart=in_cart)
+        return None
+
+
+    @staticmethod
+    def summary(cid):
+        """Return (total price, total items) of the in-cart items of a cart, or (None, None) if there are none.
+        With the cart state the totals are kept up to date by every change instead of being recomputed.
+        """
+        cart_state = Cart._state()
+        if cart_state is None:
+            lines = Inventory.get_cart_products(cid) or []
+            total_price = sum(Decimal(line['price']) * line['quantity'] for line in lines)
+            total_items = sum(line['quantity'] for line in lines)
+        else:
+            cart = cart_state.get(cid, lambda: Cart._load(cid))
+            total_price, total_items = Decimal(cart['total_price']), cart['total_items']
+        return (total_price, total_items) if total_items else (None, None)
+
+
+    @staticmethod
+    def flush(cid):
+        """Write the cart state of a cart back to Cart_Products if it has changes not written yet."""
+        cart_state = Cart._state()
+        if cart_state is None or not cart_state.store.is_dirty(cid):
+            return
+        version = app.db.run_in_transaction(lambda: Cart.write_back(cid),
+                                            max_attempts=app.config['DB_MAX_TRANSACTION_ATTEMPTS'])
+        if version is not None:
+            cart_state.store.mark_clean(cid, version)
+
+
+    @staticmethod
+    def write_back(cid):
+        """Lock the cart row, then replace the Cart_Products rows of the cart with its cart state if
+        it has changes not written yet; must run inside a transaction. The state is read under the
+        lock, so write-backs from several processes and checkouts of the cart are serialized and
+        always leave the latest state.
+        Returns:
+            int: The version of the state written, or None if nothing was written.
+        """
+        app.db.execute("""
+            SELECT id FROM Carts WHERE id = :cid FOR UPDATE
+        """, cid=cid)
+        cart_state = Cart._state()
+        if cart_state is None or not cart_state.store.is_dirty(cid):
+            return None
+        cart = cart_state.store.get(cid)
+        if cart is None:
+            return None
+        lines = list(cart['lines'].values())
+        app.db.execute("""
+            DELETE FROM Cart_Products
+            WHERE cid = :cid
+        """, cid=cid)
+        # Lines of inventories deleted in the meantime are dropped
+        app.db.execute("""
+            INSERT INTO Cart_Products (cid, invid, quantity, unit_price, in_cart)
+            SELECT :cid, l.invid, l.quantity, l.unit_price, l.in_cart
+            FROM unnest(CAST(:invids AS INT[]), CAST(:quantities AS INT[]),
+                        CAST(:prices AS DECIMAL(12,2)[]), CAST(:in_cart AS BOOLEAN[]))
+                 AS l(invid, quantity, unit_price, in_cart)
+            JOIN Inventories i ON i.id = l.invid
+        """, cid=cid, invids=[line['invid'] for line in lines], quantities=[line['quantity'] for line in lines],
+            prices=[Decimal(line['price']) for line in lines], in_cart=[line['in_cart'] for line in lines])
+        return cart['version']
+
+
+    @staticmethod
+    def remove_checked_out(cid, invids):
+        """Drop the in-cart lines of invids from the cart state, as checkout deletes their rows.
+        Called inside the checkout transaction while write_back() holds the cart row lock, so no
+        write-back can put the purchased lines back into Cart_Products once it commits.
+        Returns:
+            list: The removed lines, for restore_lines() if the transaction does not commit.
+        """
+        cart_state = Cart._state()
+        if cart_state is None:
+            return []
+        removed = []
+
+        def change(cart):
+            del removed[:]
+            for invid in invids:
+                line = cart['lines'].get(str(invid))
+                if line is not None and line['in_cart']:
+                    removed.append(drop_line(cart, invid))
+        # A cart missing from the store is loaded in this transaction, without the purchased rows
+        cart_state.update(cid, change, lambda: Cart._load(cid))
+        return removed
+
+
+    @staticmethod
+    def restore_lines(cid, lines):
+        """Put lines taken out by remove_checked_out() back into the cart state (the checkout did
+        not commit), unless the cart got a line for the same inventory in the meantime."""
+        cart_state = Cart._state()
+        if cart_state is None or not lines:
+            return
+
+        def change(cart):
+            for line in lines:
+                if str(line['invid']) not in cart['lines']:
+                    put_line(cart, line)
+        cart_state.update(cid, change, lambda: Cart._load(cid))
+
+
+    @staticmethod
+    def _state():
+        return app.extensions.get('cart_state')
+
+
+    @staticmethod
+    def _load(cid):
+        """Build the cart state of a cart from Cart_Products (on a cart state miss)."""
+        lines = []
+        for in_cart in (True, False):
+            for line in Inventory.get_cart_products(cid, in_cart=in_cart) or []:
+                lines.append(dict(line, in_cart=in_cart))
+        return new_state(lines)
+
+
+    @staticmethod
+    def _inventory_details(invid):
+        """Return the cart line columns and stock of an inventory, or None if it does not exist."""
+        rows = app.db.read("""
+            SELECT i.sid, COALESCE(id.name, p.name), COALESCE(id.description, p.description), i.current_quantity
+            FROM Inventories i
+            JOIN Products p ON i.pid = p.id
+            LEFT JOIN Inventory_Designs id ON i.id = id.invid
+            WHERE i.id = :invid
+        """, invid=invid)
+        return dict(zip(['sid', 'name', 'description', 'current_quantity'], rows[0])) if rows else None
+
+
+    @staticmethod
+    def _add_to_state(cid, invid, unit_price):
+        """add_to_cart() on the cart state: the stock is read once, then checked against the line."""
+        details = Cart._inventory_details(invid)
+
+        def change(cart):
+            line = cart['lines'].get(str(invid))
+            quantity = line['quantity'] + 1 if line else 1
+            if details is None or details['current_quantity'] < quantity:
+                raise OutOfStock()
+            if line:
+                put_line(cart, dict(line, quantity=quantity))
+            else:
+                put_line(cart, {'invid': int(invid), 'sid': details['sid'], 'name': details['name'],
+                                'description': details['description'], 'quantity': 1,
+                                'price': str(unit_price), 'in_cart': True})
+        return Cart._change(cid, change)
+
+
+    @staticmethod
+    def _set_in_cart(cart, invid, in_cart):
+        line = cart['lines'].get(str(invid))
+        if line is not None:
+            put_line(cart, dict(line, in_cart=in_cart))
+
+
+    @staticmethod
+    def _change(cid, change):
+        """Apply change(cart) to the cart state of a cart; False if it raised OutOfStock or failed."""
+        try:
+            Cart._state().update(cid, change, lambda: Cart._load(cid))
+            return True
+        except OutOfStock:
+            return False
+        except Exception as e:
+            print(str(e))
+            return False
@@ -0,0 +1,132 @@
+from flask import current_app as app
+from collections import defaultdict
+from .inventory import Inventory
+from .product import Product
+from .image import Image
+from .pagination import keyset_condition, sort_key_columns, order_by_clause, limit_clause, build_page
+
+
+class Catalog:
+    """Batched loaders for the inventory cards shown on the catalog pages.
+
+    Each loader returns the same list of dicts the templates consume
+    ({'inventory', 'products', 'images', 'designs', 'version'}) using a
+    fixed number of queries, instead of several queries per inventory.
+    """
+
+    # One row per inventory: the inventory, its product, its primary image
+    # (first inventory image, falling back to the product image), its design
+    # and the version of its rendered card.
+    # {sort_keys} is filled with the keyset sort columns when the query is paginated.
+    DETAILS_QUERY = '''
+        SELECT
+            i.id, i.sid, i.pid, i.current_quantity, i.price,
+            p.id, p.uid, p.name, p.description, p.imgid,
+            COALESCE(ii.id, pimg.id) AS image_id,
+            COALESCE(ii.content, pimg.content) AS image_content,
+            COALESCE(d.name, p.name) AS design_name,
+            COALESCE(d.description, p.description) AS design_description,
+            COALESCE(cv.version, 0) AS card_version
+            {sort_keys}
+        FROM Inventories i
+        JOIN Products p ON i.pid = p.id
+        LEFT JOIN Inventory_Designs d ON d.invid = i.id
+        LEFT JOIN Images pimg ON pimg.id = p.imgid
+        LEFT JOIN Inventory_Card_Versions cv ON cv.invid = i.id
+        LEFT JOIN LATERAL (
+            SELECT img.id, img.content
+            FROM Inventory_Images iimg
+            JOIN Images img ON img.id = iimg.imgid
+            WHERE iimg.invid = i.id
+            ORDER BY iimg.imgid
+            LIMIT 1
+        ) ii ON TRUE
+    '''
+
+
+    @staticmethod
+    def _build_details(row):
+        """Convert one DETAILS_QUERY row into the dict shape used by the templates."""
+        inventory = Inventory(*row[0:5])
+        product = Product(*row[5:10])
+        image = Image(row[10], row[11]) if row[10] is not None else None
+        design = {'invid': inventory.id, 'name': row[12], 'description': row[13]}
+        return {
+            'inventory': inventory,
+            'products': product,
+            'images': image,
+            'designs': design,
+            'version': row[14]
+        }
+
+
+    @staticmethod
+    def get_all_inventories_details(limit=None, cursor=None):
+        """Retrieve card details for every inventory in a single query, ordered by inventory ID.
+        Args:
+            limit (int): Page size, or None to load the whole catalog.
+            cursor (str): Cursor of the previous page (Page.next_cursor).
+        Returns:
+            Page: List of card details plus the cursor of the next page.
+        """
+        order_by = [('i.id', 'ASC')]
+        condition, params = keyset_condition(order_by, cursor)
+        query = Catalog.DETAILS_QUERY.format(sort_keys=', ' + sort_key_columns(order_by))
+        rows = app.db.read(query + f'''
+            {'WHERE ' + condition if condition else ''}
+            ORDER BY {order_by_clause(order_by)}
+            {limit_clause(limit)}
+            ''', **params)
+        return build_page(rows, limit, len(order_by), Catalog._build_details)
+
+
+    @staticmethod
+    def get_inventories_details(inventories, display=True):
+        """Retrieve card details for the given inventories, preserving their order.
+        Args:
+            inventories (list[Inventory]): Inventories to load details for (None entries are skipped).
+            display (bool): If False, 'images' holds every image of the inventory
+                            (or the product image if it has none) instead of a single one.
+        Returns:
+            list: List of dictionaries in the same order as the input inventories.
+        """
+        ids = [inventory.id for inventory in inventories if inventory]
+        if not ids:
+            return []
+        rows = app.db.read(Catalog.DETAILS_QUERY.format(sort_keys='') + '''
+            WHERE i.id = ANY(:ids)
+            ''', ids=ids)
+        details_by_id = {row[0]: Catalog._build_details(row) for row in rows}
+
+        if not display:
+            image_rows = app.db.read('''
+                SELECT iimg.invid, img.id, img.content
+                FROM Inventory_Images iimg
+                JOIN Images img ON img.id = iimg.imgid
+                WHERE iimg.invid = ANY(:ids)
+                ORDER BY iimg.invid, iimg.imgid
+                ''', ids=ids)
+            images_by_id = defaultdict(list)
+            for invid, imgid, content in image_rows:
+                images_by_id[invid].append(Image(imgid, content))
+            for invid, details in details_by_id.items():
+                if invid in images_by_id:
+                    details['images'] = images_by_id[invid]
+
+        # Keep the caller's ordering (e.g. price or rating sort)
+        return [details_by_id[id] for id in ids if id in details_by_id]
+
+
+    @staticmethod
+    def get_all_products_details():
+        """Retrieve every product with its main image in a single query, ordered by product name."""
+        rows = app.db.read('''
+            SELECT p.id, p.uid, p.name, p.description, p.imgid, img.id, img.content
+            FROM Products p
+            LEFT JOIN Images img ON img.id = p.imgid
+            ORDER BY p.name
+            ''')
+        return [{
+            'products': Product(*row[0:5]),
+            'images': Image(row[5], row[6]) if row[5] is not None else None
+        } for row in rows]
@@ -1,4 +1,5 @@
 from flask import current_app as app
+from .cache import category_cache
 
 
 class Category:
@@ -10,44 +11,56 @@ class Category:
 
     @staticmethod
     def get(id):
-        """Retrieve a Category by its ID."""
-        rows = app.db.execute('''
+        """Retrieve a Category by its ID (cached)."""
+        rows = category_cache.get_or_load(('get', id), lambda: app.db.read('''
             SELECT id, label
             FROM Categories
             WHERE id = :id
-            ''', id=id)
+            ''', id=id))
         return Category(*(rows[0])) if rows is not None else None
     
     
     @staticmethod
     def get_all():
-        """Retrieve all Categories, ordered by their labels."""
-        rows = app.db.execute('''
+        """Retrieve all Categories, ordered by their labels (cached)."""
+        rows = category_cache.get_or_load(('all',), lambda: app.db.read('''
             SELECT id, label
             FROM Categories
             ORDER BY label
-            ''')
+            '''))
         return [Category(*row) for row in rows]
     
     
     @staticmethod
     def getExistCategories():
-        """Retrieve distinct categories that are used in existing inventories, ordered by label."""
-        rows = app.db.execute('''
+        """Retrieve distinct categories that are used in existing inventories, ordered by label (cached)."""
+        rows = category_cache.get_or_load(('exist',), lambda: app.db.read('''
             SELECT DISTINCT c.id, c.label
             FROM Inventories i
             JOIN Products p ON i.pid = p.id
             JOIN Tags t ON p.id = t.pid
             JOIN Categories c ON t.cid = c.id
             ORDER BY label
-            ''')
+            '''))
         return [Category(*row) for row in rows]
     
     
+    @staticmethod
+    def invalidate_cache(id=None):
+        """Drop cached category data; call after writing to Categories, Tags or Inventories.
+        Args:
+            id (int): Category whose own row changed; the category lists are always dropped.
+        """
+        keys = [('all',), ('exist',)]
+        if id is not None:
+            keys.append(('get', id))
+        category_cache.invalidate(*keys)
+    
+    
     @staticmethod
     def get_user_ordered_product_category(user_id):
         """Retrieve distinct categories of products ordered by a specific user, including an 'All Categories' option."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT DISTINCT c.id, c.label
             FROM Categories c
             JOIN Tags t ON t.cid = c.id
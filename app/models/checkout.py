@@ -0,0 +1,134 @@
+from flask import current_app as app
+from .inventory import Inventory
+from .cart import Cart
+from .stats import InventoryStats
+
+
+class CheckoutError(Exception):
+    """Raised inside the checkout transaction to roll it back.
+    Attributes:
+        reason (str): 'empty_cart', 'insufficient_balance' or 'insufficient_stock'.
+    """
+    def __init__(self, reason, message):
+        super(CheckoutError, self).__init__(message)
+        self.reason = reason
+
+
+class Checkout:
+    """Turns a cart into an order in a single transaction.
+
+    The number of statements is fixed regardless of the cart size: stock
+    is taken with one Inventory.reserve_many() call, and seller credits,
+    order lines and sales stats are applied set-based from the cart lines.
+    """
+
+    @staticmethod
+    def process(uid, cid):
+        """Check out the in-cart items of cart cid for buyer uid.
+        Every write is conditional (balance and stock are checked by the UPDATE itself) and
+        the cart rows are locked, so the transaction runs at DB_RESERVATION_ISOLATION_LEVEL;
+        deadlocks are retried a bounded number of times.
+        Args:
+            uid (int): Buyer's user ID.
+            cid (int): Buyer's cart ID.
+        Returns:
+            int: ID of the new order.
+        Raises:
+            CheckoutError: If the cart is empty, the buyer's balance is too low or an item
+                           is out of stock; nothing is written in that case.
+        """
+        # Lines taken out of the cart state by an attempt that did not commit
+        removed = []
+
+        def work():
+            if removed:
+                Cart.restore_lines(cid, removed.pop())
+            # Changes still held in the cart state must be in Cart_Products first; the cart row
+            # stays locked until commit, so no write-back runs in between
+            Cart.write_back(cid)
+            oid, invids = Checkout._process(uid, cid)
+            removed.append(Cart.remove_checked_out(cid, invids))
+            return oid
+        try:
+            return app.db.run_in_transaction(work, max_attempts=app.config['DB_MAX_TRANSACTION_ATTEMPTS'],
+                                             isolation_level=app.db.reservation_isolation_level)
+        except Exception:
+            if removed:
+                Cart.restore_lines(cid, removed.pop())
+            raise
+
+
+    @staticmethod
+    def _process(uid, cid):
+        """Checkout statements; must run inside a transaction.
+        Returns:
+            tuple: (ID of the new order, IDs of the inventories bought).
+        """
+        # Lock the cart lines so a concurrent checkout of the same cart waits and then finds it empty
+        rows = app.db.execute('''
+            SELECT invid, quantity, unit_price
+            FROM Cart_Products
+            WHERE cid = :cid AND in_cart = TRUE
+            FOR UPDATE
+            ''', cid=cid)
+        if not rows:
+            raise CheckoutError('empty_cart', "Your cart is empty.")
+        lines = {}
+        for invid, quantity, unit_price in rows:
+            lines[(invid, unit_price)] = lines.get((invid, unit_price), 0) + quantity
+        invids = [invid for invid, _ in lines]
+        prices = [unit_price for _, unit_price in lines]
+        quantities = list(lines.values())
+        total_price = sum(quantity * unit_price for (_, unit_price), quantity in lines.items())
+
+        # Debit the buyer only if the balance covers the whole cart
+        rows = app.db.execute('''
+            UPDATE Users
+            SET balance = balance - :total_price
+            WHERE id = :uid AND balance >= :total_price
+            RETURNING id
+            ''', uid=uid, total_price=total_price)
+        if not rows:
+            raise CheckoutError('insufficient_balance', "Not enough balance.")
+
+        wanted = {}
+        for invid, quantity in zip(invids, quantities):
+            wanted[invid] = wanted.get(invid, 0) + quantity
+        if not all(Inventory.reserve_many(wanted).values()):
+            raise CheckoutError('insufficient_stock', "Some items in your cart are no longer in stock.")
+
+        # Credit every seller with the value of their items
+        app.db.execute('''
+            UPDATE Users u
+            SET balance = u.balance + s.amount
+            FROM (
+                SELECT se.uid, SUM(l.quantity * l.unit_price) AS amount
+                FROM unnest(CAST(:invids AS INT[]), CAST(:quantities AS INT[]), CAST(:prices AS DECIMAL(12,2)[]))
+                     AS l(invid, quantity, unit_price)
+                JOIN Inventories i ON i.id = l.invid
+                JOIN Sellers se ON se.id = i.sid
+                GROUP BY se.uid
+            ) s
+            WHERE u.id = s.uid
+            ''', invids=invids, quantities=quantities, prices=prices)
+
+        rows = app.db.execute('''
+            INSERT INTO Orders(uid, fulfillment_status)
+            VALUES(:uid, 'pending')
+            RETURNING id
+            ''', uid=uid)
+        oid = rows[0][0]
+
+        app.db.execute('''
+            INSERT INTO Order_Products (oid, invid, quantity, price, fulfillment_status)
+            SELECT :oid, l.invid, l.quantity, l.unit_price, 'pending'
+            FROM unnest(CAST(:invids AS INT[]), CAST(:quantities AS INT[]), CAST(:prices AS DECIMAL(12,2)[]))
+                 AS l(invid, quantity, unit_price)
+            ''', oid=oid, invids=invids, quantities=quantities, prices=prices)
+        InventoryStats.record_sales(invids, quantities, prices)
+
+        app.db.execute('''
+            DELETE FROM Cart_Products
+            WHERE cid = :cid AND in_cart = TRUE AND invid = ANY(:invids)
+            ''', cid=cid, invids=invids)
+        return oid, invids
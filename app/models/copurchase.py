@@ -0,0 +1,153 @@
+from collections import defaultdict
+from itertools import permutations
+from flask import current_app as app
+
+
+class Copurchase:
+    """Item-to-item "frequently bought together" index.
+
+    refresh() (run periodically by `flask recommendations copurchases`)
+    folds the orders placed since its last run into the co-occurrence
+    counts and recomputes the top-K neighbor lists of the inventories they
+    touched; pages only read neighbor lists by primary key.
+    """
+
+    column_names = ['inventory_id', 'display_name', 'image_content', 'price', 'current_quantity', 'orders']
+
+
+    @staticmethod
+    def refresh(full=False):
+        """Add the orders placed since the last run to the co-purchase counts, and rebuild
+        the neighbor lists of the inventories in those orders (batch job).
+
+        The counts are C = A^T A, where A is the order x inventory incidence
+        matrix; each batch of orders adds its own (sparse) A^T A, computed
+        from the pairs of inventories within each order. Orders younger than
+        COPURCHASE_SETTLE_SECONDS are left for the next run, so that a
+        checkout still committing when its order ID is passed is not skipped.
+        Args:
+            full (bool): Drop the index and rebuild it from every order.
+        Returns:
+            tuple: (orders, inventories) processed.
+        """
+        with app.db.transaction():
+            if full:
+                app.db.execute('''
+                    TRUNCATE Copurchase_Counts, Inventory_Neighbors, Copurchase_Progress
+                    ''')
+            rows = app.db.execute('''
+                SELECT last_oid
+                FROM Copurchase_Progress
+                ''')
+            last_oid = rows[0][0] if rows else 0
+
+            baskets = defaultdict(set)
+            for oid, invid in app.db.execute('''
+                SELECT o.id, op.invid
+                FROM Orders o
+                JOIN Order_Products op ON o.id = op.oid
+                WHERE o.id > :last_oid
+                AND o.time_created < (current_timestamp AT TIME ZONE 'UTC') - make_interval(secs => :settle)
+                ''', last_oid=last_oid, settle=app.config['COPURCHASE_SETTLE_SECONDS']):
+                baskets[oid].add(invid)
+            if not baskets:
+                return 0, 0
+
+            counts = defaultdict(int)
+            for basket in baskets.values():
+                for pair in permutations(basket, 2):
+                    counts[pair] += 1
+            touched = sorted({invid for invid, _ in counts})
+
+            if counts:
+                app.db.execute('''
+                    INSERT INTO Copurchase_Counts (invid, other_invid, orders)
+                    SELECT *
+                    FROM unnest(CAST(:invids AS INT[]), CAST(:others AS INT[]), CAST(:orders AS INT[]))
+                    ON CONFLICT (invid, other_invid) DO UPDATE SET orders = Copurchase_Counts.orders + EXCLUDED.orders
+                    ''', invids=[pair[0] for pair in counts], others=[pair[1] for pair in counts],
+                    orders=list(counts.values()))
+                app.db.execute('''
+                    DELETE FROM Inventory_Neighbors
+                    WHERE invid = ANY(:touched)
+                    ''', touched=touched)
+                app.db.execute('''
+                    INSERT INTO Inventory_Neighbors (invid, rank, neighbor, orders)
+                    SELECT invid, rank, other_invid, orders
+                    FROM (
+                        SELECT invid, other_invid, orders,
+                               ROW_NUMBER() OVER (PARTITION BY invid ORDER BY orders DESC, other_invid) AS rank
+                        FROM Copurchase_Counts
+                        WHERE invid = ANY(:touched)
+                    ) ranked
+                    WHERE rank <= :k
+                    ''', touched=touched, k=app.config['COPURCHASE_NEIGHBORS'])
+            app.db.execute('''
+                INSERT INTO Copurchase_Progress (id, last_oid)
+                VALUES (TRUE, :last_oid)
+                ON CONFLICT (id) DO UPDATE SET last_oid = EXCLUDED.last_oid
+                ''', last_oid=max(baskets))
+        return len(baskets), len(touched)
+
+
+    @staticmethod
+    def neighbors(invid):
+        """Retrieve the inventories most often bought together with an inventory.
+        Args:
+            invid (int): Inventory ID.
+        Returns:
+            list: Dictionaries of display details (see column_names), most co-purchased first.
+        """
+        rows = app.db.read('''
+            SELECT
+                n.neighbor,
+                COALESCE(id.name, p.name),
+                img.content,
+                i.price,
+                i.current_quantity,
+                n.orders
+            FROM Inventory_Neighbors n
+            JOIN Inventories i ON n.neighbor = i.id
+            JOIN Products p ON i.pid = p.id
+            LEFT JOIN Images img ON img.id = p.imgid
+            LEFT JOIN Inventory_Designs id ON i.id = id.invid
+            WHERE n.invid = :invid
+            ORDER BY n.rank
+            ''', invid=invid)
+        return [dict(zip(Copurchase.column_names, row)) for row in rows]
+
+
+    @staticmethod
+    def for_cart(invids):
+        """Retrieve the inventories most often bought together with a set of cart items,
+        merging their neighbor lists and leaving out the items themselves.
+        Args:
+            invids (list[int]): Inventory IDs in the cart.
+        Returns:
+            list: Dictionaries of display details (see column_names), most co-purchased first.
+        """
+        if not invids:
+            return []
+        rows = app.db.read('''
+            SELECT
+                n.neighbor,
+                COALESCE(id.name, p.name),
+                img.content,
+                i.price,
+                i.current_quantity,
+                n.orders
+            FROM (
+                SELECT neighbor, SUM(orders) AS orders
+                FROM Inventory_Neighbors
+                WHERE invid = ANY(:invids) AND neighbor <> ALL(:invids)
+                GROUP BY neighbor
+                ORDER BY orders DESC, neighbor
+                LIMIT :k
+            ) n
+            JOIN Inventories i ON n.neighbor = i.id
+            JOIN Products p ON i.pid = p.id
+            LEFT JOIN Images img ON img.id = p.imgid
+            LEFT JOIN Inventory_Designs id ON i.id = id.invid
+            ORDER BY n.orders DESC, n.neighbor
+            ''', invids=[int(invid) for invid in invids], k=app.config['COPURCHASE_NEIGHBORS'])
+        return [dict(zip(Copurchase.column_names, row)) for row in rows]
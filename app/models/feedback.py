@@ -29,7 +29,7 @@ class Feedback:
     @staticmethod
     def getBySeller(sid):
         """Retrieve all feedback entries for a specific seller, sorted by upvotes and then by creation time."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, uid, sid, rating, review, time_created, upvote
             FROM Feedbacks
             WHERE sid = :sid
@@ -50,7 +50,7 @@ class Feedback:
     @staticmethod
     def getByUser(uid):
         """Retrieve all feedback entries made by a specific user, ordered by the time they were created."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, uid, sid, rating, review, time_created, upvote
             FROM Feedbacks
             WHERE uid = :uid
@@ -62,7 +62,7 @@ class Feedback:
     @staticmethod
     def get_most_recent_k_feedback(uid,k):
         """Retrieve the most recent 'k' feedback entries made by a specific user."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, uid, sid, rating, review, time_created, upvote
             FROM Feedbacks
             WHERE uid = :uid
@@ -148,17 +148,18 @@ class Feedback:
     def add_upvote(feedback_id, user_id):
         """Add an upvote to a feedback entry and update the feedback's upvote count."""
         try:
-            # Add record to FeedbackUpvotes
-            app.db.execute('''
-                INSERT INTO FeedbackUpvotes (feedback_id, user_id)
-                VALUES (:feedback_id, :user_id)
-            ''', feedback_id=feedback_id, user_id=user_id)
-            # Increment upvote count in Feedback
-            app.db.execute('''
-                UPDATE Feedbacks
-                SET upvote = upvote + 1
-                WHERE id = :feedback_id
-            ''', feedback_id=feedback_id)
+            with app.db.transaction():
+                # Add record to FeedbackUpvotes
+                app.db.execute('''
+                    INSERT INTO FeedbackUpvotes (feedback_id, user_id)
+                    VALUES (:feedback_id, :user_id)
+                ''', feedback_id=feedback_id, user_id=user_id)
+                # Increment upvote count in Feedback
+                app.db.execute('''
+                    UPDATE Feedbacks
+                    SET upvote = upvote + 1
+                    WHERE id = :feedback_id
+                ''', feedback_id=feedback_id)
             return True
         except Exception as e:
             # Handle errors like duplicate insertion attempts
@@ -170,12 +171,13 @@ class Feedback:
     def add_images_to_feedback(fid, image_ids):
         """Adds image references to a feedback."""
         try:
-            # Insert new images
-            for imgid in image_ids:
-                app.db.execute('''
-                    INSERT INTO Feedback_Images (fid, imgid)
-                    VALUES (:fid, :imgid)
-                ''', fid=fid, imgid=imgid)
+            with app.db.transaction():
+                # Insert new images
+                for imgid in image_ids:
+                    app.db.execute('''
+                        INSERT INTO Feedback_Images (fid, imgid)
+                        VALUES (:fid, :imgid)
+                    ''', fid=fid, imgid=imgid)
             return True
         except Exception as e:
             print(f"Error in adding images to feedback: {e}")
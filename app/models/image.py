@@ -1,32 +1,119 @@
 from flask import current_app as app
-from werkzeug.utils import secure_filename
+import hashlib
+import io
 import os
+import re
+import tempfile
+from PIL import Image as PILImage, ImageOps
+from .cache import image_cache
+from .card import InventoryCard
 
 
 class Image:
-    def __init__(self, id, content):
-        """Initialize a new Image instance with an ID and file path/content."""
+    """An uploaded image; content is its file name under static/images.
+
+    Uploads are stored under the hash of their bytes (<hash>.jpeg, re-encoded),
+    next to resized variants <hash>_<variant>.jpeg, so a file name never
+    changes meaning and can be cached by browsers forever. Older images named
+    after their ID (e.g. 12.jpeg) have no variants until `flask images rehash`
+    converts them; variant() falls back to the original for those.
+
+    Uploads are processed in the background (see app/image_worker.py): the
+    row is inserted as 'pending' with the placeholder as its content, and the
+    worker publishes the files and sets the row 'ready' (or 'failed').
+    """
+
+    # Variant name -> bounding box (pixels) of the resized copy
+    VARIANTS = {'thumb': 160, 'card': 480, 'detail': 1200}
+    HASHED_NAME = re.compile(r'^([0-9a-f]{16})\.jpeg$')
+    JPEG_QUALITY = 82
+    # Shown in place of an upload until the worker has processed it
+    PLACEHOLDER = 'placeholder.svg'
+
+
+    def __init__(self, id, content, status='ready'):
+        """Initialize a new Image instance with an ID, file path/content and processing status."""
         self.id = id
         self.content = content
+        self.status = status
     
     
     @staticmethod
-    def save_image(file, imgid):
-        """Save an image to the designated upload folder."""
-        if file:
-            filename = secure_filename(f'{imgid}.jpeg')
-            upload_folder = 'app/static/images'
-            filepath = os.path.join(upload_folder, filename)
-            file.save(filepath)
+    def folder():
+        return os.path.join(app.root_path, 'static', 'images')
+
+
+    @staticmethod
+    def variant(content, variant):
+        """Return the static path of a variant ('thumb', 'card' or 'detail') of an image file,
+        or of the file itself if it was stored before variants existed."""
+        match = Image.HASHED_NAME.match(content or '')
+        if match and variant in Image.VARIANTS:
+            return f'images/{match.group(1)}_{variant}.jpeg'
+        return f'images/{content}'
+
+
+    @staticmethod
+    def check(data):
+        """Raise PIL.UnidentifiedImageError unless data starts like an image (only the header is read)."""
+        PILImage.open(io.BytesIO(data)).close()
+
+
+    @staticmethod
+    def store(data, folder=None):
+        """Write image bytes and their variants under a content-hash name (once per distinct content).
+        Re-encoding drops all metadata of the upload (EXIF, GPS, comments); the
+        orientation is applied to the pixels first.
+        Args:
+            data (bytes): The uploaded file.
+            folder (str): Destination directory; defaults to folder(), which needs an app context.
+        Returns:
+            str: The file name to store in Images.content.
+        Raises:
+            PIL.UnidentifiedImageError: If data is not an image.
+        """
+        folder = folder or Image.folder()
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        filename = f'{digest}.jpeg'
+        if os.path.exists(os.path.join(folder, filename)):
             return filename
+        with PILImage.open(io.BytesIO(data)) as original:
+            picture = ImageOps.exif_transpose(original).convert('RGB')
+        for variant, size in Image.VARIANTS.items():
+            resized = picture.copy()
+            resized.thumbnail((size, size))
+            Image._write(resized, folder, f'{digest}_{variant}.jpeg')
+        # The full-size file goes last: once it exists, every variant does
+        Image._write(picture, folder, filename)
+        return filename
+
+
+    @staticmethod
+    def _write(picture, folder, filename):
+        """Save a JPEG atomically, so concurrent uploads of the same content never expose a partial file."""
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                picture.save(f, 'JPEG', quality=Image.JPEG_QUALITY, optimize=True, progressive=True)
+            os.replace(tmp, os.path.join(folder, filename))
+        except Exception:
+            os.remove(tmp)
+            raise
+
+
+    @staticmethod
+    def save_image(file):
+        """Store an uploaded file (see store()) and return its file name, or None if there is no file."""
+        if file:
+            return Image.store(file.read())
         return None
     
         
     @staticmethod
     def get_all():
         """Retrieve all image records from the database."""
-        rows = app.db.execute('''
-            SELECT id, content
+        rows = app.db.read('''
+            SELECT id, content, status
             FROM Images
         ''')
         return [Image(*row) for row in rows] if rows else None
@@ -34,43 +121,117 @@ class Image:
 
     @staticmethod
     def get(id):
-        """Retrieve a single image by its ID."""
-        rows = app.db.execute('''
-            SELECT id, content
+        """Retrieve a single image by its ID (cached)."""
+        rows = image_cache.get_or_load(('get', id), lambda: app.db.read('''
+            SELECT id, content, status
             FROM Images
             WHERE id = :id
-            ''', id=id)
+            ''', id=id))
         return Image(*(rows[0])) if rows is not None else None
     
     
     @staticmethod
     def add_image(file):
-        """Add a new image to the database, saving it under a filename based on its database ID."""
+        """Add a new image record for an upload and queue the upload for processing.
+        The record shows the placeholder until the image worker has published the files.
+        Returns:
+            Image: The pending image, or None if the file is missing or not an image.
+        """
         try:
-            # Insert a placeholder record to generate an ID
+            data = file.read() if file else None
+            if not data:
+                raise Exception("Failed to save image.")
+            Image.check(data)
+
             result = app.db.execute('''
-                INSERT INTO Images (content)
-                VALUES ('placeholder')
+                INSERT INTO Images (content, status)
+                VALUES (:content, 'pending')
                 RETURNING id
-            ''')
-            imgid = result[0][0]
+            ''', content=Image.PLACEHOLDER)
+            image = Image(result[0][0], Image.PLACEHOLDER, 'pending')
+            Image._enqueue(image.id, data)
+            return image
+        except Exception as e:
+            print(f"Error adding image: {e}")
+            return None
 
-            # Save the file with the new ID
-            filename = Image.save_image(file, imgid)
-            if not filename:
-                raise Exception("Failed to save image.")
 
-            # Update the record with the correct filename
+    @staticmethod
+    def replace_image(id, file):
+        """Queue an upload to replace the content of an existing image record; the current
+        content stays visible until the new one is published. The old file is kept: pages
+        cached with its URL stay valid, and other records may share the same content."""
+        try:
+            data = file.read() if file else None
+            if not data:
+                raise Exception("Failed to save image.")
+            Image.check(data)
             app.db.execute('''
                 UPDATE Images
-                SET content = :content
+                SET status = 'pending'
                 WHERE id = :id
-            ''', content=filename, id=imgid)
-
-            return Image(imgid, filename)
+            ''', id=id)
+            image_cache.invalidate()
+            Image._enqueue(id, data)
+            return Image.get(id)
         except Exception as e:
-            print(f"Error adding image: {e}")
+            print(f"Error replacing image: {e}")
             return None
+
+
+    @staticmethod
+    def _enqueue(id, data):
+        """Hand an upload to the image worker once the row it belongs to is committed."""
+        worker = app.extensions['image_worker']
+        app.db.after_commit(lambda: worker.submit(id, data))
+
+
+    @staticmethod
+    def publish(id, filename):
+        """Point an image record at its processed file and mark it ready (called by the image worker).
+        Cards showing the image are re-rendered.
+        """
+        with app.db.transaction():
+            app.db.execute('''
+                UPDATE Images
+                SET content = :content, status = 'ready'
+                WHERE id = :id
+            ''', content=filename, id=id)
+            invids = [row[0] for row in app.db.execute('''
+                SELECT invid
+                FROM Inventory_Images
+                WHERE imgid = :id
+            ''', id=id)]
+            pids = [row[0] for row in app.db.execute('''
+                SELECT id
+                FROM Products
+                WHERE imgid = :id
+            ''', id=id)]
+            InventoryCard.bump(invids=invids, pids=pids)
+        image_cache.invalidate()
+
+
+    @staticmethod
+    def mark_failed(id):
+        """Mark an image whose upload could not be processed; it keeps its current content."""
+        app.db.execute('''
+            UPDATE Images
+            SET status = 'failed'
+            WHERE id = :id
+        ''', id=id)
+        image_cache.invalidate()
+
+
+    @staticmethod
+    def get_unfinished():
+        """Retrieve the images still waiting for (or having failed) processing."""
+        rows = app.db.read('''
+            SELECT id, content, status
+            FROM Images
+            WHERE status <> 'ready'
+            ORDER BY id
+        ''')
+        return [Image(*row) for row in rows]
         
         
     @staticmethod
@@ -81,6 +242,7 @@ class Image:
                 DELETE FROM Images
                 WHERE id = :id
             ''', id=id)
+            image_cache.invalidate()
         except Exception as e:
             print(f"Error deleting image: {e}")
 
@@ -89,13 +251,13 @@ class Image:
     @staticmethod
     def get_product_image(pid, display=True):
         """Retrieve the main image for a product; if display is True, return a single Image instance."""
-        rows = app.db.execute('''
+        rows = image_cache.get_or_load(('product', pid), lambda: app.db.read('''
             SELECT i.id, i.content
             FROM images i
             JOIN products p ON i.id = p.imgid
             WHERE p.id = :pid
             ''',
-        pid=pid)
+        pid=pid))
         if display:
             return Image(*(rows[0])) if rows is not None else None
         else:
@@ -106,13 +268,13 @@ class Image:
     @staticmethod
     def get_inventory_image(invid, display=True):
         """Retrieve the main image for an inventory item; if display is True, return a single Image instance."""
-        rows = app.db.execute('''
+        rows = image_cache.get_or_load(('inventory', invid), lambda: app.db.read('''
             SELECT i.id, i.content
             FROM images i
             JOIN inventory_images ii ON i.id = ii.imgid
             WHERE ii.invid = :invid
             ''',
-        invid=invid)
+        invid=invid))
         if display:
             return Image(*(rows[0])) if rows is not None else None
         else:
@@ -122,20 +284,26 @@ class Image:
     @staticmethod
     def has_inventory_images(invid):
         """Check if there are any images linked to a specific inventory item."""
-        rows = app.db.execute('''
+        rows = image_cache.get_or_load(('inventory', invid), lambda: app.db.read('''
             SELECT i.id, i.content
             FROM images i
             JOIN inventory_images ii ON i.id = ii.imgid
             WHERE ii.invid = :invid
-            ''', invid=invid)
+            ''', invid=invid))
         return len(rows) > 0
     
     
+    @staticmethod
+    def invalidate_inventory_images(invid):
+        """Drop the cached images of an inventory item after its Inventory_Images rows change."""
+        image_cache.invalidate(('inventory', invid))
+    
+    
     ## Feedback
     @staticmethod
     def get_feedback_image(fid):
         """Retrieve all images linked to a feedback entry."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT i.id, i.content
             FROM images i
             JOIN feedback_images fi ON i.id = fi.imgid
@@ -148,7 +316,7 @@ class Image:
     @staticmethod
     def get_review_image(rid):
         """Retrieve all images linked to a review entry."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT i.id, i.content
             FROM images i
             JOIN review_images ri ON i.id = ri.imgid
@@ -1,5 +1,11 @@
 from flask import current_app as app
 from collections import defaultdict
+from .category import Category
+from .image import Image
+from .card import InventoryCard
+from .pagination import Page, keyset_condition, sort_key_columns, order_by_clause, limit_clause, build_page
+from .search import InventorySearch
+from .stats import InventoryStats
 
 class Inventory:
     """ Represents an inventory item in the system. """
@@ -27,7 +33,7 @@ class Inventory:
     @staticmethod
     def getSameProductById(id):
         """ Retrieve inventories of the same product by its id """
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, sid, pid, current_quantity, price
             FROM Inventories
             WHERE pid = (
@@ -40,21 +46,25 @@ class Inventory:
 
 
     @staticmethod
-    def getBySeller(sid):
-        """ Retrieve inventories by seller ID. """
-        rows = app.db.execute('''
-            SELECT id, sid, pid, current_quantity, price
+    def getBySeller(sid, limit=None, cursor=None):
+        """ Retrieve inventories by seller ID, optionally one page at a time (see getByPrice). """
+        order_by = [('id', 'ASC')]
+        condition, params = keyset_condition(order_by, cursor)
+        rows = app.db.read(f'''
+            SELECT id, sid, pid, current_quantity, price, {sort_key_columns(order_by)}
             FROM Inventories
             WHERE sid = :sid
-            ORDER BY id
-            ''', sid=sid)
-        return [Inventory(*row) for row in rows]
+            {'AND ' + condition if condition else ''}
+            ORDER BY {order_by_clause(order_by)}
+            {limit_clause(limit)}
+            ''', sid=sid, **params)
+        return build_page(rows, limit, len(order_by), lambda row: Inventory(*row))
 
 
     @staticmethod
     def getByProduct(pid):
         """ Retrieve inventories by product ID. """
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, sid, pid, current_quantity, price
             FROM Inventories
             WHERE pid = :pid
@@ -66,7 +76,7 @@ class Inventory:
     @staticmethod
     def traceCreatorInventory(sid, pid):
         """ Get the original seller's product's inventory information. """
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, sid, pid, current_quantity, price
             FROM Inventories
             WHERE pid = :pid
@@ -77,14 +87,18 @@ class Inventory:
 
 
     @staticmethod
-    def get_all():
-        """ Retrieve all inventories. """
-        rows = app.db.execute('''
-            SELECT id, sid, pid, current_quantity, price
+    def get_all(limit=None, cursor=None):
+        """ Retrieve all inventories, optionally one page at a time (see getByPrice). """
+        order_by = [('id', 'ASC')]
+        condition, params = keyset_condition(order_by, cursor)
+        rows = app.db.read(f'''
+            SELECT id, sid, pid, current_quantity, price, {sort_key_columns(order_by)}
             FROM Inventories
-            ORDER BY id
-            ''')
-        return [Inventory(*row) for row in rows]
+            {'WHERE ' + condition if condition else ''}
+            ORDER BY {order_by_clause(order_by)}
+            {limit_clause(limit)}
+            ''', **params)
+        return build_page(rows, limit, len(order_by), lambda row: Inventory(*row))
 
 
     # Methods for adding or deleting inventory
@@ -92,12 +106,18 @@ class Inventory:
     def addNewInventory(sid, pid, current_quantity, price):
         """ Add a new inventory item. """
         try:
-            rows = app.db.execute("""
-                INSERT INTO Inventories(sid, pid, current_quantity, price)
-                VALUES(:sid, :pid, :current_quantity, :price)
-                RETURNING id
-                """, sid=sid, pid=pid, current_quantity=current_quantity, price=price)
-            id = rows[0][0]
+            with app.db.transaction():
+                rows = app.db.execute("""
+                    INSERT INTO Inventories(sid, pid, current_quantity, price)
+                    VALUES(:sid, :pid, :current_quantity, :price)
+                    RETURNING id
+                    """, sid=sid, pid=pid, current_quantity=current_quantity, price=price)
+                id = rows[0][0]
+                InventoryStats.create(id)
+                InventorySearch.refresh(invids=[id])
+                InventoryCard.bump(invids=[id])
+            # The set of categories with inventories may have grown
+            Category.invalidate_cache()
             return Inventory.getById(id)
         except Exception as e:
             print(str(e))
@@ -108,10 +128,18 @@ class Inventory:
     def deleteById(id):
         """ Delete an inventory by ID. """
         try:
-            app.db.execute("""
-                DELETE FROM Inventories
-                WHERE id = :id
-                """, id=id)
+            with app.db.transaction():
+                # Explicitly rather than by cascade, so that the pages keyed on card versions see it
+                app.db.execute("""
+                    DELETE FROM Inventory_Card_Versions
+                    WHERE invid = :id
+                    """, id=id)
+                app.db.execute("""
+                    DELETE FROM Inventories
+                    WHERE id = :id
+                    """, id=id)
+            Category.invalidate_cache()
+            Image.invalidate_inventory_images(id)
             return True
         except Exception as e:
             print(str(e))
@@ -130,6 +158,7 @@ class Inventory:
                 RETURNING id
                 """, current_quantity=new_info['current_quantity'],
                 price=new_info['price'], id=invid)
+            InventoryCard.bump(invids=[invid])
             return True
         except Exception as e:
             print(f"Error updating inventory: {e}")
@@ -146,6 +175,8 @@ class Inventory:
                 WHERE invid = :invid
                 RETURNING invid
                 """, name=new_info['name'], description=new_info['description'], invid=invid)
+            InventorySearch.refresh(invids=[invid])
+            InventoryCard.bump(invids=[invid])
             return True
         except Exception as e:
             print(f"Error updating inventory design: {e}")
@@ -170,6 +201,38 @@ class Inventory:
             return None
 
 
+    # Stock reservations
+    @staticmethod
+    def reserve_many(quantities):
+        """ Take stock for several inventories at once (e.g. a whole cart) with one conditional
+        decrement, so concurrent buyers of the same inventory never oversell and never have to
+        retry: the `current_quantity >= quantity` check is re-evaluated against the latest row.
+        Items that are out of stock are left untouched; callers that need all-or-nothing
+        behavior run this inside app.db.transaction() and roll back when an item fails.
+        Args:
+            quantities (dict): Maps inventory ID to the number of units to take.
+        Returns:
+            dict: Maps each inventory ID to True if it was reserved, False otherwise.
+        Raises:
+            DBAPIError: Database errors are not swallowed, so an enclosing transaction can be retried.
+        """
+        # Sorted so that concurrent reservations lock shared inventories in the same order
+        invids = sorted(int(invid) for invid in quantities)
+        if not invids:
+            return {}
+        rows = app.db.run_in_transaction(lambda: app.db.execute("""
+            UPDATE Inventories i
+            SET current_quantity = i.current_quantity - r.quantity
+            FROM unnest(CAST(:invids AS INT[]), CAST(:quantities AS INT[])) AS r(invid, quantity)
+            WHERE i.id = r.invid AND r.quantity > 0 AND i.current_quantity >= r.quantity
+            RETURNING i.id
+            """, invids=invids, quantities=[int(quantities[invid]) for invid in sorted(quantities, key=int)]),
+            max_attempts=app.config['DB_MAX_TRANSACTION_ATTEMPTS'],
+            isolation_level=app.db.reservation_isolation_level)
+        reserved = {row[0] for row in rows}
+        return {invid: int(invid) in reserved for invid in quantities}
+
+
     @staticmethod
     def get_order_products(oid):
         """ Fetches products from a specific order.
@@ -180,7 +243,7 @@ class Inventory:
         """
         # [Add description about the SQL query and its result structure]
         column_names = ['sid', 'invid', 'name', 'description', 'quantity', 'price', 'status', 'fulfilled_time']
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT 
                 s.id AS sid, 
                 i.id AS invid,
@@ -212,7 +275,7 @@ class Inventory:
         """
         # [Add description about the SQL query and its result structure]
         column_names = ['name', 'price', 'quantity']
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT 
                 p.name AS name, 
                 op.price AS price,
@@ -239,7 +302,7 @@ class Inventory:
             list: List of dictionaries containing product details in the cart
         """
         column_names = ['sid', 'name', 'description', 'quantity', 'price', 'invid']
-        rows = app.db.execute('''
+        rows = app.db.read('''
                 SELECT 
                     s.id AS sid, 
                     COALESCE(id.name, p.name) AS name, 
@@ -274,7 +337,7 @@ class Inventory:
             list: List of dictionaries containing design details for the inventory
         """
         column_names = ['invid', 'name', 'description']
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT 
                 i.id AS invid,
                 COALESCE(id.name, p.name) AS name, 
@@ -301,7 +364,7 @@ class Inventory:
         Returns:
             dict: A dictionary mapping product names to their highest prices
         """
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT pid, MAX(price) AS max_price
             FROM Inventories
             GROUP BY pid
@@ -313,7 +376,7 @@ class Inventory:
         pid_to_name = {}
         for row in rows:
             pid = row[0]
-            product_name = app.db.execute('''
+            product_name = app.db.read('''
                 SELECT name
                 FROM Products
                 WHERE id = :pid
@@ -333,147 +396,195 @@ class Inventory:
 
     # Search inventories by keyword
     @staticmethod
-    def getByKeyword(keyword):
-        """ Searches inventory items by keyword.
+    def getByKeyword(keyword, limit=None, cursor=None):
+        """ Searches inventory items by keyword using the full-text search index.
         Args:
-            keyword (str): Keyword to search for in product descriptions, names, or categories
+            keyword (str): Words to search for (as prefixes) in product and design names and descriptions, or category labels
+            limit (int): Page size, or None to return every match
+            cursor (str): Cursor of the previous page
         Returns:
-            list[Inventory]: A list of Inventory objects that match the keyword
+            Page[Inventory]: A list of Inventory objects that match the keyword, best matches first
         """
-        safe_keyword = f'%{keyword}%'
-        rows = app.db.execute('''
-            SELECT DISTINCT i.id, i.sid, i.pid, i.current_quantity, i.price
+        search_query = InventorySearch.to_query(keyword)
+        if not search_query:
+            return Page()
+        order_by = [(InventorySearch.RANK, 'DESC'), ('i.id', 'ASC')]
+        condition, params = keyset_condition(order_by, cursor)
+        rows = app.db.read(f'''
+            SELECT i.id, i.sid, i.pid, i.current_quantity, i.price, {sort_key_columns(order_by)}
             FROM Inventories i
-            JOIN Products p ON i.pid = p.id
-            JOIN Tags t ON p.id = t.pid
-            JOIN Categories c ON c.id = t.cid
-            WHERE p.description LIKE :keyword or c.label LIKE :keyword or p.name LIKE :keyword
-            ''', keyword=safe_keyword)
-        return [Inventory(*row) for row in rows]
+            JOIN Inventory_Search s ON s.invid = i.id
+            WHERE {InventorySearch.MATCH}
+            {'AND ' + condition if condition else ''}
+            ORDER BY {order_by_clause(order_by)}
+            {limit_clause(limit)}
+            ''', search_query=search_query, **params)
+        return build_page(rows, limit, len(order_by), lambda row: Inventory(*row))
 
 
     # Retrieve inventories by category
     @staticmethod
-    def getByCategory(cid):
+    def getByCategory(cid, limit=None, cursor=None):
         """ Fetches inventory items associated with a specific category.
         Args:
             cid (int): Category ID
+            limit (int): Page size, or None to return every match
+            cursor (str): Cursor of the previous page
         Returns:
-            list[Inventory]: A list of Inventory objects within the specified category
+            Page[Inventory]: A list of Inventory objects within the specified category, ordered by ID
         """
-        rows = app.db.execute('''
-            SELECT i.id, i.sid, i.pid, i.current_quantity, i.price
+        order_by = [('i.id', 'ASC')]
+        condition, params = keyset_condition(order_by, cursor)
+        rows = app.db.read(f'''
+            SELECT i.id, i.sid, i.pid, i.current_quantity, i.price, {sort_key_columns(order_by)}
             FROM Inventories i
             JOIN Products p ON i.pid = p.id
             JOIN Tags t ON p.id = t.pid
             WHERE t.cid = :cid
-            ''', cid=cid)
-        return [Inventory(*row) for row in rows]
+            {'AND ' + condition if condition else ''}
+            ORDER BY {order_by_clause(order_by)}
+            {limit_clause(limit)}
+            ''', cid=cid, **params)
+        return build_page(rows, limit, len(order_by), lambda row: Inventory(*row))
 
 
     # Retrieve inventories sorted by price in ascending or descending order
     @staticmethod
-    def getByPrice(order='asc'):
+    def getByPrice(order='asc', limit=None, cursor=None):
         """ Fetches inventory items sorted by price either in ascending or descending order.
+        Results are paginated by keyset: the cursor encodes the (price, id) of the last row
+        of the previous page, so pages stay stable while new inventories are inserted.
         Args:
             order (str): Sort order, 'asc' for ascending, 'desc' for descending.
+            limit (int): Page size, or None to return every inventory.
+            cursor (str): Cursor of the previous page (Page.next_cursor).
         Returns:
-            list[Inventory]: A list of Inventory objects sorted by price.
+            Page[Inventory]: A list of Inventory objects sorted by price.
         """
         order_clause = 'ASC' if order == 'asc' else 'DESC'
+        order_by = [('price', order_clause), ('id', order_clause)]
+        condition, params = keyset_condition(order_by, cursor)
         query = f'''
-            SELECT id, sid, pid, current_quantity, price
+            SELECT id, sid, pid, current_quantity, price, {sort_key_columns(order_by)}
             FROM Inventories
-            ORDER BY price {order_clause}
+            {'WHERE ' + condition if condition else ''}
+            ORDER BY {order_by_clause(order_by)}
+            {limit_clause(limit)}
         '''
-        rows = app.db.execute(query)
-        return [Inventory(*row) for row in rows]
+        rows = app.db.read(query, **params)
+        return build_page(rows, limit, len(order_by), lambda row: Inventory(*row))
     
     
     # Retrieve inventories sorted by average rating in ascending or descending order
     @staticmethod
-    def getByRating(order='desc'):
+    def getByRating(order='desc', limit=None, cursor=None):
         """ Fetches inventory items sorted by average rating either in ascending or descending order.
         Args:
             order (str): Sort order, 'asc' for ascending, 'desc' for descending.
+            limit (int): Page size, or None to return every inventory.
+            cursor (str): Cursor of the previous page (see getByPrice).
         Returns:
-            list[Inventory]: A list of Inventory objects sorted by average rating.
+            Page[Inventory]: A list of Inventory objects sorted by average rating.
         """
         order_clause = 'DESC' if order == 'desc' else 'ASC'
+        order_by = [(InventoryStats.AVERAGE_RATING, order_clause), ('st.invid', order_clause)]
+        condition, params = keyset_condition(order_by, cursor)
         query = f'''
             SELECT 
                 i.id AS id,
-                i.pid AS pid,
                 i.sid AS sid,
+                i.pid AS pid,
                 i.current_quantity AS current_quantity,
-                i.price AS price
+                i.price AS price,
+                {sort_key_columns(order_by)}
             FROM 
-                Inventories i
-            LEFT JOIN 
-                Reviews r ON i.id = r.invid
-            GROUP BY 
-                i.id, i.pid, i.sid, i.current_quantity, i.price
+                Inventory_Stats st
+            JOIN Inventories i ON i.id = st.invid
+            {'WHERE ' + condition if condition else ''}
             ORDER BY 
-                COALESCE(AVG(r.rating), 0) {order_clause};
+                {order_by_clause(order_by)}
+            {limit_clause(limit)}
         '''
-        rows = app.db.execute(query)
-        return [Inventory(*row) for row in rows]
+        rows = app.db.read(query, **params)
+        return build_page(rows, limit, len(order_by), lambda row: Inventory(*row))
     
     
     # Retrieve inventories sorted by total sales in ascending or descending order
     @staticmethod
-    def getBySales(order='desc'):
+    def getBySales(order='desc', limit=None, cursor=None):
         """ Fetches inventory items sorted by total sales either in ascending or descending order.
         Args:
             order (str): Sort order, 'asc' for ascending, 'desc' for descending.
+            limit (int): Page size, or None to return every inventory.
+            cursor (str): Cursor of the previous page (see getByPrice).
         Returns:
-            list[Inventory]: A list of Inventory objects sorted by total sales.
+            Page[Inventory]: A list of Inventory objects sorted by total sales.
         """
         order_clause = 'DESC' if order == 'desc' else 'ASC'
+        order_by = [(InventoryStats.UNITS_SOLD, order_clause), ('st.invid', order_clause)]
+        condition, params = keyset_condition(order_by, cursor)
         query = f'''
             SELECT 
                 i.id AS id,
-                i.pid AS pid,
                 i.sid AS sid,
+                i.pid AS pid,
                 i.current_quantity AS current_quantity,
-                i.price AS price
+                i.price AS price,
+                {sort_key_columns(order_by)}
             FROM 
-                Inventories i
-            LEFT JOIN 
-                Order_Products op ON i.id = op.invid
-            GROUP BY 
-                i.id, i.pid, i.sid, i.current_quantity, i.price
+                Inventory_Stats st
+            JOIN Inventories i ON i.id = st.invid
+            {'WHERE ' + condition if condition else ''}
             ORDER BY 
-                COALESCE(SUM(op.quantity), 0) {order_clause};
+                {order_by_clause(order_by)}
+            {limit_clause(limit)}
         '''
-        rows = app.db.execute(query)
-        return [Inventory(*row) for row in rows]
+        rows = app.db.read(query, **params)
+        return build_page(rows, limit, len(order_by), lambda row: Inventory(*row))
     
     
     @staticmethod
-    def search_inventory_by_form(sid=None, keyword=None, category=None, sort=None, rating_filter=None, price_min=None, price_max=None):
+    def search_inventory_by_form(sid=None, keyword=None, category=None, sort=None, rating_filter=None, price_min=None, price_max=None, limit=None, cursor=None):
         """
-        Search and filter inventory items based on various criteria including seller ID, keywords in the product name or description,
-        category, and sorting by price, rating, or sales volume. Optionally, filter by minimum rating and price range.
+        Search and filter inventory items based on various criteria including seller ID, keywords (full-text search over
+        product and design names and descriptions and category labels), category, and sorting by price, rating, or sales
+        volume. Optionally, filter by minimum rating and price range.
+        Results are ordered by the selected criteria (by search rank when only a keyword is given) and then by ID,
+        and paginated by keyset when a limit is given.
         """
-        query = """
+        search_query = InventorySearch.to_query(keyword)
+
+        # Handling sorting
+        order_by = []
+        if sort:
+            if 'price_asc' in sort:
+                order_by.append(("i.price", "ASC"))
+            if 'price_desc' in sort:
+                order_by.append(("i.price", "DESC"))
+            if 'rating_asc' in sort:
+                order_by.append((InventoryStats.AVERAGE_RATING, "ASC"))
+            if 'rating_desc' in sort:
+                order_by.append((InventoryStats.AVERAGE_RATING, "DESC"))
+            if 'sales_asc' in sort:
+                order_by.append((InventoryStats.UNITS_SOLD, "ASC"))
+            if 'sales_desc' in sort:
+                order_by.append((InventoryStats.UNITS_SOLD, "DESC"))
+        if search_query and not order_by:
+            order_by.append((InventorySearch.RANK, "DESC"))
+        # Tie-break on ID so every page boundary is well defined
+        order_by.append(("i.id", "ASC"))
+
+        query = f"""
             SELECT i.id AS id,
-                i.pid AS pid,
                 i.sid AS sid,
+                i.pid AS pid,
                 i.current_quantity AS current_quantity,
-                i.price AS price
+                i.price AS price,
+                {sort_key_columns(order_by)}
             FROM Inventories i
             JOIN Products p ON i.pid = p.id
-            LEFT JOIN (
-                SELECT invid, COALESCE(AVG(rating), 0) AS average_rating,COALESCE(COUNT(id), 0) AS total_reviews
-                FROM Reviews
-                GROUP BY invid
-            ) r ON r.invid = i.id
-            LEFT JOIN (
-                SELECT invid, COALESCE(SUM(quantity), 0) AS total_sales
-                FROM Order_Products
-                GROUP BY invid
-            ) op ON op.invid = i.id
+            JOIN Inventory_Stats st ON st.invid = i.id
+            {'JOIN Inventory_Search s ON s.invid = i.id' if search_query else ''}
             WHERE 1=1
         """
         params = {}
@@ -482,16 +593,16 @@ class Inventory:
             query += " AND i.sid = :sid"
             params['sid'] = sid
 
-        if keyword:
-            query += " AND (LOWER(p.name) LIKE :keyword OR LOWER(p.description) LIKE :keyword)"
-            params['keyword'] = f'%{keyword.lower()}%'
+        if search_query:
+            query += " AND " + InventorySearch.MATCH
+            params['search_query'] = search_query
 
         if category:
             query += " AND EXISTS (SELECT 1 FROM Tags t JOIN Categories c ON t.cid = c.id WHERE t.pid = p.id AND LOWER(c.label) LIKE :category)"
             params['category'] = f'%{category.lower()}%'
 
         if rating_filter:
-            query += " AND COALESCE(r.average_rating, 0) >= :rating_filter"
+            query += f" AND {InventoryStats.AVERAGE_RATING} >= :rating_filter"
             params['rating_filter'] = rating_filter
 
         if price_min is not None:
@@ -502,32 +613,19 @@ class Inventory:
             query += " AND i.price <= :price_max"
             params['price_max'] = price_max
 
-        query += " GROUP BY i.id, i.pid, i.sid, i.current_quantity, i.price, average_rating, total_sales"
+        condition, cursor_params = keyset_condition(order_by, cursor)
+        if condition:
+            query += " AND " + condition
+            params.update(cursor_params)
 
-        # Handling sorting
-        if sort:
-            sorting_criteria = []
-            if 'price_asc' in sort:
-                sorting_criteria.append("i.price ASC")
-            if 'price_desc' in sort:
-                sorting_criteria.append("i.price DESC")
-            if 'rating_asc' in sort:
-                sorting_criteria.append("average_rating ASC")
-            if 'rating_desc' in sort:
-                sorting_criteria.append("average_rating DESC")
-            if 'sales_asc' in sort:
-                sorting_criteria.append("total_sales ASC")
-            if 'sales_desc' in sort:
-                sorting_criteria.append("total_sales DESC")
-
-            if sorting_criteria:
-                query += " ORDER BY " + ", ".join(sorting_criteria)
+        query += " ORDER BY " + order_by_clause(order_by)
+        query += " " + limit_clause(limit)
 
         print("Executing SQL:", query)
         print("With parameters:", params)
-        rows = app.db.execute(query, **params)
+        rows = app.db.read(query, **params)
 
-        return [Inventory(*row) for row in rows]
+        return build_page(rows, limit, len(order_by), lambda row: Inventory(*row))
     
     
     # Inventory Designs & Images
@@ -556,14 +654,15 @@ class Inventory:
                     SET name = :name, description = :description
                     WHERE invid = :invid
                 ''', invid=invid, name=name, description=description)
-                return True
             else:
                 # Insert new design
                 app.db.execute('''
                     INSERT INTO Inventory_Designs (invid, name, description)
                     VALUES (:invid, :name, :description)
                 ''', invid=invid, name=name, description=description)
-                return True
+            InventorySearch.refresh(invids=[invid])
+            InventoryCard.bump(invids=[invid])
+            return True
         except Exception as e:
             print(f"Error in adding or updating inventory design: {e}")
             return False
@@ -573,12 +672,15 @@ class Inventory:
     def add_images_to_inventory(invid, image_ids):
         """Adds image references to an inventory."""
         try:
-            # Insert new images
-            for imgid in image_ids:
-                app.db.execute('''
-                    INSERT INTO Inventory_Images (invid, imgid)
-                    VALUES (:invid, :imgid)
-                ''', invid=invid, imgid=imgid)
+            with app.db.transaction():
+                # Insert new images
+                for imgid in image_ids:
+                    app.db.execute('''
+                        INSERT INTO Inventory_Images (invid, imgid)
+                        VALUES (:invid, :imgid)
+                    ''', invid=invid, imgid=imgid)
+                InventoryCard.bump(invids=[invid])
+            Image.invalidate_inventory_images(invid)
             return True
         except Exception as e:
             print(f"Error in adding images to inventory: {e}")
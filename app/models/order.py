@@ -1,5 +1,6 @@
 from flask import current_app as app
 from .inventory import Inventory
+from .stats import InventoryStats
 
 class Order:
     def __init__(self, id, uid, time_created, fulfillment_status='pending', time_fulfilled=None):
@@ -26,7 +27,7 @@ class Order:
     @staticmethod
     def getByUser(uid): 
         """Retrieve all orders made by a specific user, sorted by order ID."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, uid, time_created, fulfillment_status, time_fulfilled
             FROM Orders
             WHERE uid = :uid
@@ -38,7 +39,7 @@ class Order:
     @staticmethod
     def orderByFulfillmentStatus():
         """Retrieve orders sorted by fulfillment status and creation time using window functions."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, uid, time_created, fulfillment_status,
                 ROW_NUMBER() OVER (
                     PARTITION BY fulfillment_status 
@@ -105,6 +106,7 @@ class Order:
                         'pending'
                     )
                 """, oid=oid, invid=invid, quantity=quantity, unit_price=unit_price)
+            InventoryStats.record_sales([invid], [quantity], [unit_price])
 
             return True
         except Exception as e:
@@ -150,7 +152,7 @@ class Order:
     def get_by_seller(sid):
         """Retrieve all orders for a specific seller."""
         column_names = ['order_id', 'user_id', 'address', 'total_quantity', 'status', 'created_at', 'fulfilled_at']
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT 
                 o.id AS order_id, 
                 o.uid AS user_id, 
@@ -255,31 +257,28 @@ class Order:
 
         query += ' GROUP BY order_id, user_id, first_name, last_name, address, status, created_at, fulfilled_at ORDER BY created_at DESC'
 
-        rows = app.db.execute(query, **params)
+        rows = app.db.read(query, **params)
         return [dict(zip(column_names, row)) for row in rows]
     
     
     @staticmethod
     def get_order_history_with_summary(order_ids):
-        """Get order history summary of specific orders"""
+        """Get order history summary of specific orders in a single grouped query.
+        The totals cover every product of each order, regardless of the filters
+        used to find the orders."""
         column_names = ['order_id', 'total_amount', 'total_items']
-        result = {}
-        
-        for oid in order_ids:
-            query = '''
-                SELECT
-                    o.id AS order_id,
-                    SUM(op.quantity * op.price) AS total_amount,
-                    SUM(op.quantity) AS total_items
-                FROM Orders o
-                JOIN Order_Products op ON o.id = op.oid
-                WHERE o.id = :oid
-                GROUP BY o.id
-            '''
-            rows = app.db.execute(query, oid=oid)
-            if rows:
-                result[oid] = [dict(zip(column_names, row)) for row in rows][0]
-        return result
+        if not order_ids:
+            return {}
+        rows = app.db.read('''
+            SELECT
+                op.oid AS order_id,
+                SUM(op.quantity * op.price) AS total_amount,
+                SUM(op.quantity) AS total_items
+            FROM Order_Products op
+            WHERE op.oid = ANY(:ids)
+            GROUP BY op.oid
+        ''', ids=[int(oid) for oid in order_ids])
+        return {row[0]: dict(zip(column_names, row)) for row in rows}
 
 
     # Get order history stats
@@ -311,7 +310,7 @@ class Order:
         
         query += ' GROUP BY order_id, user_id, first_name, last_name, address, status, created_at, fulfilled_at ORDER BY created_at DESC'
 
-        rows = app.db.execute(query, **params)
+        rows = app.db.read(query, **params)
         return [dict(zip(column_names, row)) for row in rows]
     
 
@@ -354,6 +353,6 @@ class Order:
 
         query += ' GROUP BY order_id, user_id, first_name, last_name, address, status, created_at, fulfilled_at ORDER BY created_at DESC'
 
-        rows = app.db.execute(query, **params)
+        rows = app.db.read(query, **params)
         return [dict(zip(column_names, row)) for row in rows]
     
\ No newline at end of file
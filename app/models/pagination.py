@@ -0,0 +1,109 @@
+import base64
+import json
+from decimal import Decimal
+
+
+class Page(list):
+    """A list of query results that also carries the cursor of the next page.
+
+    next_cursor is None when there are no more rows (or when the query was not limited),
+    so a Page can be used anywhere a plain list of results was used before.
+    """
+    def __init__(self, items=(), next_cursor=None):
+        super(Page, self).__init__(items)
+        self.next_cursor = next_cursor
+
+
+def encode_cursor(values):
+    """Encode the sort-key values of the last row of a page into an opaque URL-safe cursor."""
+    values = [str(value) if isinstance(value, Decimal) else value for value in values]
+    data = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor, key_count):
+    """Decode a cursor produced by encode_cursor(); return None if it is missing or malformed.
+    Cursors come from query strings and forms, so every value is checked before it is bound:
+    sort keys are numeric (prices, ratings, ranks, counts, as numbers or decimal strings) and
+    the last one is the integer ID that breaks ties.
+    """
+    if not cursor:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != key_count:
+        return None
+    values = [_sort_key_value(value) for value in values]
+    if None in values or not isinstance(values[-1], int):
+        return None
+    return values
+
+
+def _sort_key_value(value):
+    """Return a cursor value as an int or a finite Decimal of sane magnitude, or None if it is neither."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if abs(value) < 2 ** 63 else None
+    if isinstance(value, (float, str)):
+        try:
+            number = Decimal(str(value))
+        except ArithmeticError:
+            return None
+        return number if number.is_finite() and abs(number.adjusted()) <= 30 else None
+    return None
+
+
+def keyset_condition(order_by, cursor):
+    """Build the WHERE condition that selects the rows after the cursor.
+    Args:
+        order_by (list): (expression, 'ASC'|'DESC') pairs, ending with a unique column such as the ID.
+                         Expressions must not be NULL (wrap them in COALESCE).
+        cursor (str): Cursor of the previous page, or None for the first page.
+    Returns:
+        tuple: (sql, params) where sql is '' if the cursor is missing or invalid.
+    """
+    values = decode_cursor(cursor, len(order_by))
+    if values is None:
+        return '', {}
+    params = {f'cursor_{i}': value for i, value in enumerate(values)}
+    # (k0 > v0) OR (k0 = v0 AND k1 > v1) OR ... with the comparison following each key's direction
+    disjuncts = []
+    for i, (expression, direction) in enumerate(order_by):
+        terms = [f'{order_by[j][0]} = :cursor_{j}' for j in range(i)]
+        terms.append(f"{expression} {'<' if direction == 'DESC' else '>'} :cursor_{i}")
+        disjuncts.append('(' + ' AND '.join(terms) + ')')
+    return '(' + ' OR '.join(disjuncts) + ')', params
+
+
+def sort_key_columns(order_by):
+    """SELECT list exposing the sort keys so the next cursor can be built from the last row."""
+    return ', '.join(f'{expression} AS sort_key_{i}' for i, (expression, _) in enumerate(order_by))
+
+
+def order_by_clause(order_by):
+    """ORDER BY list matching keyset_condition()."""
+    return ', '.join(f'{expression} {direction}' for expression, direction in order_by)
+
+
+def limit_clause(limit):
+    """Fetch one extra row so we know whether another page exists."""
+    return f'LIMIT {int(limit) + 1}' if limit else ''
+
+
+def build_page(rows, limit, key_count, build):
+    """Turn rows selected with sort_key_columns() into a Page.
+    Args:
+        rows (list): Result rows whose last key_count columns are the sort keys.
+        limit (int): Page size used in limit_clause(), or None for an unpaginated query.
+        key_count (int): Number of sort-key columns at the end of each row.
+        build (callable): Converts the remaining leading columns of a row into a result object.
+    """
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][-key_count:])
+    return Page([build(row[:-key_count]) for row in rows], next_cursor)
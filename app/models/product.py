@@ -1,6 +1,8 @@
 from flask import current_app as app
 from .image import Image
 from .inventory import Inventory
+from .search import InventorySearch
+from .card import InventoryCard
 
 class Product:
     """Class for product management with methods for CRUD operations related to product data."""
@@ -29,7 +31,7 @@ class Product:
         Returns:
             Product: A Product instance if found, else None.
         """
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, uid, name, description, imgid
             FROM Products
             WHERE id = :id
@@ -43,7 +45,7 @@ class Product:
         Returns:
             List[Product]: A list of all Product instances from the database.
         """
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, uid, name, description, imgid
             FROM Products
             ORDER BY name
@@ -59,7 +61,7 @@ class Product:
         Returns:
             Product: A Product instance if found, else None.
         """
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT p.id, p.uid, p.name, p.description, p.imgid
             FROM products p
             JOIN inventories i ON p.id = i.pid
@@ -105,6 +107,8 @@ class Product:
             update_params = {'name': name, 'description': description, 'pid': pid}
             result = app.db.execute(update_query, **update_params)
             if result:
+                InventorySearch.refresh(pids=[pid])
+                InventoryCard.bump(pids=[pid])
                 return Product.get(pid)
             else:
                 return None
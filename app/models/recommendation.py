@@ -1,86 +1,177 @@
+import heapq
+from collections import defaultdict
 from flask import current_app as app
 
 class Recommendation:
+    """Recommendations for the cart page, precomputed by a batch job.
+
+    refresh() (run periodically by `flask recommendations refresh`) scores,
+    for every user who bought something, the selling inventories of their
+    favourite categories and stores each user's top candidates in
+    User_Recommendations; pages only look those rows up.
+    """
+
+    # Number of most purchased categories of a user that candidates are drawn from
+    TOP_CATEGORIES = 5
+    # Rows written to User_Recommendations per INSERT by refresh()
+    INSERT_BATCH = 50000
 
     @staticmethod
     def recommend_products_based_on_history_and_reviews(user_id):
         """
-        Recommends top 3 inventories based on user's most frequently purchased categories and high-rated reviews, excluding the user's own products.
+        Recommends inventories based on user's most frequently purchased categories and best sellers, excluding the user's own products.
+        Reads the candidates precomputed by refresh(), minus what the user bought or put in their cart since.
         Incorporates inventory design if available.
         """
-        column_names = ['inventory_id', 'product_name', 'display_name', 'display_description', 'image_id', 'current_quantity', 'price', 'sales_count', 'avg_rating', 'category_label']
+        column_names = ['inventory_id', 'product_name', 'display_name', 'display_description', 'image_id', 'image_content', 'current_quantity', 'price', 'sales_count', 'avg_rating', 'category_label']
 
         query = """
-        WITH UserTopCategories AS (
-            SELECT t.cid, COUNT(*) AS category_count
+        SELECT 
+            ur.invid AS inventory_id,
+            p.name AS product_name,
+            COALESCE(id.name, p.name) AS display_name,
+            COALESCE(id.description, p.description) AS display_description,
+            p.imgid AS image_id,
+            img.content AS image_content,
+            i.current_quantity AS current_quantity,
+            i.price AS price,
+            st.units_sold AS sales_count,
+            st.average_rating AS avg_rating,
+            c.label AS category_label
+        FROM 
+            User_Recommendations ur
+        JOIN Inventories i ON ur.invid = i.id
+        JOIN Products p ON i.pid = p.id
+        JOIN Inventory_Stats st ON st.invid = i.id
+        JOIN Categories c ON ur.cid = c.id
+        LEFT JOIN Images img ON img.id = p.imgid
+        LEFT JOIN Inventory_Designs id ON i.id = id.invid
+        WHERE 
+            ur.uid = :user_id
+            AND NOT EXISTS (
+                SELECT 1 FROM Order_Products op JOIN Orders o ON o.id = op.oid
+                WHERE o.uid = :user_id AND op.invid = ur.invid
+            ) AND NOT EXISTS (
+                SELECT 1 FROM Cart_Products cp JOIN Carts ca ON ca.id = cp.cid
+                WHERE ca.uid = :user_id AND cp.invid = ur.invid
+            )
+        ORDER BY ur.rank
+        LIMIT :limit
+        """
+        rows = app.db.read(query, user_id=user_id, limit=app.config['RECOMMENDATION_LIMIT'])
+        return [dict(zip(column_names, row)) for row in rows] if rows else None
+
+
+    @staticmethod
+    def refresh(candidates=None):
+        """Recompute the stored recommendations of every user (batch job).
+
+        A user's affinity to a category is their share of purchases in it,
+        over their TOP_CATEGORIES most purchased categories; an inventory
+        scores the sum, over those categories it is tagged with, of
+        affinity x units sold, ties broken by average rating. Inventories
+        the user bought or sells are skipped.
+
+        Each category's inventories are sorted by units sold once, and a
+        user only scores the first `candidates` eligible ones of each of
+        their categories, so a run costs users x TOP_CATEGORIES x candidates
+        whatever the size of the popular categories. The ranking is exact
+        for inventories tagged with a single of the user's categories; one
+        that is a best seller in none of them, but sums up contributions
+        from several, may be missed. Rows are inserted INSERT_BATCH at a time.
+        Args:
+            candidates (int): Recommendations kept per user; defaults to RECOMMENDATION_CANDIDATES.
+        Returns:
+            tuple: (users, recommendations) stored.
+        """
+        candidates = candidates or app.config['RECOMMENDATION_CANDIDATES']
+
+        purchases = defaultdict(dict)
+        for uid, cid, count in app.db.read('''
+            SELECT o.uid, t.cid, COUNT(*)
             FROM Orders o
             JOIN Order_Products op ON o.id = op.oid
             JOIN Inventories i ON op.invid = i.id
             JOIN Tags t ON i.pid = t.pid
-            WHERE o.uid = :user_id
-            GROUP BY t.cid
-            ORDER BY category_count DESC
-            LIMIT 5
-        ), CategorySales AS (
-            SELECT 
-                i.id AS inventory_id, 
-                i.pid,
-                t.cid,
-                COUNT(op.oid) AS sales_count, 
-                COALESCE(AVG(r.rating), 0) AS avg_rating 
-            FROM 
-                Inventories i
+            GROUP BY o.uid, t.cid
+            '''):
+            purchases[uid][cid] = count
+
+        bought = defaultdict(set)
+        for uid, invid in app.db.read('''
+            SELECT DISTINCT o.uid, op.invid
+            FROM Orders o
+            JOIN Order_Products op ON o.id = op.oid
+            '''):
+            bought[uid].add(invid)
+
+        sales = defaultdict(list)
+        seller_uid = {}
+        for invid, uid, cid, units_sold, avg_rating in app.db.read('''
+            SELECT i.id, s.uid, t.cid, st.units_sold, st.average_rating
+            FROM Inventories i
+            JOIN Sellers s ON i.sid = s.id
             JOIN Tags t ON i.pid = t.pid
-            JOIN Order_Products op ON i.id = op.invid
-            LEFT JOIN Reviews r ON i.id = r.invid
-            WHERE 
-                t.cid IN (SELECT cid FROM UserTopCategories) 
-            GROUP BY 
-                i.id, i.pid, t.cid
-        ), RankedProducts AS (
-            SELECT
-                cs.inventory_id AS inventory_id,
-                p.name AS product_name,
-                COALESCE(id.name, p.name) AS display_name,
-                COALESCE(id.description, p.description) AS display_description,
-                p.imgid AS image_id, 
-                i.current_quantity AS current_quantity,
-                i.price AS price,
-                cs.sales_count AS sales_count,
-                cs.avg_rating AS avg_rating,
-                c.label AS category_label
-            FROM 
-                CategorySales cs
-            JOIN Inventories i ON cs.inventory_id = i.id
-            JOIN Products p ON i.pid = p.id
-            LEFT JOIN Inventory_Designs id ON i.id = id.invid
-            JOIN Categories c ON cs.cid = c.id
-            WHERE 
-                i.id NOT IN (
-                    SELECT invid FROM Order_Products WHERE oid IN (
-                        SELECT id FROM Orders WHERE uid = :user_id
-                    )
-                ) AND i.id NOT IN (
-                    SELECT invid FROM Cart_Products WHERE cid = (
-                        SELECT id FROM Carts WHERE uid = :user_id
-                    )
-                ) AND i.sid != :user_id
-            ORDER BY 
-                cs.sales_count DESC, cs.avg_rating DESC 
-            LIMIT 10
-        )
-        SELECT 
-                DISTINCT inventory_id,
-                product_name,
-                display_name,
-                display_description,
-                image_id,
-                current_quantity,
-                price,
-                sales_count,
-                avg_rating,
-                category_label
-        FROM RankedProducts;
-        """
-        rows = app.db.execute(query, user_id=user_id)
-        return [dict(zip(column_names, row)) for row in rows] if rows else None
\ No newline at end of file
+            JOIN Inventory_Stats st ON st.invid = i.id
+            WHERE st.units_sold > 0
+            '''):
+            sales[cid].append((invid, units_sold, float(avg_rating)))
+            seller_uid[invid] = uid
+        # Best sellers first, in the order of the final ranking within one category
+        for ranked in sales.values():
+            ranked.sort(key=lambda sale: (-sale[1], -sale[2], sale[0]))
+
+        stored = {'uids': [], 'ranks': [], 'invids': [], 'cids': [], 'scores': []}
+        total_stored = 0
+
+        def insert():
+            app.db.execute('''
+                INSERT INTO User_Recommendations (uid, rank, invid, cid, score)
+                SELECT *
+                FROM unnest(CAST(:uids AS INT[]), CAST(:ranks AS INT[]), CAST(:invids AS INT[]),
+                            CAST(:cids AS INT[]), CAST(:scores AS DOUBLE PRECISION[]))
+                ''', **stored)
+            for values in stored.values():
+                values.clear()
+
+        # Swap the whole table in one transaction: pages keep reading the previous results until it commits
+        with app.db.transaction():
+            app.db.execute('''
+                DELETE FROM User_Recommendations
+                ''')
+            for uid, categories in purchases.items():
+                top = heapq.nlargest(Recommendation.TOP_CATEGORIES, categories.items(), key=lambda item: (item[1], -item[0]))
+                total = sum(count for _, count in top)
+                # invid -> [score, average rating, category contributing most, its contribution]
+                scores = {}
+                for cid, count in top:
+                    affinity = count / total
+                    scored = 0
+                    for invid, units_sold, avg_rating in sales[cid]:
+                        if invid in bought[uid] or seller_uid[invid] == uid:
+                            continue
+                        contribution = affinity * units_sold
+                        entry = scores.get(invid)
+                        if entry is None:
+                            scores[invid] = [contribution, avg_rating, cid, contribution]
+                        else:
+                            entry[0] += contribution
+                            if contribution > entry[3]:
+                                entry[2], entry[3] = cid, contribution
+                        scored += 1
+                        if scored == candidates:
+                            break
+                best = heapq.nlargest(candidates, scores.items(), key=lambda item: (item[1][0], item[1][1], -item[0]))
+                for rank, (invid, (score, _, cid, _)) in enumerate(best, 1):
+                    stored['uids'].append(uid)
+                    stored['ranks'].append(rank)
+                    stored['invids'].append(invid)
+                    stored['cids'].append(cid)
+                    stored['scores'].append(score)
+                if len(stored['uids']) >= Recommendation.INSERT_BATCH:
+                    total_stored += len(stored['uids'])
+                    insert()
+            total_stored += len(stored['uids'])
+            if stored['uids']:
+                insert()
+        return len(purchases), total_stored
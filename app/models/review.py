@@ -1,5 +1,6 @@
 from flask import current_app as app
 from collections import defaultdict
+from .stats import InventoryStats
 
 
 class Review:
@@ -28,7 +29,7 @@ class Review:
     @staticmethod
     def getByInventory(invid):
         """Retrieve all reviews for a specific inventory item, sorted by upvotes and then by creation time."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, uid, invid, rating, review, time_created, upvote
             FROM Reviews
             WHERE invid = :invid
@@ -53,11 +54,14 @@ class Review:
     def deleteById(id):
         """Delete a review by its ID and return True if successful."""
         try:
-            result = app.db.execute('''
-                DELETE FROM Reviews
-                WHERE id = :id
-                RETURNING id
-            ''', id=id)
+            with app.db.transaction():
+                result = app.db.execute('''
+                    DELETE FROM Reviews
+                    WHERE id = :id
+                    RETURNING invid, rating
+                ''', id=id)
+                if result:
+                    InventoryStats.record_review(result[0][0], -result[0][1], -1)
             return True if result else False
         except Exception as e:
             print(f"An error occurred while deleting review {id}: {e}")
@@ -67,7 +71,7 @@ class Review:
     @staticmethod
     def getByUser(uid):
         """Retrieve all reviews made by a specific user, ordered by the time they were created."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, uid, invid, rating, review, time_created, upvote
             FROM Reviews
             WHERE uid = :uid
@@ -79,7 +83,7 @@ class Review:
     @staticmethod
     def get_most_recent_k_review(uid,k):
         """Retrieve the most recent 'k' reviews made by a specific user."""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT id, uid, invid, rating, review, time_created, upvote
             FROM Reviews
             WHERE uid = :uid
@@ -97,12 +101,17 @@ class Review:
     def update_review(review_id, rating, review_text):
         """Update the rating and text of an existing review and reset its creation timestamp."""
         try:
-            result = app.db.execute('''
-                UPDATE Reviews
-                SET rating = :rating, review = :review, time_created = CURRENT_TIMESTAMP
-                WHERE id = :review_id
-                RETURNING id
-            ''', rating=rating, review=review_text, review_id=review_id)
+            with app.db.transaction():
+                # old.rating is the rating before this update
+                result = app.db.execute('''
+                    UPDATE Reviews r
+                    SET rating = :rating, review = :review, time_created = CURRENT_TIMESTAMP
+                    FROM Reviews old
+                    WHERE r.id = :review_id AND old.id = r.id
+                    RETURNING r.invid, r.rating - old.rating
+                ''', rating=rating, review=review_text, review_id=review_id)
+                if result:
+                    InventoryStats.record_review(result[0][0], result[0][1], 0)
             return True if result else False
         except Exception as e:
             print(f"An error occurred while updating review {review_id}: {e}")
@@ -113,11 +122,13 @@ class Review:
     def add_review(uid, invid, rating, review_text):
         """Add a new review for an inventory item by a user."""
         try:
-            result = app.db.execute('''
-                INSERT INTO Reviews(uid, invid, rating, review)
-                VALUES(:uid, :invid ,:rating, :review)
-                RETURNING id
-            ''', uid=uid, invid = invid, rating=rating, review=review_text)
+            with app.db.transaction():
+                result = app.db.execute('''
+                    INSERT INTO Reviews(uid, invid, rating, review)
+                    VALUES(:uid, :invid ,:rating, :review)
+                    RETURNING id
+                ''', uid=uid, invid = invid, rating=rating, review=review_text)
+                InventoryStats.record_review(invid, rating, 1)
             id = result[0][0]
             return Review.getById(id)
         except Exception as e:
@@ -150,17 +161,18 @@ class Review:
     def add_upvote(review_id, user_id):
         """Add an upvote to a review from a user and update the review's upvote count."""
         try:
-            # Add record to ReviewUpvotes
-            app.db.execute('''
-                INSERT INTO ReviewUpvotes (review_id, user_id)
-                VALUES (:review_id, :user_id)
-            ''', review_id=review_id, user_id=user_id)
-            # Increment upvote count in Reviews
-            app.db.execute('''
-                UPDATE Reviews
-                SET upvote = upvote + 1
-                WHERE id = :review_id
-            ''', review_id=review_id)
+            with app.db.transaction():
+                # Add record to ReviewUpvotes
+                app.db.execute('''
+                    INSERT INTO ReviewUpvotes (review_id, user_id)
+                    VALUES (:review_id, :user_id)
+                ''', review_id=review_id, user_id=user_id)
+                # Increment upvote count in Reviews
+                app.db.execute('''
+                    UPDATE Reviews
+                    SET upvote = upvote + 1
+                    WHERE id = :review_id
+                ''', review_id=review_id)
             return True
         except Exception as e:
             # Handle errors like duplicate insertion attempts
@@ -172,12 +184,13 @@ class Review:
     def add_images_to_review(rid, image_ids):
         """Adds image references to a review."""
         try:
-            # Insert new images
-            for imgid in image_ids:
-                app.db.execute('''
-                    INSERT INTO Review_Images (rid, imgid)
-                    VALUES (:rid, :imgid)
-                ''', rid=rid, imgid=imgid)
+            with app.db.transaction():
+                # Insert new images
+                for imgid in image_ids:
+                    app.db.execute('''
+                        INSERT INTO Review_Images (rid, imgid)
+                        VALUES (:rid, :imgid)
+                    ''', rid=rid, imgid=imgid)
             return True
         except Exception as e:
             print(f"Error in adding images to review: {e}")
@@ -0,0 +1,56 @@
+import re
+from flask import current_app as app
+
+
+class InventorySearch:
+    """Full-text search over inventories.
+
+    Every inventory has one weighted tsvector document in Inventory_Search
+    (design and product names weigh most, then category labels, then the
+    descriptions), built from the Inventory_Search_Documents view and
+    indexed with GIN. Model methods that change any of the source columns
+    call refresh() for the affected inventories.
+    """
+
+    # The tsquery is passed as a parameter so that it is parsed only once per statement
+    TSQUERY = "to_tsquery('english', :search_query)"
+    MATCH = f"s.document @@ {TSQUERY}"
+    # Rounded so that the rank can be used as an exact keyset pagination key
+    RANK = f"ROUND(CAST(ts_rank(s.document, {TSQUERY}) AS NUMERIC), 6)"
+
+
+    @staticmethod
+    def to_query(keyword):
+        """Turn free text into a tsquery matching every word as a prefix ('lapt' finds 'laptop').
+        Returns:
+            str: The tsquery text, or None if the keyword has no searchable words.
+        """
+        words = re.findall(r'\w+', keyword or '')
+        if not words:
+            return None
+        return ' & '.join(f'{word}:*' for word in words)
+
+
+    @staticmethod
+    def refresh(invids=None, pids=None):
+        """Rebuild the search documents of the given inventories, of every inventory of the
+        given products, or of all inventories when neither is given.
+        Args:
+            invids (list[int]): Inventory IDs.
+            pids (list[int]): Product IDs.
+        """
+        condition = ''
+        params = {}
+        if invids is not None or pids is not None:
+            condition = '''
+                WHERE invid = ANY(:invids)
+                   OR invid IN (SELECT id FROM Inventories WHERE pid = ANY(:pids))
+            '''
+            params = {'invids': [int(id) for id in invids or []], 'pids': [int(id) for id in pids or []]}
+        app.db.execute(f'''
+            INSERT INTO Inventory_Search (invid, document)
+            SELECT invid, document
+            FROM Inventory_Search_Documents
+            {condition}
+            ON CONFLICT (invid) DO UPDATE SET document = EXCLUDED.document
+            ''', **params)
@@ -1,4 +1,5 @@
 from flask import current_app as app
+from .cache import seller_cache
 
 class Seller:
     """Class representing sellers with methods for database interactions related to seller data."""
@@ -21,11 +22,11 @@ class Seller:
         Returns:
             Seller: A Seller instance corresponding to the given ID if found, else None.
         """
-        rows = app.db.execute('''
+        rows = seller_cache.get_or_load(('getById', id), lambda: app.db.read('''
             SELECT id, uid
             FROM Sellers
             WHERE id = :id
-            ''', id=id)
+            ''', id=id), cache_empty=False)
         return Seller(*(rows[0])) if rows else None
     
     
@@ -37,11 +38,11 @@ class Seller:
         Returns:
             Seller: A Seller instance corresponding to the given user ID if found, else None.
         """
-        rows = app.db.execute('''
+        rows = seller_cache.get_or_load(('getByUid', uid), lambda: app.db.read('''
             SELECT id, uid
             FROM Sellers
             WHERE uid = :uid
-            ''', uid=uid)
+            ''', uid=uid), cache_empty=False)
         return Seller(*(rows[0])) if rows else None
     
     
@@ -74,12 +75,7 @@ class Seller:
         Returns:
             bool: True if the user is a seller, otherwise False.
         """
-        rows = app.db.execute('''
-            SELECT id, uid 
-            FROM Sellers 
-            WHERE uid = :uid
-            ''', uid=uid)
-        return len(rows) > 0
+        return Seller.getByUid(uid) is not None
     
     
     @staticmethod
@@ -90,7 +86,7 @@ class Seller:
         Returns:
             list: List of pid the current seller sells.
         """
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT pid FROM Inventories WHERE sid = :sid
         ''', sid=sid)
         return [row[0] for row in rows]  
\ No newline at end of file
@@ -0,0 +1,63 @@
+from flask import current_app as app
+
+
+class InventoryStats:
+    """Per-inventory review and sales aggregates stored in Inventory_Stats.
+
+    Every inventory has one row (created with the inventory). The review and
+    checkout write paths apply deltas in the same transaction as their own
+    writes, so reads sort and filter on indexed columns instead of grouping
+    Reviews and Order_Products on every request.
+    """
+
+    # Expressions for queries that join Inventory_Stats as `st`
+    AVERAGE_RATING = 'st.average_rating'
+    UNITS_SOLD = 'st.units_sold'
+
+
+    @staticmethod
+    def create(invid):
+        """Add the empty stats row of a new inventory."""
+        app.db.execute('''
+            INSERT INTO Inventory_Stats (invid)
+            VALUES (:invid)
+            ON CONFLICT (invid) DO NOTHING
+            ''', invid=invid)
+
+
+    @staticmethod
+    def record_review(invid, rating_delta, count_delta):
+        """Apply a review change to the rating aggregates of an inventory.
+        Args:
+            invid (int): Inventory ID.
+            rating_delta (int): Change of the sum of ratings.
+            count_delta (int): Change of the number of reviews (1, 0 or -1).
+        """
+        app.db.execute('''
+            UPDATE Inventory_Stats
+            SET rating_sum = rating_sum + :rating_delta,
+                review_count = review_count + :count_delta
+            WHERE invid = :invid
+            ''', invid=invid, rating_delta=rating_delta, count_delta=count_delta)
+
+
+    @staticmethod
+    def record_sales(invids, quantities, prices):
+        """Add sold order lines to the sales aggregates; the lists are parallel.
+        Args:
+            invids (list[int]): Inventory ID of each line.
+            quantities (list[int]): Units sold on each line.
+            prices (list[Decimal]): Unit price of each line.
+        """
+        app.db.execute('''
+            UPDATE Inventory_Stats st
+            SET units_sold = st.units_sold + l.quantity,
+                revenue = st.revenue + l.amount
+            FROM (
+                SELECT invid, SUM(quantity) AS quantity, SUM(quantity * unit_price) AS amount
+                FROM unnest(CAST(:invids AS INT[]), CAST(:quantities AS INT[]), CAST(:prices AS DECIMAL(12,2)[]))
+                     AS l(invid, quantity, unit_price)
+                GROUP BY invid
+            ) l
+            WHERE st.invid = l.invid
+            ''', invids=invids, quantities=quantities, prices=prices)
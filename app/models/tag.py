@@ -1,4 +1,6 @@
 from flask import current_app as app
+from .category import Category
+from .search import InventorySearch
 
 
 class Tag:
@@ -38,6 +40,8 @@ class Tag:
                 INSERT INTO Tags(pid, cid)
                 VALUES (:pid, :cid)
                 """, pid=pid, cid=int(cid))
+            Category.invalidate_cache()
+            InventorySearch.refresh(pids=[pid])
             return Tag(*(rows[0])) if rows is not None else None
         except Exception as e:
             print(f"Failed to add new tag: {e}")
@@ -52,6 +56,8 @@ class Tag:
                 DELETE FROM Tags
                 WHERE pid = :pid
                 """, pid=pid)
+            Category.invalidate_cache()
+            InventorySearch.refresh(pids=[pid])
             return True
         except Exception as e:
             print(f"Failed to delete product tags: {e}")
@@ -69,7 +69,7 @@ class User(UserMixin):
     @login.user_loader
     def get(id):
         """Fetch user by ID for login management"""
-        rows = app.db.execute("""
+        rows = app.db.read("""
             SELECT id, email, firstname, lastname, address, balance
             FROM Users
             WHERE id = :id
@@ -80,7 +80,7 @@ class User(UserMixin):
     @staticmethod
     def get_seller_account(sid):
         """Retrieve a user account that is a seller"""
-        rows = app.db.execute('''
+        rows = app.db.read('''
             SELECT u.id, u.email, u.firstname, u.lastname, u.address, u.balance
             FROM users u
             JOIN sellers s ON u.id = s.uid
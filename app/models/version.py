@@ -0,0 +1,93 @@
+import logging
+import re
+from flask import current_app as app
+from sqlalchemy import event, text
+
+
+class DataVersion:
+    """Per-table change stamps in Data_Versions, used to build HTTP validators.
+
+    Writes are detected from the statements the app executes: once a
+    transaction that wrote a tracked table has committed, the stamps of those
+    tables are bumped in a short READ COMMITTED statement of their own. Doing
+    it after the commit keeps the shared stamp rows out of the (serializable)
+    write transactions, and means a reader that sees a new stamp also sees the
+    data behind it. Writes made outside the app (psql, bulk loads) are not seen;
+    a reload empties Data_Versions, which starts a new epoch.
+    """
+
+    # Lower-case table names whose writes are stamped (filled in by the views that depend on them)
+    TRACKED = set()
+    EPOCH = '*'
+    WRITE = re.compile(r'\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+(\w+)', re.IGNORECASE)
+
+
+    @staticmethod
+    def track(db):
+        """Record the tracked tables written on each connection and stamp them after its commits.
+        Args:
+            db (DB): The app database, whose engine and commit hook are used.
+        """
+        event.listen(db.engine, 'after_cursor_execute', DataVersion._after_cursor_execute)
+        event.listen(db.engine, 'rollback', DataVersion._rollback)
+        db.commit_observers.append(DataVersion._after_commit)
+
+
+    @staticmethod
+    def current(tables):
+        """Return the stamps of the given tables plus the epoch.
+        Returns:
+            dict: {scope: (version, updated_at)}; tables never written since the epoch are missing.
+        """
+        scopes = [DataVersion.EPOCH] + sorted(table.lower() for table in tables)
+        rows = app.db.read('''
+            SELECT scope, version, updated_at
+            FROM Data_Versions
+            WHERE scope = ANY(:scopes)
+            ''', scopes=scopes)
+        stamps = {row[0]: (row[1], row[2]) for row in rows}
+        if DataVersion.EPOCH not in stamps:
+            app.db.execute('''
+                INSERT INTO Data_Versions (scope)
+                VALUES (:scope)
+                ON CONFLICT (scope) DO NOTHING
+                ''', scope=DataVersion.EPOCH)
+            return DataVersion.current(tables)
+        return stamps
+
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:6].upper() == 'SELECT':
+            return
+        written = {table.lower() for table in DataVersion.WRITE.findall(statement)} & DataVersion.TRACKED
+        if written:
+            conn.info.setdefault('_written_tables', set()).update(written)
+
+
+    @staticmethod
+    def _rollback(conn):
+        conn.info.pop('_written_tables', None)
+
+
+    @staticmethod
+    def _after_commit(conn):
+        tables = conn.info.pop('_written_tables', None)
+        if not tables:
+            return
+        try:
+            conn.execution_options(isolation_level='READ COMMITTED', postgresql_readonly=False)
+            with conn.begin():
+                # Sorted, so that concurrent bumps lock the rows in the same order
+                conn.execute(text('''
+                    INSERT INTO Data_Versions (scope, version)
+                    SELECT scope, 1
+                    FROM unnest(CAST(:scopes AS VARCHAR[])) AS scope
+                    ORDER BY scope
+                    ON CONFLICT (scope) DO UPDATE
+                    SET version = Data_Versions.version + 1,
+                        updated_at = EXCLUDED.updated_at
+                    '''), {'scopes': sorted(tables)})
+        except Exception as e:
+            # The data itself is committed; pages just stay cached until the next bump
+            logging.error(f"Failed to bump data versions of {sorted(tables)}: {e}")
@@ -110,7 +110,7 @@ def edit_product(invid):
     if form.validate_on_submit():
         file = form.image.data
         if file:
-            Image.save_image(file, product.imgid)
+            Image.replace_image(product.imgid, file)
             
         # Update the product details
         product_update = Product.update_product(product.id, form.name.data, form.description.data)
@@ -122,4 +122,4 @@ def edit_product(invid):
     else:
         print("Form errors:", form.errors)
 
-    return render_template('edit_product.html', form=form, product=product, tags=tag_labels, inventory=inventory)
\ No newline at end of file
+    return render_template('edit_product.html', form=form, product=product, image=Image.get(product.imgid), tags=tag_labels, inventory=inventory)
\ No newline at end of file
@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from .models.recommendation import Recommendation
+
+logger = logging.getLogger('app.recommendations')
+
+
+class RecommendationPanel:
+    """Recommendations of the cart pages, served apart from the pages themselves.
+
+    The cart pages only render a placeholder that the browser fills from
+    /cart/recommendations once the cart is shown. That endpoint gets its
+    recommendations from here: results are cached per user for
+    RECOMMENDATION_PANEL_TTL seconds, and the recommender (run in a small
+    thread pool) gets RECOMMENDATION_PANEL_TIMEOUT_MS to produce a fresh
+    one. When it is slower or fails, the panel is answered with the expired
+    result of the user if it is less than RECOMMENDATION_PANEL_STALE_SECONDS
+    older, or left empty; a slow computation keeps running and fills the
+    cache for the next request. At most one computation per user runs at a time.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.ttl = app.config['RECOMMENDATION_PANEL_TTL']
+        self.stale = app.config['RECOMMENDATION_PANEL_STALE_SECONDS']
+        self.timeout = app.config['RECOMMENDATION_PANEL_TIMEOUT_MS'] / 1000
+        self.max_size = app.config['RECOMMENDATION_PANEL_SIZE']
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(app.config['RECOMMENDATION_PANEL_WORKERS'],
+                                            thread_name_prefix='recommendations')
+        app.extensions['recommendation_panel'] = self
+
+    def get(self, uid):
+        """Return (recommendations, outcome) for user uid; outcome is 'cached', 'fresh',
+        'stale' (expired result served after a timeout or error), 'timeout' or 'error'
+        (no result: the panel stays empty)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(uid)
+                return entry[1], 'cached'
+            future = self._pending.get(uid)
+            if future is None:
+                future = self._pending[uid] = self._executor.submit(self._compute, uid)
+        try:
+            return future.result(timeout=self.timeout), 'fresh'
+        except TimeoutError:
+            outcome = 'timeout'
+        except Exception as e:
+            logger.warning('recommendations for user %s failed: %s', uid, e)
+            outcome = 'error'
+        if entry is not None and now - entry[0] < self.ttl + self.stale:
+            return entry[1], 'stale'
+        return None, outcome
+
+    def _compute(self, uid):
+        try:
+            with self.app.app_context():
+                recommendations = Recommendation.recommend_products_based_on_history_and_reviews(uid)
+            with self._lock:
+                self._entries[uid] = (time.monotonic(), recommendations)
+                self._entries.move_to_end(uid)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            return recommendations
+        finally:
+            with self._lock:
+                self._pending.pop(uid, None)
@@ -0,0 +1,44 @@
+import time
+import click
+from flask.cli import AppGroup
+from .models.copurchase import Copurchase
+from .models.recommendation import Recommendation
+
+recommendations_cli = AppGroup('recommendations', help='Maintain the precomputed recommendations.')
+
+
+def repeat(every, job):
+    """Run job() once, or every `every` seconds if it is non-zero, echoing what each run did."""
+    while True:
+        started = time.perf_counter()
+        done = job()
+        elapsed = time.perf_counter() - started
+        click.echo(f'{done} in {elapsed:.2f}s')
+        if not every:
+            return
+        time.sleep(max(0, every - elapsed))
+
+
+@recommendations_cli.command('refresh')
+@click.option('--every', type=float, default=0, help='Keep running, recomputing every EVERY seconds (default: run once).')
+def refresh(every):
+    """Recompute the recommendations of every user (run it from cron, or with --every)."""
+    def job():
+        users, recommendations = Recommendation.refresh()
+        return f'{recommendations} recommendations for {users} users'
+    repeat(every, job)
+
+
+@recommendations_cli.command('copurchases')
+@click.option('--full', is_flag=True, help='Rebuild the index from every order instead of the new ones.')
+@click.option('--every', type=float, default=0, help='Keep running, updating every EVERY seconds (default: run once).')
+def copurchases(full, every):
+    """Fold new orders into the "frequently bought together" index (run it from cron, or with --every)."""
+    runs = []
+
+    def job():
+        # With --every, only the first run rebuilds
+        orders, inventories = Copurchase.refresh(full=full and not runs)
+        runs.append(orders)
+        return f'{orders} orders, {inventories} neighbor lists updated'
+    repeat(every, job)
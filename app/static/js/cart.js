@@ -0,0 +1,109 @@
+// Cart forms marked with data-cart-api are sent to the JSON cart API (see cart.py) and the
+// page is updated in place from the changed line and totals it returns. Without JavaScript,
+// or when the API call gets no response or is redirected (e.g. the session expired), the form
+// is submitted normally; any other failure reloads the page instead, since the change may
+// already have been applied.
+(function () {
+  function showMessage(form, text, isError) {
+    var note = form.querySelector('.cart-api-message');
+    if (!note) {
+      note = document.createElement('small');
+      note.className = 'cart-api-message d-block';
+      form.appendChild(note);
+    }
+    note.textContent = text || '';
+    note.style.color = isError ? 'red' : 'green';
+  }
+
+  function updateTotals(totals) {
+    var items = document.getElementById('cart-total-items');
+    var price = document.getElementById('cart-total-price');
+    if (items) {
+      items.textContent = totals.total_items;
+    }
+    if (price) {
+      price.textContent = '$' + Number(totals.total_price).toFixed(2);
+    }
+  }
+
+  function apply(form, delta) {
+    var row = form.closest('tr[data-cart-line]');
+    var action = form.getAttribute('data-cart-action');
+    if (action === 'add') {
+      showMessage(form, delta.message, false);
+    } else if (action === 'update') {
+      showMessage(form, '', false);
+    } else if (row) {
+      // remove, save_for_later, move_to_cart: the line left this table
+      row.parentNode.removeChild(row);
+      if (!document.querySelector('tr[data-cart-line]')) {
+        // Let the page show its empty-cart message
+        window.location.reload();
+        return;
+      }
+    }
+    updateTotals(delta.totals);
+  }
+
+  document.addEventListener('submit', function (event) {
+    var form = event.target;
+    var url = form.getAttribute('data-cart-api');
+    if (!url || !window.fetch) {
+      return;
+    }
+    event.preventDefault();
+    var body = {};
+    new FormData(form).forEach(function (value, name) {
+      body[name] = value;
+    });
+    fetch(url, {
+      method: 'POST',
+      credentials: 'same-origin',
+      headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+      body: JSON.stringify(body)
+    }).then(function (response) {
+      if (response.redirected) {
+        // Sent to the login page: the change was not applied, the normal submit handles it
+        form.submit();
+        return;
+      }
+      var type = response.headers.get('Content-Type') || '';
+      if (type.indexOf('application/json') !== 0) {
+        throw new Error('not a cart API response');
+      }
+      return response.json().then(function (data) {
+        if (response.ok) {
+          apply(form, data);
+        } else {
+          showMessage(form, data.error, true);
+        }
+      });
+    }, function () {
+      // No response at all (network error)
+      form.submit();
+    }).catch(function () {
+      // The server may already have applied the change: never send it twice, show the page as it is now
+      showMessage(form, 'Something went wrong, reloading the page.', true);
+      window.location.reload();
+    });
+  });
+
+  // Panels loaded after the page (the cart recommendations): a slow panel never holds up
+  // the page, and one that fails simply stays empty.
+  document.querySelectorAll('[data-panel-src]').forEach(function (panel) {
+    if (!window.fetch) {
+      return;
+    }
+    fetch(panel.getAttribute('data-panel-src'), { credentials: 'same-origin' })
+      .then(function (response) {
+        return response.ok && !response.redirected ? response.text() : '';
+      })
+      .then(function (html) {
+        panel.innerHTML = html;
+        if (window.jQuery && window.jQuery.fn.carousel) {
+          window.jQuery(panel).find('.carousel').carousel();
+        }
+      })
+      .catch(function () {});
+  });
+})();
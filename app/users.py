@@ -8,6 +8,7 @@ from .models.user import User
 from .models.seller import Seller
 from .models.feedback import Feedback
 from .models.image import Image
+from .http_cache import conditional_get
 from flask import Blueprint
 
 bp = Blueprint('users', __name__)
@@ -204,6 +205,7 @@ def balance():
 
 @bp.route('/public-view/<int:uid>')
 @login_required
+@conditional_get(['Users', 'Sellers', 'Feedbacks', 'Feedback_Images', 'FeedbackUpvotes', 'Images'])
 def user_public_view(uid):
     """
     Displays public view of a user's profile, including feedback if the user is a seller.
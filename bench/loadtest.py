@@ -0,0 +1,277 @@
+"""HTTP load test for Mini Amazon.
+
+Boots create_app() on a local threaded server (or targets --url), then runs
+concurrent virtual users through weighted user journeys: browsing, search,
+product detail, cart and checkout, order history, the seller order list and
+reviews. Reports p50/p95/p99 latency and throughput per route and can store
+the results as a named baseline to compare later runs against.
+
+Seed the database first (db/generated/generate.py + db/bulk_load.py), then run
+from the repository root:
+
+    python -m bench.loadtest --users 20 --duration 60 --save before
+    python -m bench.loadtest --users 20 --duration 60 --compare before
+
+Generated users all share one password (--password, default test123).
+"""
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime
+from werkzeug.serving import make_server
+from app import create_app
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Time each route on its own: a redirect is a response, not a second request."""
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Recorder:
+    """Thread-safe latency samples per route label."""
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, route, seconds, ok):
+        with self._lock:
+            self.samples[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+    def summary(self, elapsed):
+        report = {}
+        for route, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            report[route] = {
+                'count': len(samples),
+                'errors': self.errors[route],
+                'throughput': len(samples) / elapsed,
+                'p50': percentile(samples, 50),
+                'p95': percentile(samples, 95),
+                'p99': percentile(samples, 99),
+            }
+        return report
+
+
+def percentile(sorted_samples, p):
+    """Nearest-rank percentile, in milliseconds."""
+    index = max(0, min(len(sorted_samples) - 1, int(round(p / 100 * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[index] * 1000
+
+
+class VirtualUser:
+    """One browser session: its own cookies, and a (route label, request) timer."""
+    def __init__(self, base_url, recorder, rng):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.rng = rng
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+                                                  _NoRedirect())
+
+    def request(self, route, path, data=None):
+        """GET path (POST if data is given) and record its latency under route; return (status, body)."""
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, body, timeout=60) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, content = e.code, e.read()
+        except (urllib.error.URLError, OSError):
+            status, content = 0, b''
+        self.recorder.add(route, time.perf_counter() - started, 0 < status < 500)
+        return status, content.decode(errors='replace')
+
+    def login(self, email, password):
+        _, page = self.request('GET /login', '/login')
+        token = CSRF_TOKEN.search(page)
+        self.request('POST /login', '/login', {'email': email, 'password': password,
+                                                'csrf_token': token.group(1) if token else ''})
+
+
+class Fixtures:
+    """IDs the journeys pick from, read once from the database the app points at."""
+    def __init__(self, app, sample_size=1000):
+        with app.app_context():
+            read = app.db.read
+            # Sellers can buy too, so any user is a buyer
+            self.buyers = [row[0] for row in read('SELECT email FROM Users ORDER BY id LIMIT :n', n=sample_size)]
+            self.sellers = [row[0] for row in read('''
+                SELECT u.email FROM Users u JOIN Sellers s ON s.uid = u.id
+                ORDER BY u.id LIMIT :n''', n=sample_size)]
+            self.inventories = [row[0] for row in read('''
+                SELECT id FROM Inventories WHERE current_quantity > 0 ORDER BY id LIMIT :n''', n=sample_size)]
+            self.categories = [row[0] for row in read('SELECT id FROM Categories ORDER BY id LIMIT :n', n=sample_size)]
+            self.keywords = [row[0].split()[0] for row in read('SELECT name FROM Products ORDER BY id LIMIT :n', n=sample_size)]
+
+
+# Journeys: each is one visit of a virtual user
+def browse(user, fixtures):
+    user.request('GET /', '/')
+    user.request('GET /browse_category/<id>', f'/browse_category/{user.rng.choice(fixtures.categories)}')
+    user.request('GET /inventory/<invid>', f'/inventory/{user.rng.choice(fixtures.inventories)}')
+
+
+def search(user, fixtures):
+    keyword = user.rng.choice(fixtures.keywords)
+    user.request('POST /search_inventory_by_keyword', '/search_inventory_by_keyword', {'keyword_identifier': keyword})
+    user.request('POST /search_inventory_form', '/search_inventory_form',
+                 {'keyword': keyword, 'sort[]': user.rng.choice(['price_asc', 'rating_desc', 'sales_desc'])})
+    user.request('POST /sort_inventory_by_rating', '/sort_inventory_by_rating', {'sort_order': 'desc'})
+
+
+def shop(user, fixtures):
+    user.login(user.rng.choice(fixtures.buyers), user.password)
+    for invid in user.rng.sample(fixtures.inventories, min(2, len(fixtures.inventories))):
+        user.request('GET /inventory/<invid>', f'/inventory/{invid}')
+        user.request('POST /add_to_cart', '/add_to_cart', {'invid': invid, 'recommend_page': '1'})
+    user.request('GET /cart', '/cart')
+    user.request('GET /checkout_summary', '/checkout_summary')
+    user.request('POST /process_checkout', '/process_checkout', {})
+    user.request('GET /order_history', '/order_history')
+    user.request('GET /logout', '/logout')
+
+
+def history(user, fixtures):
+    user.login(user.rng.choice(fixtures.buyers), user.password)
+    user.request('GET /order_history', '/order_history')
+    user.request('GET /order_stats', '/order_stats')
+    user.request('GET /review', '/review')
+    user.request('GET /review/inventory/<invid>', f'/review/inventory/{user.rng.choice(fixtures.inventories)}')
+    user.request('GET /logout', '/logout')
+
+
+def sell(user, fixtures):
+    user.login(user.rng.choice(fixtures.sellers), user.password)
+    user.request('GET /inventory', '/inventory')
+    user.request('GET /inventory/seller_order_list', '/inventory/seller_order_list')
+    user.request('GET /logout', '/logout')
+
+
+JOURNEYS = {'browse': (browse, 40), 'search': (search, 25), 'shop': (shop, 15), 'history': (history, 10), 'sell': (sell, 10)}
+
+
+def run(base_url, fixtures, args):
+    recorder = Recorder()
+    names = [name for name in JOURNEYS if name in args.journeys]
+    weights = [JOURNEYS[name][1] for name in names]
+    deadline = time.monotonic() + args.duration
+
+    def virtual_user(index):
+        rng = random.Random(args.seed * 1000 + index)
+        user = VirtualUser(base_url, recorder, rng)
+        user.password = args.password
+        while time.monotonic() < deadline:
+            journey = JOURNEYS[rng.choices(names, weights)[0]][0]
+            journey(user, fixtures)
+            if args.think_time:
+                time.sleep(rng.uniform(0, 2 * args.think_time))
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=virtual_user, args=(index,), daemon=True) for index in range(args.users)]
+    for thread in threads:
+        thread.start()
+        time.sleep(args.ramp_up / max(args.users, 1))
+    for thread in threads:
+        thread.join()
+    return recorder.summary(time.monotonic() - started)
+
+
+def print_report(report, baseline=None):
+    print(f"{'route':45} {'count':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+          + (f" {'p95 vs base':>12}" if baseline else ''))
+    for route, stats in report.items():
+        line = (f"{route:45} {stats['count']:>7} {stats['errors']:>5} {stats['throughput']:>8.1f} "
+                f"{stats['p50']:>8.1f} {stats['p95']:>8.1f} {stats['p99']:>8.1f}")
+        if baseline and route in baseline['routes']:
+            line += f" {stats['p95'] / max(baseline['routes'][route]['p95'], 1e-6):>11.2f}x"
+        print(line)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def regressions(report, baseline, threshold):
+    """Routes whose p95 grew by more than threshold (e.g. 1.2 = 20%) compared to the baseline."""
+    return [route for route, stats in report.items()
+            if route in baseline['routes'] and stats['p95'] > threshold * baseline['routes'][route]['p95']]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the HTTP load test and compare against stored baselines.')
+    parser.add_argument('--url', default=None, help='target a running server instead of booting create_app()')
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--ramp-up', type=float, default=5, help='seconds over which the users start')
+    parser.add_argument('--think-time', type=float, default=0, help='mean pause between journeys, in seconds')
+    parser.add_argument('--journeys', default=','.join(JOURNEYS), help='comma-separated subset of: ' + ', '.join(JOURNEYS))
+    parser.add_argument('--password', default='test123')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', metavar='NAME', help='store the results as baseline NAME')
+    parser.add_argument('--compare', metavar='NAME', help='compare with baseline NAME; exit 1 on p95 regressions')
+    parser.add_argument('--threshold', type=float, default=1.2, help='allowed p95 ratio against the baseline')
+    args = parser.parse_args(argv)
+    args.journeys = args.journeys.split(',')
+
+    app = create_app()
+    fixtures = Fixtures(app)
+    server = None
+    base_url = args.url
+    if base_url is None:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+
+    try:
+        report = run(base_url, fixtures, args)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f'{args.compare}.json')) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(os.path.join(BASELINE_DIR, f'{args.save}.json'), 'w') as f:
+            json.dump({'revision': git_revision(), 'created': datetime.now().isoformat(timespec='seconds'),
+                       'settings': {'users': args.users, 'duration': args.duration, 'journeys': args.journeys,
+                                    'think_time': args.think_time, 'seed': args.seed},
+                       'routes': report}, f, indent=2)
+        print(f'saved baseline {args.save}')
+
+    if baseline:
+        slower = regressions(report, baseline, args.threshold)
+        if slower:
+            print(f"p95 regressions against {args.compare} ({baseline.get('revision')}): {', '.join(slower)}")
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""Bulk loader for large CSV snapshots (e.g. the output of generated/generate.py).
+
+Faster alternative to load.sql for big databases:
+
+1. the pending migrations (db/migrations) are applied with `flask migrate apply`,
+   after create.sql with --recreate, so the schema is the one the app runs on,
+2. every table but Schema_Migrations is emptied and its foreign keys,
+   primary/unique keys and secondary indexes are dropped (their definitions
+   are read from the catalog first),
+3. every CSV file is streamed through COPY, several tables at a time, into the
+   leading columns of its table (later columns, such as those added by
+   migrations, take their defaults),
+4. keys, indexes and foreign keys are rebuilt on the loaded data in parallel,
+5. identity sequences are reset and the derived tables (derived.sql) are built,
+6. rows/sec per table and the time of every phase are reported.
+
+The precomputed recommendation tables start empty: run
+`flask recommendations refresh` and `flask recommendations copurchases --full`
+afterwards.
+
+Usage (database settings are read from the environment / ../.flaskenv):
+
+    python db/bulk_load.py db/generated --recreate --workers 4
+"""
+import argparse
+import csv
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from dotenv import load_dotenv
+
+DB_DIR = os.path.dirname(os.path.abspath(__file__))
+# Tables describing the database rather than holding data: neither emptied nor rebuilt
+KEPT_TABLES = ('schema_migrations',)
+
+
+def connect(args):
+    conn = psycopg2.connect(args.dsn) if args.dsn else psycopg2.connect(
+        dbname=os.environ.get('DB_NAME'), user=os.environ.get('DB_USER'),
+        password=os.environ.get('DB_PASSWORD'), host=os.environ.get('DB_HOST'),
+        port=os.environ.get('DB_PORT'))
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute('SET synchronous_commit = off')
+        cur.execute('SET maintenance_work_mem = %s', (args.maintenance_work_mem,))
+    return conn
+
+
+def run_parallel(args, statements, label):
+    """Run independent statements on up to args.workers connections, timing each one."""
+    def run(statement):
+        conn = connect(args)
+        try:
+            started = time.monotonic()
+            with conn.cursor() as cur:
+                cur.execute(statement)
+            return statement, time.monotonic() - started
+        finally:
+            conn.close()
+    with ThreadPoolExecutor(args.workers) as pool:
+        for statement, seconds in pool.map(run, statements):
+            print(f'  {label}: {statement.splitlines()[0][:100]} ({seconds:.1f}s)', flush=True)
+
+
+def apply_migrations(args):
+    """Run `flask migrate apply` (as setup.sh does) against the database being loaded."""
+    env = dict(os.environ)
+    if args.dsn:
+        dsn = psycopg2.extensions.parse_dsn(args.dsn)
+        for setting, key in (('DB_NAME', 'dbname'), ('DB_USER', 'user'), ('DB_PASSWORD', 'password'),
+                             ('DB_HOST', 'host'), ('DB_PORT', 'port')):
+            if key in dsn:
+                env[setting] = dsn[key]
+    subprocess.run(['flask', 'migrate', 'apply'], cwd=os.path.join(DB_DIR, '..'), env=env, check=True)
+
+
+def user_tables(cur):
+    cur.execute('''
+        SELECT c.relname
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind = 'r' AND c.relname <> ALL(%s)
+        ''', (list(KEPT_TABLES),))
+    return [row[0] for row in cur.fetchall()]
+
+
+def capture_schema(cur):
+    """Return the definitions of the keys, foreign keys and secondary indexes of the loaded tables."""
+    cur.execute('''
+        SELECT conrelid::regclass::text, conname, contype, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE connamespace = 'public'::regnamespace AND contype IN ('p', 'u', 'f')
+          AND conrelid::regclass::text <> ALL(%s)
+        ORDER BY conrelid::regclass::text, conname
+        ''', (list(KEPT_TABLES),))
+    constraints = cur.fetchall()
+    cur.execute('''
+        SELECT x.indexrelid::regclass::text, pg_get_indexdef(x.indexrelid)
+        FROM pg_index x
+        JOIN pg_class t ON t.oid = x.indrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        WHERE n.nspname = 'public' AND t.relname <> ALL(%s)
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)
+        ''', (list(KEPT_TABLES),))
+    return constraints, cur.fetchall()
+
+
+def drop_schema_objects(cur, constraints, indexes):
+    # Foreign keys first: they depend on the referenced primary/unique keys
+    for table, name, kind, _ in sorted(constraints, key=lambda c: c[2] != 'f'):
+        cur.execute(f'ALTER TABLE {table} DROP CONSTRAINT {name}')
+    for name, _ in indexes:
+        cur.execute(f'DROP INDEX {name}')
+
+
+def rebuild_statements(constraints, kinds):
+    """One ALTER TABLE per table adding all of its constraints of the given kinds (a single pass over the table)."""
+    by_table = {}
+    for table, name, kind, definition in constraints:
+        if kind in kinds:
+            by_table.setdefault(table, []).append(f'ADD CONSTRAINT {name} {definition}')
+    return [f'ALTER TABLE {table}\n    ' + ',\n    '.join(clauses) for table, clauses in by_table.items()]
+
+
+def csv_columns(cur, table, path):
+    """Return the columns of table that a CSV file (no header) fills: as many leading columns as it has fields."""
+    with open(path, newline='') as f:
+        first = next(csv.reader(f), None)
+    cur.execute('''
+        SELECT attname
+        FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+        ''', (table,))
+    columns = [row[0] for row in cur.fetchall()]
+    return columns[:len(first)] if first else columns
+
+
+def copy_table(args, table, path):
+    """Stream one CSV file into its table; return (table, rows, seconds)."""
+    conn = connect(args)
+    try:
+        started = time.monotonic()
+        with conn.cursor() as cur, open(path) as f:
+            columns = ', '.join(csv_columns(cur, table, path))
+            cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '')", f, size=1024 * 1024)
+            rows = cur.rowcount
+        return table, rows, time.monotonic() - started
+    finally:
+        conn.close()
+
+
+def reset_sequences(cur):
+    """Move every identity sequence past the largest loaded id (what load.sql does per table)."""
+    cur.execute('''
+        SELECT c.relname, a.attname
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND a.attidentity <> '' AND NOT a.attisdropped
+        ''')
+    for table, column in cur.fetchall():
+        cur.execute(f'''
+            SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({column}), 0) + 1, false)
+            FROM {table}
+            ''', (table, column))
+
+
+def main(argv=None):
+    load_dotenv(os.path.join(DB_DIR, '..', '.flaskenv'))
+    parser = argparse.ArgumentParser(description='Bulk-load a directory of table CSV files with COPY.')
+    parser.add_argument('data', help='directory with one <Table>.csv file per table')
+    parser.add_argument('--dsn', default=None, help='libpq connection string (default: DB_* environment variables)')
+    parser.add_argument('--recreate', action='store_true', help='drop everything and run create.sql and the migrations first')
+    parser.add_argument('--workers', type=int, default=4, help='tables / indexes processed concurrently')
+    parser.add_argument('--maintenance-work-mem', default='512MB', help='memory per index build')
+    args = parser.parse_args(argv)
+
+    phases = []
+    started = time.monotonic()
+    conn = connect(args)
+    cur = conn.cursor()
+
+    if args.recreate:
+        cur.execute('DROP SCHEMA public CASCADE; CREATE SCHEMA public')
+        with open(os.path.join(DB_DIR, 'create.sql')) as f:
+            cur.execute(f.read())
+        phases.append(('create schema', time.monotonic() - started))
+
+    mark = time.monotonic()
+    apply_migrations(args)
+    phases.append(('apply migrations', time.monotonic() - mark))
+
+    mark = time.monotonic()
+    tables = {table.lower(): table for table in user_tables(cur)}
+    constraints, indexes = capture_schema(cur)
+    cur.execute('TRUNCATE ' + ', '.join(tables.values()) + ' RESTART IDENTITY')
+    drop_schema_objects(cur, constraints, indexes)
+    phases.append(('drop keys and indexes', time.monotonic() - mark))
+
+    mark = time.monotonic()
+    files = [(tables[name[:-4].lower()], os.path.join(args.data, name)) for name in sorted(os.listdir(args.data))
+             if name.endswith('.csv') and name[:-4].lower() in tables]
+    # Largest files first so the slowest table starts right away
+    files.sort(key=lambda item: os.path.getsize(item[1]), reverse=True)
+    total_rows = 0
+    with ThreadPoolExecutor(args.workers) as pool:
+        for table, rows, seconds in pool.map(lambda item: copy_table(args, *item), files):
+            total_rows += rows
+            print(f'  copy: {table}: {rows} rows in {seconds:.1f}s ({rows / max(seconds, 1e-6):,.0f} rows/s)', flush=True)
+    phases.append((f'copy {total_rows} rows', time.monotonic() - mark))
+
+    for label, statements in (('keys', rebuild_statements(constraints, ('p', 'u'))),
+                              ('indexes', [definition for _, definition in indexes]),
+                              ('foreign keys', rebuild_statements(constraints, ('f',)))):
+        mark = time.monotonic()
+        run_parallel(args, statements, label)
+        phases.append((f'build {label}', time.monotonic() - mark))
+
+    mark = time.monotonic()
+    reset_sequences(cur)
+    with open(os.path.join(DB_DIR, 'derived.sql')) as f:
+        cur.execute(f.read())
+    cur.execute('ANALYZE')
+    phases.append(('sequences, derived tables, analyze', time.monotonic() - mark))
+    conn.close()
+
+    for label, seconds in phases:
+        print(f'{label}: {seconds:.1f}s')
+    elapsed = time.monotonic() - started
+    print(f'total: {elapsed:.1f}s ({total_rows / max(elapsed, 1e-6):,.0f} rows/s overall)')
+
+
+if __name__ == '__main__':
+    main()
@@ -142,6 +142,47 @@ CREATE TABLE FeedbackUpvotes (
 );
 
 
+-- Search: one weighted full-text document per inventory (design, product and
+-- category labels), kept up to date by app/models/search.py
+CREATE VIEW Inventory_Search_Documents AS
+SELECT
+    i.id AS invid,
+    setweight(to_tsvector('english', COALESCE(d.name, '')), 'A') ||
+    setweight(to_tsvector('english', p.name), 'A') ||
+    setweight(to_tsvector('english', COALESCE(STRING_AGG(c.label, ' '), '')), 'B') ||
+    setweight(to_tsvector('english', COALESCE(d.description, '')), 'C') ||
+    setweight(to_tsvector('english', COALESCE(p.description, '')), 'C') AS document
+FROM Inventories i
+JOIN Products p ON p.id = i.pid
+LEFT JOIN Inventory_Designs d ON d.invid = i.id
+LEFT JOIN Tags t ON t.pid = p.id
+LEFT JOIN Categories c ON c.id = t.cid
+GROUP BY i.id, p.name, p.description, d.name, d.description;
+
+CREATE TABLE Inventory_Search (
+    invid INT NOT NULL PRIMARY KEY REFERENCES Inventories(id) ON DELETE CASCADE,
+    document TSVECTOR NOT NULL
+);
+
+CREATE INDEX Inventory_Search_Document_Idx ON Inventory_Search USING GIN (document);
+
+
+-- Per-inventory review and sales aggregates, kept current by the review and
+-- checkout write paths (app/models/stats.py) so sorting never re-aggregates
+CREATE TABLE Inventory_Stats (
+    invid INT NOT NULL PRIMARY KEY REFERENCES Inventories(id) ON DELETE CASCADE,
+    review_count INT NOT NULL DEFAULT 0,
+    rating_sum INT NOT NULL DEFAULT 0,
+    average_rating NUMERIC GENERATED ALWAYS AS
+        (CASE WHEN review_count > 0 THEN CAST(rating_sum AS NUMERIC) / review_count ELSE 0 END) STORED,
+    units_sold INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0
+);
+
+CREATE INDEX Inventory_Stats_Rating_Idx ON Inventory_Stats (average_rating, invid);
+CREATE INDEX Inventory_Stats_Sales_Idx ON Inventory_Stats (units_sold, invid);
+
+
 -- NOT USED
 
 
@@ -0,0 +1,22 @@
+-- Tables derived from the loaded data; run after every (bulk) load by
+-- load.sql and bulk_load.py.
+
+-- Search documents
+INSERT INTO Inventory_Search (invid, document)
+SELECT invid, document FROM Inventory_Search_Documents;
+
+-- Per-inventory review and sales stats
+INSERT INTO Inventory_Stats (invid, review_count, rating_sum, units_sold, revenue)
+SELECT i.id, COALESCE(r.review_count, 0), COALESCE(r.rating_sum, 0),
+       COALESCE(op.units_sold, 0), COALESCE(op.revenue, 0)
+FROM Inventories i
+LEFT JOIN (
+    SELECT invid, COUNT(*) AS review_count, SUM(rating) AS rating_sum
+    FROM Reviews
+    GROUP BY invid
+) r ON r.invid = i.id
+LEFT JOIN (
+    SELECT invid, SUM(quantity) AS units_sold, SUM(quantity * price) AS revenue
+    FROM Order_Products
+    GROUP BY invid
+) op ON op.invid = i.id;
@@ -1,277 +1,360 @@
-from werkzeug.security import generate_password_hash
+"""Synthetic data generator for load testing.
+
+Writes one CSV file per table (in the format expected by db/load.sql) into
+the output directory, so a database of any size can be built with
+
+    python generate.py --users 1000000 --products 2000000 --orders 5000000 --workers 8
+    python ../bulk_load.py . --recreate     (or ../setup.sh generated/ for small sizes)
+
+Every table is split into chunks of ids that are generated in parallel
+worker processes and streamed to disk; rows never accumulate in memory.
+Foreign keys are always valid and the output only depends on --seed.
+
+Skew follows real shops: product (inventory) popularity is Zipfian, so a
+few inventories get most of the order lines, carts and reviews, and the
+number of inventories per seller follows a power law.
+"""
+import argparse
 import csv
-from faker import Faker
+import math
+import os
 import random
+import shutil
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from multiprocessing import Pool
+from faker import Faker
+from werkzeug.security import generate_password_hash
+
+
+TABLES = ['Images', 'Users', 'Categories', 'Products', 'Tags', 'Carts', 'Sellers', 'Inventories',
+          'Inventory_Designs', 'Inventory_Images', 'Orders', 'Order_Products', 'Cart_Products',
+          'Reviews', 'Feedbacks', 'Review_Images', 'Feedback_Images']
 
-num_users = 100
-num_products = 500
-num_images = 100
-num_carts = 100
-num_sellers = 100
-num_inventories = 500
-num_orders = 200
-num_categories = 200
-num_design = 30
-num_feedbacks = 300
-num_reviews = 200
+CATEGORIES = [
+    "Ice Cream", "Beer", "Eggs", "Painting", "Books",
+    "Electronics", "Clothing", "Jewelry", "Furniture", "Toys",
+    "Games", "Sports", "Outdoor", "Gardening", "Appliances",
+    "Shoes", "Bags", "Watches", "Sunglasses", "Cosmetics"
+]
 
+START_TIME = datetime(2023, 1, 1)
+SECONDS_PER_YEAR = 365 * 24 * 3600
 
-Faker.seed(0)
-fake = Faker()
+# Set in every worker by init_worker(): the parsed options and the text pools
+options = None
+pools = None
 
 
 def get_csv_writer(f):
-    return csv.writer(f, dialect='unix')
-
-def gen_images(num_images):
-    with open('Images.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Images...', end=' ', flush=True)
-        for imgid in range(10, num_images):
-            if imgid % 100 == 0:
-                print(f'{imgid}', end=' ', flush=True)
-            content = f'{imgid}.jpeg'
-            writer.writerow([imgid, content])
-        print(f'{num_images} generated')
-    return 
-
-
-def gen_users(num_users):
-    with open('Users.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Users...', end=' ', flush=True)
-        for uid in range(7, num_users):
-            if uid % 10 == 0:
-                print(f'{uid}', end=' ', flush=True)
-            profile = fake.profile()
-            email = profile['mail']
-            plain_password = f'test123'
-            password = generate_password_hash(plain_password)
-            name_components = profile['name'].split(' ')
-            firstname = name_components[0]
-            lastname = name_components[-1]
-            address = profile['address']
-            balance = random.randint(0, 2000)
-            writer.writerow([uid, email, password, firstname, lastname, address, balance])
-        print(f'{num_users} generated')
-    return
-
-
-def gen_products(num_products):
-    available_pids = []
-    with open('Products.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Products...', end=' ', flush=True)
-        for pid in range(7, num_products):
-            if pid % 100 == 0:
-                print(f'{pid}', end=' ', flush=True)
-            uid = fake.random_int(min=0, max=num_users-1)
-            name = fake.sentence(nb_words=4)[:-1]
-            description = fake.sentence()
-            imgid = random.randint(1, num_images)
-            available_pids.append(pid)
-            writer.writerow([pid, uid, name, description, imgid])
-        print(f'{num_products} generated; {len(available_pids)} available')
-    return available_pids
-
-def gen_categories(num_categories):
-    categories = [
-        "Ice Cream", "Beer", "Eggs", "Painting", "Books", 
-        "Electronics", "Clothing", "Jewelry", "Furniture", "Toys",
-        "Games", "Sports", "Outdoor", "Gardening", "Appliances",
-        "Shoes", "Bags", "Watches", "Sunglasses", "Cosmetics"
-    ]
-    
-    # Generate more categories to reach 100
-    while len(categories) < num_categories:
-        category = fake.unique.word().capitalize()
-        if category not in categories:
-            categories.append(category)
-            
-    with open('Categories.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Categories...', end=' ', flush=True)
-        for idx, category in enumerate(categories, start=1):
-            if idx % 100 == 0:
-                print(f'{idx}', end=' ', flush=True)
-            writer.writerow([idx, category])
-        print(f'{num_categories} generated')
-    return 
-
-def gen_tags(num_products, num_categories):
-    with open('Tags.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Tags...', end=' ', flush=True)
-        for pid in range(1, num_products):
-            num_tags = random.randint(1, 5)
-            assigned_categories = random.sample(range(1, num_categories+1), num_tags)
-            for cid in assigned_categories:
-                writer.writerow([pid, cid])
-        print(f'All tags generated')
-    return 
-
-def gen_carts(num_carts):
-    with open('Carts.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Carts...', end=' ', flush=True)
-        for cid in range(0, num_carts):
-            if cid % 100 == 0:
-                print(f'{cid}', end=' ', flush=True)
-            uid = cid
-            writer.writerow([cid, uid])
-        print(f'{num_carts} generated')
-    return 
-
-def gen_orders(num_orders):
-    with open('Orders.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Orders...', end=' ', flush=True)
-        for oid in range(9, num_orders):
-            if oid % 100 == 0:
-                print(f'{oid}', end=' ', flush=True)
-            uid = fake.random_int(min=0, max=10)
-            time_created = fake.date_time_this_year()
-            fulfillment_status = 'pending'
-            time_fulfilled = None
-            writer.writerow([oid, uid, time_created, fulfillment_status, time_fulfilled])
-        print(f'{num_orders} generated')
-    return 
-
-def gen_sellers(num_sellers):
-    with open('Sellers.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Sellers...', end=' ', flush=True)
-        for sid in range(6, num_sellers):
-            if sid % 100 == 0:
-                print(f'{sid}', end=' ', flush=True)
-            uid = sid
-            writer.writerow([sid, uid])
-        print(f'{num_sellers} generated')
-    return 
-
-def gen_inventories(num_inventories):
-    with open('Inventories.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Inventories...', end=' ', flush=True)
-        for invid in range(13, num_inventories):
-            if invid % 100 == 0:
-                print(f'{invid}', end=' ', flush=True)
-            sid = fake.random_int(min=0, max=10)
-            pid = fake.random_int(min=1, max=num_products-1)
-            current_quantity = random.randint(1, 100)
-            price = f'{str(fake.random_int(max=20))}.{fake.random_int(max=99):02}'
-            writer.writerow([invid, sid, pid, current_quantity, price])
-        print(f'{num_inventories} generated')
-    return 
-
-def gen_inventories_designs(num_design):
-    with open('Inventory_Designs.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Inventory_Designs...', end=' ', flush=True)
-        for _ in range(num_design):
-            invid = random.randint(1, 100)
-            name = fake.sentence(nb_words=4)[:-1]
-            description = fake.sentence()
-            writer.writerow([invid, name, description])
-        print(f'{num_design} generated')
-    return 
-
-def gen_inventories_images():
-    with open('Inventory_Images.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Inventory_Images...', end=' ', flush=True)
-        for _ in range(20):
-            num_images = random.randint(1, 5)
-            for _ in range(num_images):
-                invid = random.randint(1, 10)
-                imgid = random.randint(1, 100)
+    # Minimal quoting, so that empty fields stay unquoted and load as NULL
+    return csv.writer(f, dialect='unix', quoting=csv.QUOTE_MINIMAL)
+
+
+def zipf_rank(rng, n, s):
+    """Draw a rank in [1, n] with P(rank = k) roughly proportional to 1 / k**s."""
+    return zipf_inverse(rng.random(), n, s)
+
+
+def zipf_inverse(u, n, s):
+    """Rank at quantile u of the continuous power law on [1, n]; O(1) memory even for tens of millions of items."""
+    if abs(s - 1.0) < 1e-9:
+        rank = int(n ** u)
+    else:
+        rank = int(((n ** (1 - s) - 1) * u + 1) ** (1 / (1 - s)))
+    return min(max(rank, 1), n)
+
+
+def scatter(rank, n):
+    """Map a popularity rank to an id in [1, n] so that popular ids are spread over the table."""
+    return (rank - 1) * scatter_step(n) % n + 1
+
+
+@lru_cache(maxsize=None)
+def scatter_step(n):
+    """A multiplier coprime with n, so that scatter() is a permutation of [1, n]."""
+    step = 2654435761 % n or 1
+    while math.gcd(step, n) != 1:
+        step += 1
+    return step
+
+
+def hash_fraction(*values):
+    """Deterministic pseudo-random number in [0, 1) derived from integers (cheaper than seeding a Random)."""
+    h = 0
+    for value in values:
+        h = (h * 1000003 + value) * 2654435761 % 2 ** 32
+    return h / 2 ** 32
+
+
+def inventory_price(invid):
+    """Price of an inventory; order and cart lines use the same function, so they always match."""
+    return f'{(invid * 2654435761) % 19900 / 100 + 1:.2f}'
+
+
+def random_time(rng):
+    return START_TIME + timedelta(seconds=rng.randrange(SECONDS_PER_YEAR))
+
+
+def build_pools(seed):
+    """Pre-generate the text fragments rows are assembled from (Faker is far too slow per row)."""
+    Faker.seed(seed)
+    fake = Faker()
+    return {
+        'first_names': [fake.first_name() for _ in range(500)],
+        'last_names': [fake.last_name() for _ in range(500)],
+        'addresses': [fake.address().replace('\n', ', ') for _ in range(1000)],
+        'words': [word.capitalize() for word in fake.words(nb=1000)],
+        'sentences': [fake.sentence() for _ in range(2000)],
+    }
+
+
+def init_worker(opts, text_pools):
+    global options, pools
+    options = opts
+    pools = text_pools
+
+
+# Row generators: each writes the rows with ids in [start, end) for one table
+def gen_images(writer, rng, start, end):
+    for imgid in range(start, end):
+        writer.writerow([imgid, f'{imgid % 100 + 1}.jpeg'])
+
+
+def gen_users(writer, rng, start, end):
+    for uid in range(start, end):
+        firstname = rng.choice(pools['first_names'])
+        lastname = rng.choice(pools['last_names'])
+        email = f'{firstname}.{lastname}.{uid}@example.com'.lower()
+        balance = f'{rng.randint(0, 200000) / 100:.2f}'
+        writer.writerow([uid, email, options.password_hash, firstname, lastname, rng.choice(pools['addresses']), balance])
+
+
+def gen_categories(writer, rng, start, end):
+    for cid in range(start, end):
+        label = CATEGORIES[cid - 1] if cid <= len(CATEGORIES) else f'{rng.choice(pools["words"])} {cid}'
+        writer.writerow([cid, label])
+
+
+def gen_products(writer, rng, start, end):
+    for pid in range(start, end):
+        uid = rng.randint(1, options.users)
+        name = f'{rng.choice(pools["words"])} {rng.choice(pools["words"])} {pid}'
+        imgid = rng.randint(1, options.images)
+        writer.writerow([pid, uid, name, rng.choice(pools['sentences']), imgid])
+
+
+def gen_tags(writer, rng, start, end):
+    for pid in range(start, end):
+        # Popular categories hold most products
+        cids = {zipf_rank(rng, options.categories, options.skew) for _ in range(rng.randint(1, 3))}
+        for cid in sorted(cids):
+            writer.writerow([pid, cid])
+
+
+def gen_carts(writer, rng, start, end):
+    for cid in range(start, end):
+        writer.writerow([cid, cid])
+
+
+def gen_sellers(writer, rng, start, end):
+    for sid in range(start, end):
+        writer.writerow([sid, sid])
+
+
+def gen_inventories(writer, rng, start, end):
+    for invid in range(start, end):
+        # The k-th offer of a product goes to a different seller, keeping (sid, pid) unique;
+        # the base seller of each product is drawn from a power law
+        pid = (invid - 1) % options.products + 1
+        k = (invid - 1) // options.products
+        base = zipf_inverse(hash_fraction(options.seed, pid), options.sellers, options.skew)
+        sid = (base - 1 + k) % options.sellers + 1
+        writer.writerow([invid, sid, pid, rng.randint(0, 500), inventory_price(invid)])
+
+
+def gen_inventory_designs(writer, rng, start, end):
+    for invid in range(start, end):
+        if rng.random() < options.design_fraction:
+            name = f'{rng.choice(pools["words"])} Edition {invid}'
+            writer.writerow([invid, name, rng.choice(pools['sentences'])])
+
+
+def gen_inventory_images(writer, rng, start, end):
+    for invid in range(start, end):
+        if rng.random() < options.image_fraction:
+            for imgid in sorted({rng.randint(1, options.images) for _ in range(rng.randint(1, 3))}):
                 writer.writerow([invid, imgid])
-        print(f'inventory images generated')
-    return 
-
-def gen_orders_products():
-    with open('Order_Products.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Order_Products...', end=' ', flush=True)
-        for oid in range(num_orders):
-            if oid % 100 == 0:
-                print(f'{oid}', end=' ', flush=True)
-            num_requested = random.randint(1, 5)
-            for _ in range(num_requested):
-                invid = fake.random_int(min=1, max=92)
-                quantity = random.randint(1, 3)
-                # price = f'{str(fake.random_int(max=10))}.{fake.random_int(max=99):02}'
-                price = 0
-                fulfillment_status = 'pending'
-                time_fulfilled = None
-                writer.writerow([oid, invid, quantity, price, fulfillment_status, time_fulfilled])
-    return 
-
-def gen_cart_products():
-    with open('Cart_Products.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Cart_Products...', end=' ', flush=True)
-        for cid in range(num_carts):
-            if cid % 100 == 0:
-                print(f'{cid}', end=' ', flush=True)
-            num_requested = random.randint(1, 5)
-            for _ in range(num_requested):
-                invid = fake.random_int(min=1, max=199)
-                quantity = random.randint(1, 3)
-                unit_price = f'{str(fake.random_int(max=10))}.{fake.random_int(max=99):02}'
-                in_cart = "TRUE"
-                writer.writerow([cid, invid, quantity, unit_price, in_cart])
-    return
-
-def gen_reviews(num_reviews):
-    with open('Reviews.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Reviews...', end=' ', flush=True)
-        for rid in range(4, num_reviews):
-            if rid % 100 == 0:
-                print(f'{rid}', end=' ', flush=True)
-            uid = fake.random_int(min=0, max=10)
-            invid = fake.random_int(min=30, max=100)
-            rating = random.randint(1, 5)
-            review = fake.sentence()
-            time_created = fake.date_time_this_year()
-            upvote = fake.random_int(min=0, max=100)
-            writer.writerow([rid, uid, invid, rating, review, time_created, upvote])
-        print(f'{num_reviews} generated')
-    return  
-
-def gen_feedback(num_feedbacks):
-    with open('Feedbacks.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Feedbacks...', end=' ', flush=True)
-        for fid in range(12, num_feedbacks):
-            if fid % 100 == 0:
-                print(f'{fid}', end=' ', flush=True)
-            uid = fake.random_int(min=1, max=99)
-            sid = fake.random_int(min=1, max=98)
-            if uid == sid: 
-                sid += 1
-            rating = random.randint(1, 5)
-            review = fake.sentence()
-            time_created = fake.date_time_this_year()
-            upvote = fake.random_int(min=0, max=100)
-            writer.writerow([fid, uid, sid, rating, review, time_created, upvote])
-        print(f'{num_feedbacks} generated')
-    return 
-
-
-# gen_images(num_images)
-# gen_users(num_users)
-# available_pids = gen_products(num_products)
-# gen_sellers(num_sellers)
-# gen_categories(num_categories)
-# gen_carts(num_carts)
-# gen_tags(num_products, num_categories)
-# gen_orders(num_orders)
-# gen_inventories(num_inventories)
-# gen_inventories_designs(num_design)
-# gen_inventories_images()
-# gen_orders_products()
-# gen_cart_products()
-# gen_reviews(num_reviews)
-gen_feedback(num_feedbacks)
\ No newline at end of file
+
+
+def order_status(rng):
+    """Older orders are fulfilled; the status and time are shared by the order and its lines."""
+    time_created = random_time(rng)
+    if time_created < START_TIME + timedelta(days=330):
+        return time_created, 'fulfilled', time_created + timedelta(days=rng.randint(1, 7))
+    return time_created, 'pending', None
+
+
+def gen_orders(writer, rng, start, end):
+    for oid in range(start, end):
+        # Same per-order stream as gen_order_products, so statuses agree
+        order_rng = random.Random(options.seed * 104729 + oid)
+        uid = zipf_rank(order_rng, options.users, options.buyer_skew)
+        time_created, status, time_fulfilled = order_status(order_rng)
+        writer.writerow([oid, uid, time_created, status, time_fulfilled or ''])
+
+
+def gen_order_products(writer, rng, start, end):
+    for oid in range(start, end):
+        order_rng = random.Random(options.seed * 104729 + oid)
+        zipf_rank(order_rng, options.users, options.buyer_skew)
+        _, status, time_fulfilled = order_status(order_rng)
+        for invid in sample_inventories(rng, rng.randint(1, 2 * options.lines_per_order - 1)):
+            writer.writerow([oid, invid, rng.randint(1, 3), inventory_price(invid), status, time_fulfilled or ''])
+
+
+def gen_cart_products(writer, rng, start, end):
+    for cid in range(start, end):
+        if rng.random() < options.cart_fraction:
+            for invid in sample_inventories(rng, rng.randint(1, 5)):
+                in_cart = 'TRUE' if rng.random() < 0.9 else 'FALSE'
+                writer.writerow([cid, invid, rng.randint(1, 3), inventory_price(invid), in_cart])
+
+
+def gen_reviews(writer, rng, start, end):
+    for rid in range(start, end):
+        uid = zipf_rank(rng, options.users, options.buyer_skew)
+        invid = scatter(zipf_rank(rng, options.inventories, options.skew), options.inventories)
+        rating = rng.choices([1, 2, 3, 4, 5], weights=[5, 5, 15, 35, 40])[0]
+        writer.writerow([rid, uid, invid, rating, rng.choice(pools['sentences']), random_time(rng), rng.randint(0, 20)])
+
+
+def gen_feedbacks(writer, rng, start, end):
+    for fid in range(start, end):
+        uid = rng.randint(1, options.users)
+        sid = zipf_rank(rng, options.sellers, options.skew)
+        rating = rng.choices([1, 2, 3, 4, 5], weights=[5, 5, 15, 35, 40])[0]
+        writer.writerow([fid, uid, sid, rating, rng.choice(pools['sentences']), random_time(rng), rng.randint(0, 20)])
+
+
+def sample_inventories(rng, count):
+    """Distinct inventories for one order or cart, drawn by Zipfian popularity."""
+    invids = set()
+    for _ in range(count * 3):
+        invids.add(scatter(zipf_rank(rng, options.inventories, options.skew), options.inventories))
+        if len(invids) == count:
+            break
+    return sorted(invids)
+
+
+GENERATORS = {
+    'Images': (gen_images, 'images'),
+    'Users': (gen_users, 'users'),
+    'Categories': (gen_categories, 'categories'),
+    'Products': (gen_products, 'products'),
+    'Tags': (gen_tags, 'products'),
+    'Carts': (gen_carts, 'users'),
+    'Sellers': (gen_sellers, 'sellers'),
+    'Inventories': (gen_inventories, 'inventories'),
+    'Inventory_Designs': (gen_inventory_designs, 'inventories'),
+    'Inventory_Images': (gen_inventory_images, 'inventories'),
+    'Orders': (gen_orders, 'orders'),
+    'Order_Products': (gen_order_products, 'orders'),
+    'Cart_Products': (gen_cart_products, 'users'),
+    'Reviews': (gen_reviews, 'reviews'),
+    'Feedbacks': (gen_feedbacks, 'feedbacks'),
+}
+
+
+def gen_chunk(task):
+    """Worker entry point: write the rows of ids [start, end) of one table to a part file."""
+    table, index, start, end = task
+    generator, _ = GENERATORS[table]
+    path = os.path.join(options.out, f'{table}.csv.part{index:05d}')
+    rng = random.Random(f'{options.seed}:{table}:{index}')
+    with open(path, 'w', newline='') as f:
+        generator(get_csv_writer(f), rng, start, end)
+    return table, index, end - start
+
+
+def chunks(table, count, chunk_size):
+    return [(table, index, start, min(start + chunk_size, count + 1))
+            for index, start in enumerate(range(1, count + 1, chunk_size))]
+
+
+def concatenate(table, parts):
+    """Stream the part files of a table into <table>.csv in id order and delete them."""
+    with open(os.path.join(options.out, f'{table}.csv'), 'wb') as out:
+        for index in range(parts):
+            path = os.path.join(options.out, f'{table}.csv.part{index:05d}')
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, out, 1024 * 1024)
+            os.remove(path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate CSV files for db/load.sql at any scale.')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--sellers', type=int, default=None, help='default: 10%% of the users')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--inventories', type=int, default=None, help='default: 1.5 x products')
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--images', type=int, default=500)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--lines-per-order', type=int, default=3, help='average order lines per order')
+    parser.add_argument('--reviews', type=int, default=None, help='default: 2 x orders')
+    parser.add_argument('--feedbacks', type=int, default=None, help='default: orders / 2')
+    parser.add_argument('--cart-fraction', type=float, default=0.3, help='share of users with a non-empty cart')
+    parser.add_argument('--design-fraction', type=float, default=0.2, help='share of inventories with a design')
+    parser.add_argument('--image-fraction', type=float, default=0.3, help='share of inventories with own images')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of inventory, category and seller popularity')
+    parser.add_argument('--buyer-skew', type=float, default=0.8, help='Zipf exponent of orders and reviews per user')
+    parser.add_argument('--password', default='test123', help='password of every generated user')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=100000, help='rows (or parent ids) per worker task')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='.', help='output directory')
+    opts = parser.parse_args(argv)
+    opts.sellers = opts.sellers or max(1, opts.users // 10)
+    opts.inventories = opts.inventories or opts.products * 3 // 2
+    opts.reviews = opts.reviews if opts.reviews is not None else opts.orders * 2
+    opts.feedbacks = opts.feedbacks if opts.feedbacks is not None else opts.orders // 2
+    if opts.sellers > opts.users:
+        parser.error('--sellers cannot exceed --users (every seller is a user)')
+    if opts.inventories > opts.products * opts.sellers:
+        parser.error('--inventories cannot exceed products x sellers (one offer per seller and product)')
+    return opts
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    os.makedirs(opts.out, exist_ok=True)
+    # Hashing is deliberately slow; every user shares one precomputed hash
+    opts.password_hash = generate_password_hash(opts.password)
+    text_pools = build_pools(opts.seed)
+    init_worker(opts, text_pools)
+
+    tasks = []
+    for table, (_, count_option) in GENERATORS.items():
+        tasks += chunks(table, getattr(opts, count_option), opts.chunk_size)
+    parts = {table: 0 for table in GENERATORS}
+    rows = {table: 0 for table in GENERATORS}
+
+    started = time.monotonic()
+    with Pool(opts.workers, initializer=init_worker, initargs=(opts, text_pools)) as pool:
+        for table, index, count in pool.imap_unordered(gen_chunk, tasks):
+            parts[table] += 1
+            rows[table] += count
+            print(f'{table}: {rows[table]} ids', flush=True)
+    for table in GENERATORS:
+        concatenate(table, parts[table])
+    # Tables that load.sql expects but the generator leaves empty
+    for table in TABLES:
+        if table not in GENERATORS:
+            open(os.path.join(opts.out, f'{table}.csv'), 'w').close()
+    print(f'generated {len(GENERATORS)} tables in {time.monotonic() - started:.1f}s into {os.path.abspath(opts.out)}')
+
+
+if __name__ == '__main__':
+    main()
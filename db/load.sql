@@ -58,4 +58,7 @@ SELECT pg_catalog.setval('public.feedbacks_id_seq',
 \COPY Inventory_Designs FROM 'Inventory_Designs.csv' WITH DELIMITER ',' NULL '' CSV
 \COPY Inventory_Images FROM 'Inventory_Images.csv' WITH DELIMITER ',' NULL '' CSV
 \COPY Feedback_Images FROM 'Feedback_Images.csv' WITH DELIMITER ',' NULL '' CSV
-\COPY Review_Images FROM 'Review_Images.csv' WITH DELIMITER ',' NULL '' CSV
\ No newline at end of file
+\COPY Review_Images FROM 'Review_Images.csv' WITH DELIMITER ',' NULL '' CSV
+
+-- Derived tables (search documents, stats), built once the source tables are loaded
+\ir derived.sql
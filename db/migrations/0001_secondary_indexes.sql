@@ -0,0 +1,32 @@
+-- Secondary indexes on the foreign keys the model queries filter and join on.
+-- Applied (and recorded in Schema_Migrations) by `flask migrate apply`.
+-- Built concurrently, outside a transaction, so that orders and carts keep
+-- being written while the indexes are built on large tables.
+-- migrate: no-transaction
+
+-- Cart page, checkout and the cart badge: lines of one cart, split by in_cart
+CREATE INDEX CONCURRENTLY IF NOT EXISTS Cart_Products_Cid_In_Cart_Idx ON Cart_Products (cid, in_cart);
+
+-- Order details and summaries; sales per inventory and seller order views
+CREATE INDEX CONCURRENTLY IF NOT EXISTS Order_Products_Oid_Idx ON Order_Products (oid);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS Order_Products_Invid_Idx ON Order_Products (invid);
+
+-- Other sellers of the same product, product edits
+CREATE INDEX CONCURRENTLY IF NOT EXISTS Inventories_Pid_Idx ON Inventories (pid);
+
+-- Categories of a product and products of a category
+CREATE INDEX CONCURRENTLY IF NOT EXISTS Tags_Pid_Idx ON Tags (pid);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS Tags_Cid_Idx ON Tags (cid);
+
+-- Reviews of an inventory and of a user
+CREATE INDEX CONCURRENTLY IF NOT EXISTS Reviews_Invid_Idx ON Reviews (invid);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS Reviews_Uid_Idx ON Reviews (uid);
+
+-- Feedback of a seller
+CREATE INDEX CONCURRENTLY IF NOT EXISTS Feedbacks_Sid_Idx ON Feedbacks (sid);
+
+-- Images of an inventory
+CREATE INDEX CONCURRENTLY IF NOT EXISTS Inventory_Images_Invid_Idx ON Inventory_Images (invid);
+
+-- Order history of a user, newest first
+CREATE INDEX CONCURRENTLY IF NOT EXISTS Orders_Uid_Time_Created_Idx ON Orders (uid, time_created);
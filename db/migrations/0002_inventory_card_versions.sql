@@ -0,0 +1,10 @@
+-- Version stamp of the rendered catalog card of each inventory.
+-- Bumped by the model methods that change what a card shows (price, stock,
+-- design, images, product name/description); the card fragment cache in
+-- app/fragments.py keys rendered cards by (inventory, version), so a bump in
+-- any worker process makes every process re-render that card.
+-- Inventories without a row are at version 0.
+CREATE TABLE IF NOT EXISTS Inventory_Card_Versions (
+    invid INT NOT NULL PRIMARY KEY REFERENCES Inventories(id) ON DELETE CASCADE,
+    version INT NOT NULL DEFAULT 0
+);
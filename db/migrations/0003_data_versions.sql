@@ -0,0 +1,11 @@
+-- Change stamps of the tables behind the publicly cacheable pages.
+-- After every commit that wrote one of the tracked tables, the app bumps the
+-- row of each written table (app/models/version.py); the conditional GET
+-- support in app/http_cache.py derives ETag / Last-Modified from these rows.
+-- The '*' row is the epoch: it is (re)created on first use, so ETags never
+-- survive a reload of the database.
+CREATE TABLE IF NOT EXISTS Data_Versions (
+    scope VARCHAR(64) NOT NULL PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at timestamp without time zone NOT NULL DEFAULT (current_timestamp AT TIME ZONE 'UTC')
+);
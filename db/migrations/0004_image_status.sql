@@ -0,0 +1,11 @@
+-- Processing state of uploaded images.
+-- Uploads are inserted as 'pending' (showing the placeholder file) and handed
+-- to the image worker (app/image_worker.py), which publishes the resized
+-- files and marks the row 'ready', or 'failed' if the upload cannot be decoded.
+-- Existing rows are already processed.
+ALTER TABLE Images
+    ADD COLUMN IF NOT EXISTS status VARCHAR(10) NOT NULL DEFAULT 'ready'
+    CHECK (status IN ('pending', 'ready', 'failed'));
+
+-- `flask images process-pending` looks up the (few) unfinished rows
+CREATE INDEX IF NOT EXISTS images_unfinished_idx ON Images (id) WHERE status <> 'ready';
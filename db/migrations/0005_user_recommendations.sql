@@ -0,0 +1,14 @@
+-- Precomputed recommendations shown on the cart page.
+-- Rebuilt as a whole by the batch job `flask recommendations refresh`
+-- (app/models/recommendation.py): the top candidates of every user who has
+-- bought something, ranked by category affinity x sales. The cart page only
+-- looks up the user's rows and drops what they bought or carted since.
+CREATE TABLE IF NOT EXISTS User_Recommendations (
+    uid INT NOT NULL REFERENCES Users(id) ON DELETE CASCADE,
+    rank INT NOT NULL,
+    invid INT NOT NULL REFERENCES Inventories(id) ON DELETE CASCADE,
+    cid INT NOT NULL REFERENCES Categories(id) ON DELETE CASCADE,
+    score DOUBLE PRECISION NOT NULL,
+    computed_at timestamp without time zone NOT NULL DEFAULT (current_timestamp AT TIME ZONE 'UTC'),
+    PRIMARY KEY (uid, rank)
+);
@@ -0,0 +1,26 @@
+-- "Frequently bought together" index, maintained by the batch job
+-- `flask recommendations copurchases` (app/models/copurchase.py).
+-- Copurchase_Counts holds the item x item co-occurrence matrix of orders
+-- (both directions, non-zero entries only), updated with the orders placed
+-- since Copurchase_Progress.last_oid; Inventory_Neighbors keeps the top-K
+-- rows of each inventory, so pages read a few rows by primary key.
+CREATE TABLE IF NOT EXISTS Copurchase_Counts (
+    invid INT NOT NULL REFERENCES Inventories(id) ON DELETE CASCADE,
+    other_invid INT NOT NULL REFERENCES Inventories(id) ON DELETE CASCADE,
+    orders INT NOT NULL,
+    PRIMARY KEY (invid, other_invid)
+);
+
+CREATE TABLE IF NOT EXISTS Inventory_Neighbors (
+    invid INT NOT NULL REFERENCES Inventories(id) ON DELETE CASCADE,
+    rank INT NOT NULL,
+    neighbor INT NOT NULL REFERENCES Inventories(id) ON DELETE CASCADE,
+    orders INT NOT NULL,
+    PRIMARY KEY (invid, rank)
+);
+
+-- Single row: the last order folded into Copurchase_Counts
+CREATE TABLE IF NOT EXISTS Copurchase_Progress (
+    id BOOLEAN NOT NULL PRIMARY KEY DEFAULT TRUE CHECK (id),
+    last_oid INT NOT NULL DEFAULT 0
+);
@@ -21,3 +21,7 @@ createdb $dbname
 psql -af create.sql $dbname
 cd $datadir
 psql -af $mybase/load.sql $dbname
+
+# Apply the versioned migrations (secondary indexes, ...) on top of create.sql
+cd $mybase/..
+flask migrate apply
@@ -0,0 +1,5 @@
+import os
+
+# app.config builds the database URI at import time; these tests never connect
+for name in ('DB_USER', 'DB_PASSWORD', 'DB_HOST', 'DB_PORT', 'DB_NAME'):
+    os.environ.setdefault(name, '')
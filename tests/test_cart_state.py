@@ -0,0 +1,185 @@
+import atexit
+from decimal import Decimal
+
+import pytest
+from flask import Flask
+
+from app.cart_state import CartState, MemoryCartStore, SqliteCartStore, new_state, put_line, drop_line
+from app.models.cart import Cart
+from app.models.checkout import Checkout, CheckoutError
+
+
+def line(invid, quantity, price, in_cart=True):
+    return {'invid': invid, 'sid': 1, 'name': f'item {invid}', 'description': '',
+            'quantity': quantity, 'price': price, 'in_cart': in_cart}
+
+
+def totals(state):
+    return state['total_items'], Decimal(state['total_price'])
+
+
+# Totals kept up to date by the line helpers
+
+def test_new_state_counts_only_in_cart_lines():
+    state = new_state([line(1, 2, Decimal('1.50')), line(2, 1, Decimal('4.00'), in_cart=False)])
+    assert totals(state) == (2, Decimal('3.00'))
+    assert state['lines']['1']['price'] == '1.50'
+
+
+def test_totals_follow_add_update_save_for_later_and_remove():
+    state = new_state([])
+    put_line(state, line(1, 1, '2.50'))
+    put_line(state, line(2, 3, '1.10'))
+    assert totals(state) == (4, Decimal('5.80'))
+
+    # Quantity update replaces the line
+    put_line(state, line(1, 2, '2.50'))
+    assert totals(state) == (5, Decimal('8.30'))
+
+    # Save for later, then move back to the cart
+    put_line(state, dict(state['lines']['2'], in_cart=False))
+    assert totals(state) == (2, Decimal('5.00'))
+    put_line(state, dict(state['lines']['2'], in_cart=True))
+    assert totals(state) == (5, Decimal('8.30'))
+
+    assert drop_line(state, 1)['quantity'] == 2
+    assert totals(state) == (3, Decimal('3.30'))
+    assert drop_line(state, 1) is None
+    put_line(state, dict(state['lines']['2'], in_cart=False))
+    assert drop_line(state, 2) is not None
+    assert totals(state) == (0, Decimal('0'))
+    assert state['lines'] == {}
+
+
+# Stores
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryCartStore({})
+    return SqliteCartStore({'CART_STATE_PATH': str(tmp_path / 'cart_state.sqlite3')})
+
+
+def bump(state):
+    state['version'] += 1
+
+
+def test_mark_clean_clears_dirty_flag_only_at_written_version(store):
+    version = store.update(1, bump, lambda: new_state([]))['version']
+    store.update(1, bump, lambda: new_state([]))
+    store.mark_clean(1, version)
+    assert store.is_dirty(1)
+    assert store.dirty() == [1]
+
+    store.mark_clean(1, version + 1)
+    assert not store.is_dirty(1)
+    assert store.dirty() == []
+
+
+def test_update_without_dirty_keeps_cart_clean(store):
+    store.update(1, lambda state: None, lambda: new_state([line(1, 1, '1.00')]), dirty=False)
+    assert not store.is_dirty(1)
+    assert store.get(1)['total_items'] == 1
+    assert store.get(2) is None
+
+
+# Checkout restoring the lines it took out of the cart state when it does not commit
+
+class SerializationFailure(Exception):
+    """Stands for the errors DB.run_in_transaction() retries."""
+
+
+class TransactionDB:
+    """Runs checkout work like DB.run_in_transaction(), failing the commits listed in commit_errors."""
+    reservation_isolation_level = None
+
+    def __init__(self, *commit_errors):
+        self.commit_errors = list(commit_errors)
+        self.attempts = 0
+
+    def run_in_transaction(self, work, max_attempts=3, isolation_level=None):
+        for attempt in range(1, max_attempts + 1):
+            self.attempts += 1
+            result = work()
+            error = self.commit_errors.pop(0) if self.commit_errors else None
+            if error is None:
+                return result
+            if not isinstance(error, SerializationFailure) or attempt == max_attempts:
+                raise error
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(CART_STATE_BACKEND='memory', CART_STATE_PATH=None, CART_WRITE_BEHIND_SECONDS=3600,
+                      CART_STATE_IDLE_SECONDS=3600, DB_MAX_TRANSACTION_ATTEMPTS=3)
+    cart_state = CartState(app)
+    atexit.unregister(cart_state.flush_all)
+    with app.app_context():
+        cart_state.update(1, lambda cart: None,
+                          lambda: new_state([line(1, 2, '3.00'), line(2, 1, '5.00'), line(3, 1, '7.00', in_cart=False)]))
+        yield app
+
+
+@pytest.fixture
+def checkout(app, monkeypatch):
+    """Checkout of cart 1 buying inventories 1 and 2, with the SQL statements left out."""
+    written_back = []
+    monkeypatch.setattr(Cart, 'write_back', staticmethod(lambda cid: written_back.append(cid)))
+    monkeypatch.setattr(Checkout, '_process', staticmethod(lambda uid, cid: (10, [1, 2])))
+    return written_back
+
+
+def cart(app):
+    return app.extensions['cart_state'].store.get(1)
+
+
+def test_checkout_takes_purchased_lines_out_of_cart_state(app, checkout):
+    app.db = TransactionDB()
+    assert Checkout.process(1, 1) == 10
+    assert checkout == [1]
+    assert set(cart(app)['lines']) == {'3'}
+    assert totals(cart(app)) == (0, Decimal('0'))
+
+
+def test_failed_checkout_restores_removed_lines(app, checkout):
+    app.db = TransactionDB(RuntimeError('commit failed'))
+    with pytest.raises(RuntimeError):
+        Checkout.process(1, 1)
+    assert set(cart(app)['lines']) == {'1', '2', '3'}
+    assert totals(cart(app)) == (3, Decimal('11.00'))
+
+
+def test_retried_checkout_removes_lines_once(app, checkout):
+    app.db = TransactionDB(SerializationFailure(), SerializationFailure())
+    assert Checkout.process(1, 1) == 10
+    assert app.db.attempts == 3
+    assert set(cart(app)['lines']) == {'3'}
+    assert totals(cart(app)) == (0, Decimal('0'))
+
+
+def test_checkout_exhausting_retries_restores_removed_lines(app, checkout):
+    app.db = TransactionDB(SerializationFailure(), SerializationFailure(), SerializationFailure())
+    with pytest.raises(SerializationFailure):
+        Checkout.process(1, 1)
+    assert set(cart(app)['lines']) == {'1', '2', '3'}
+    assert totals(cart(app)) == (3, Decimal('11.00'))
+
+
+def test_rejected_checkout_leaves_cart_state_untouched(app, checkout, monkeypatch):
+    def reject(uid, cid):
+        raise CheckoutError('insufficient_balance', "Not enough balance.")
+    monkeypatch.setattr(Checkout, '_process', staticmethod(reject))
+    app.db = TransactionDB()
+    with pytest.raises(CheckoutError):
+        Checkout.process(1, 1)
+    assert totals(cart(app)) == (3, Decimal('11.00'))
+
+
+def test_restore_keeps_line_added_after_checkout(app):
+    removed = Cart.remove_checked_out(1, [1, 3])
+    assert [line['invid'] for line in removed] == [1]
+    app.extensions['cart_state'].update(1, lambda cart: put_line(cart, line(1, 1, '3.00')), lambda: None)
+    Cart.restore_lines(1, removed)
+    assert cart(app)['lines']['1']['quantity'] == 1
+    assert totals(cart(app)) == (2, Decimal('8.00'))